@@ -90,7 +90,7 @@ class WebConfig:
                    'fileSimulatedDatasetsFastas', 'fileTableOfPosteriorRatesTsv', 'fileTableOfPearsonCorrelationTsv',
                    'fileTableOfNodesTsv', 'fileProbabilityPerPosPerBranchesTsv', 'fileTableOfBranchesTsv',
                    'fileLogLikelihoodTsv', 'fileTableOfAttributesTsv', 'filePhylogeneticTreeNwk', 'rootingMethod',
-                   'leaf'),
+                   'leaf', 'queryPositions'),
                   ('categories_quantity', 'alpha', 'pi_1', 'coefficient_bl', 'probability_lg', 'number_lg',
                    'number_datasets', 'e_mail', 'is_optimize_pi', 'is_optimize_pi_average', 'is_optimize_bl',
                    'is_optimize_alpha', 'is_do_not_use_copap', 'file_interactive_tree_html',
@@ -98,11 +98,11 @@ class WebConfig:
                    'file_table_of_posterior_rates_tsv', 'file_table_of_pearson_correlation_tsv',
                    'file_table_of_nodes_tsv', 'file_probability_per_pos_per_branches_tsv', 'file_table_of_branches_tsv',
                    'file_log_likelihood_tsv', 'file_table_of_attributes_tsv', 'file_phylogenetic_tree_nwk',
-                   'rooting_method', 'leaf'),
+                   'rooting_method', 'leaf', 'query_positions'),
                   ((int, ), (float, ), (float, ), (float, ), (float, ), (int, ), (int, ), (str, ), (int, bool),
                    (int, bool), (int, bool), (int, bool), (int, bool), (int, bool), (int, bool), (int, bool),
                    (int, bool), (int, bool), (int, bool), (int, bool), (int, bool), (int, bool), (int, bool),
-                   (int, bool), (int, bool), (str, ), (str, )))
+                   (int, bool), (int, bool), (str, ), (str, ), (str, )))
         for in_key, out_key, current_types in dct:
             current_value = arguments.get(in_key)
             if current_value is not None:
@@ -147,7 +147,8 @@ class WebConfig:
                              f'\n\tnewick_text: {self.CALCULATED_ARGS.newick_text}'
                              f'\n\tmsa: {self.CALCULATED_ARGS.msa}'
                              f'\n\trooting_method: {self.CURRENT_ARGS.rooting_method}'
-                             f'\n\tleaf: {self.CURRENT_ARGS.leaf}\n')
+                             f'\n\tleaf: {self.CURRENT_ARGS.leaf}'
+                             f'\n\tquery_positions: {self.CURRENT_ARGS.query_positions}\n')
 
     def texts_filling(self) -> None:
         with open(self.TREE_FILE, 'r') as f:
@@ -171,7 +172,9 @@ class WebConfig:
             e_mail = f'--e_mail {self.CURRENT_ARGS.e_mail} '
         else:
             e_mail = ''
-        leaf = f'--leaf {self.CURRENT_ARGS.leaf}' if self.CURRENT_ARGS.leaf else ''
+        leaf = f'--leaf {self.CURRENT_ARGS.leaf} ' if self.CURRENT_ARGS.leaf else ''
+        query_positions = ','.join(self.CURRENT_ARGS.query_positions.replace(',', ' ').split())
+        query_positions = f'--query_positions {query_positions}' if query_positions else ''
         self.COMMAND_LINE = (
             f'python -m gloome '
             f'--msa_file {self.MSA_FILE} '
@@ -205,7 +208,8 @@ class WebConfig:
             f'--file_table_of_attributes_tsv {int(self.CURRENT_ARGS.file_table_of_attributes_tsv)} '
             f'--file_phylogenetic_tree_nwk {int(self.CURRENT_ARGS.file_phylogenetic_tree_nwk)} '
             f'--rooting_method {self.CURRENT_ARGS.rooting_method} '
-            f'{leaf}')
+            f'{leaf}'
+            f'{query_positions}')
         self.JOB_LOGGER.info(f'\n\tcreate a command line: '
                              f'\n\tCOMMAND_LINE: {self.COMMAND_LINE}\n')
 
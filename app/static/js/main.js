@@ -15,6 +15,7 @@ let objectsDependence = {
     'probabilityLG': {'dependence': ['isDoNotUseCoPAP'], 'value': ''},
     'numberLG': {'dependence': ['isDoNotUseCoPAP'], 'value': ''},
     'numberDatasets': {'dependence': ['isDoNotUseCoPAP'], 'value': ''},
+    'queryPositions': {'dependence': ['isDoNotUseCoPAP'], 'value': ''},
     'eMail': {'dependence': '', 'value': ''},
     'isOptimizePi': {'dependence': '', 'value': ''},
     'isOptimizePiAverage': {'dependence': '', 'value': ''},
@@ -539,6 +540,7 @@ function makeTree(mode = 0) {
     const filePhylogeneticTreeNwk = document.getElementById(`filePhylogeneticTreeNwk`)
     const rootingMethod = document.getElementById(`rootingMethod`);
     const leaf = document.getElementById(`leaf`);
+    const queryPositions = document.getElementById(`queryPositions`);
     const formData = new FormData();
     formData.append(`newickText`, newickText.value.trim());
     formData.append(`msaText`, msaText.value.trim());
@@ -569,6 +571,7 @@ function makeTree(mode = 0) {
     formData.append(`filePhylogeneticTreeNwk`, +filePhylogeneticTreeNwk.checked);
     formData.append(`rootingMethod`, rootingMethod.value.trim());
     formData.append(`leaf`, leaf.value.trim());
+    formData.append(`queryPositions`, queryPositions.value.trim());
 
     jsonTreeData = null
 
@@ -637,7 +640,8 @@ function gedIdentifiers(id = ``) {
             `isDoNotUseCoPAP`, `fileInteractiveTreeHtml`, `fileNewickTreePng`, `fileTableOfCoevolutionTsv`,
             `fileSimulatedDatasetsFastas`, `fileTableOfPosteriorRatesTsv`, `fileTableOfPearsonCorrelationTsv`,
             `fileTableOfNodesTsv`, `fileProbabilityPerPosPerBranchesTsv`, `fileTableOfBranchesTsv`,
-            `fileLogLikelihoodTsv`, `fileTableOfAttributesTsv`, 'filePhylogeneticTreeNwk', 'rootingMethod', 'leaf'];
+            `fileLogLikelihoodTsv`, `fileTableOfAttributesTsv`, 'filePhylogeneticTreeNwk', 'rootingMethod', 'leaf',
+            `queryPositions`];
     }
 }
 
@@ -705,7 +709,7 @@ function onChangingRootingMethod(delLeaf = true) {
 
 function onChangingCheckbox(id, value) {
     let element = document.getElementById(id);
-    let checkboxesAccessibilityGroups = {'pi1': ['isOptimizePi', 'isOptimizePiAverage'], 'alpha': ['isOptimizeAlpha'], 'coefficientBL': ['isOptimizeBL'], 'probabilityLG': ['isDoNotUseCoPAP'], 'numberLG': ['isDoNotUseCoPAP'], 'numberDatasets': ['isDoNotUseCoPAP']};
+    let checkboxesAccessibilityGroups = {'pi1': ['isOptimizePi', 'isOptimizePiAverage'], 'alpha': ['isOptimizeAlpha'], 'coefficientBL': ['isOptimizeBL'], 'probabilityLG': ['isDoNotUseCoPAP'], 'numberLG': ['isDoNotUseCoPAP'], 'numberDatasets': ['isDoNotUseCoPAP'], 'queryPositions': ['isDoNotUseCoPAP']};
     let checkboxesDisplayGroups = {'blockFileTableOfPosteriorRatesTsv': ['isDoNotUseCoPAP'], 'blockFileTableOfPearsonCorrelationTsv': ['isDoNotUseCoPAP'], 'blockFileSimulatedDatasetsFastas': ['isDoNotUseCoPAP'], 'blockFileTableOfCoevolutionTsv': ['isDoNotUseCoPAP']};
     if (checkboxes.includes(id)) {
         Object.entries(checkboxesAccessibilityGroups).forEach(([key, valueList]) => {
@@ -758,7 +762,7 @@ function showMessage(message = null, variant = 1) {
 }
 
 function formCleaning(args) {
-    let elementNames = {'value': [`newickText`, `msaText`, `leaf`, `eMail`],
+    let elementNames = {'value': [`newickText`, `msaText`, `leaf`, `eMail`, `queryPositions`],
         'innerHTML': [`tree`, 'branchInfo', `nodeInfo`, `logLikelihood`, `fileList`, `leaves`]};
     for (let i = 0; i < elementNames.value.length; i++) {
         document.getElementById(elementNames.value[i]).value = ``;
@@ -129,6 +129,7 @@ class Config:
                      'eMail': self.CURRENT_ARGS.e_mail,
                      'rootingMethod': self.CURRENT_ARGS.rooting_method,
                      'leaf': self.CURRENT_ARGS.leaf,
+                     'queryPositions': self.CURRENT_ARGS.query_positions,
                      'rootingMethods': ROOTING_METHODS,
                      'leaves': (self.CALCULATED_ARGS.newick_tree.get_leaves(only_node_list=False)
                                 if self.CURRENT_ARGS.rooting_method == 'outgroup' else [])}
@@ -221,7 +222,8 @@ class Config:
                                         self.CURRENT_ARGS.file_table_of_attributes_tsv,
                                         self.CURRENT_ARGS.file_phylogenetic_tree_nwk,
                                         self.CURRENT_ARGS.rooting_method,
-                                        self.CURRENT_ARGS.leaf))
+                                        self.CURRENT_ARGS.leaf,
+                                        self.CURRENT_ARGS.query_positions))
 
         if not self.CALCULATED_ARGS.err_list and self.VALIDATION_ACTIONS.get('set_root', False):
             try:
@@ -246,7 +248,23 @@ class Config:
                                            is_optimize_pi=self.CURRENT_ARGS.is_optimize_pi,
                                            is_optimize_pi_average=self.CURRENT_ARGS.is_optimize_pi_average,
                                            is_optimize_alpha=self.CURRENT_ARGS.is_optimize_alpha,
-                                           is_optimize_bl=self.CURRENT_ARGS.is_optimize_bl)
+                                           is_optimize_bl=self.CURRENT_ARGS.is_optimize_bl,
+                                           is_optimize_branch_lengths=self.CURRENT_ARGS.is_optimize_branch_lengths,
+                                           is_streaming_marginal=self.CURRENT_ARGS.is_streaming_marginal,
+                                           is_float32_probability=self.CURRENT_ARGS.is_float32_probability,
+                                           site_block_size=self.CURRENT_ARGS.site_block_size,
+                                           threads=self.CURRENT_ARGS.threads,
+                                           processes=self.CURRENT_ARGS.processes,
+                                           is_sequential_simulation=self.CURRENT_ARGS.is_sequential_simulation,
+                                           false_discovery_rate=self.CURRENT_ARGS.false_discovery_rate,
+                                           correlation_threshold=self.CURRENT_ARGS.correlation_threshold,
+                                           is_float32_correlation=self.CURRENT_ARGS.is_float32_correlation,
+                                           is_approximate_correlation=self.CURRENT_ARGS.is_approximate_correlation,
+                                           query_positions=self.CURRENT_ARGS.query_positions,
+                                           screen_threshold=self.CURRENT_ARGS.screen_threshold,
+                                           seed=self.CURRENT_ARGS.seed,
+                                           optimization_ftol=self.CURRENT_ARGS.optimization_ftol,
+                                           optimization_gtol=self.CURRENT_ARGS.optimization_gtol)
             except ValueError:
                 self.CALCULATED_ARGS.err_list.append((f'MSA error',
                                                       f'Wrong MSA format. Please provide MSA in FASTA format.'))
@@ -370,6 +388,10 @@ class Config:
                             f'Default is "{self.CURRENT_ARGS.rooting_method}"')
         parser.add_argument('--leaf', dest='leaf', type=str, required=False, default=self.CURRENT_ARGS.leaf,
                             help=f'Specify leaf for outgroup rooting (optional). Default is "{self.CURRENT_ARGS.leaf}"')
+        parser.add_argument('--query_positions', dest='query_positions', type=str, required=False,
+                            default=self.CURRENT_ARGS.query_positions,
+                            help=f'Specify comma separated positions to correlate with all the others (optional). '
+                            f'Default is "{self.CURRENT_ARGS.query_positions}"')
         parser.add_argument('--is_optimize_pi', dest='is_optimize_pi', type=int, required=False,
                             help=f'Specify is_optimize_pi (optional). Default is '
                             f'{int(self.CURRENT_ARGS.is_optimize_pi)}.', default=int(self.CURRENT_ARGS.is_optimize_pi))
@@ -384,6 +406,63 @@ class Config:
         parser.add_argument('--is_optimize_bl', dest='is_optimize_bl', type=int, required=False,
                             help=f'Specify is_optimize_bl (optional). Default is '
                             f'{int(self.CURRENT_ARGS.is_optimize_bl)}.', default=int(self.CURRENT_ARGS.is_optimize_bl))
+        parser.add_argument('--is_optimize_branch_lengths', dest='is_optimize_branch_lengths', type=int,
+                            required=False, help=f'Specify is_optimize_branch_lengths (optional). Default is '
+                            f'{int(self.CURRENT_ARGS.is_optimize_branch_lengths)}.',
+                            default=int(self.CURRENT_ARGS.is_optimize_branch_lengths))
+        parser.add_argument('--is_streaming_marginal', dest='is_streaming_marginal', type=int, required=False,
+                            help=f'Specify is_streaming_marginal (optional). Default is '
+                            f'{int(self.CURRENT_ARGS.is_streaming_marginal)}.',
+                            default=int(self.CURRENT_ARGS.is_streaming_marginal))
+        parser.add_argument('--is_float32_probability', dest='is_float32_probability', type=int, required=False,
+                            help=f'Specify is_float32_probability (optional). Default is '
+                            f'{int(self.CURRENT_ARGS.is_float32_probability)}.',
+                            default=int(self.CURRENT_ARGS.is_float32_probability))
+        parser.add_argument('--site_block_size', dest='site_block_size', type=int, required=False,
+                            help=f'Specify site_block_size (a multiple of 32), 0 to choose it from the available '
+                            f'memory (optional). Default is {self.CURRENT_ARGS.site_block_size}.',
+                            default=self.CURRENT_ARGS.site_block_size)
+        parser.add_argument('--threads', dest='threads', type=int, required=False,
+                            help=f'Specify the number of threads evaluating site blocks in parallel (optional). '
+                            f'Default is {self.CURRENT_ARGS.threads}.', default=self.CURRENT_ARGS.threads)
+        parser.add_argument('--processes', dest='processes', type=int, required=False,
+                            help=f'Specify the number of processes simulating datasets in parallel (optional). '
+                            f'Default is {self.CURRENT_ARGS.processes}.', default=self.CURRENT_ARGS.processes)
+        parser.add_argument('--is_sequential_simulation', dest='is_sequential_simulation', type=int, required=False,
+                            help=f'Specify is_sequential_simulation (optional). Default is '
+                            f'{int(self.CURRENT_ARGS.is_sequential_simulation)}.',
+                            default=int(self.CURRENT_ARGS.is_sequential_simulation))
+        parser.add_argument('--false_discovery_rate', dest='false_discovery_rate', type=float, required=False,
+                            help=f'Specify the false discovery rate of the coevolution calls (optional). Default is '
+                            f'{self.CURRENT_ARGS.false_discovery_rate}.',
+                            default=self.CURRENT_ARGS.false_discovery_rate)
+        parser.add_argument('--correlation_threshold', dest='correlation_threshold', type=float, required=False,
+                            help=f'Specify the minimal absolute correlation of the reported pairs of sites (optional). '
+                            f'Default is {self.CURRENT_ARGS.correlation_threshold}.',
+                            default=self.CURRENT_ARGS.correlation_threshold)
+        parser.add_argument('--is_float32_correlation', dest='is_float32_correlation', type=int, required=False,
+                            help=f'Specify is_float32_correlation (optional). Default is '
+                            f'{int(self.CURRENT_ARGS.is_float32_correlation)}.',
+                            default=int(self.CURRENT_ARGS.is_float32_correlation))
+        parser.add_argument('--is_approximate_correlation', dest='is_approximate_correlation', type=int,
+                            required=False, help=f'Specify is_approximate_correlation (optional). Default is '
+                            f'{int(self.CURRENT_ARGS.is_approximate_correlation)}.',
+                            default=int(self.CURRENT_ARGS.is_approximate_correlation))
+        parser.add_argument('--screen_threshold', dest='screen_threshold', type=float, required=False,
+                            help=f'Specify the minimal absolute phi coefficient of the branch events of the correlated '
+                            f'pairs of sites (optional). Default is {self.CURRENT_ARGS.screen_threshold}.',
+                            default=self.CURRENT_ARGS.screen_threshold)
+        parser.add_argument('--seed', dest='seed', type=int, required=False,
+                            help=f'Specify the seed of the random number generators (optional). Default is '
+                            f'{self.CURRENT_ARGS.seed}.', default=self.CURRENT_ARGS.seed)
+        parser.add_argument('--optimization_ftol', dest='optimization_ftol', type=float, required=False,
+                            help=f'Specify the relative log-likelihood tolerance of the parameter optimization '
+                            f'(optional). Default is {self.CURRENT_ARGS.optimization_ftol}.',
+                            default=self.CURRENT_ARGS.optimization_ftol)
+        parser.add_argument('--optimization_gtol', dest='optimization_gtol', type=float, required=False,
+                            help=f'Specify the projected gradient tolerance of the parameter optimization '
+                            f'(optional). Default is {self.CURRENT_ARGS.optimization_gtol}.',
+                            default=self.CURRENT_ARGS.optimization_gtol)
         parser.add_argument('--is_do_not_use_copap', dest='is_do_not_use_copap', type=int, required=False,
                             help=f'Specify is_do_not_use_copap (optional). Default is '
                             f'{int(self.CURRENT_ARGS.is_do_not_use_copap)}.',
@@ -458,6 +537,12 @@ class Config:
                                   'is_optimize_pi_average',
                                   'is_optimize_alpha',
                                   'is_optimize_bl',
+                                  'is_optimize_branch_lengths',
+                                  'is_streaming_marginal',
+                                  'is_float32_probability',
+                                  'is_sequential_simulation',
+                                  'is_float32_correlation',
+                                  'is_approximate_correlation',
                                   'is_do_not_use_copap',
                                   'file_interactive_tree_html',
                                   'file_newick_tree_png',
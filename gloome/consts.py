@@ -161,6 +161,7 @@ DEFAULT_FORM_ARGUMENTS = {
     'rooting_methods': ROOTING_METHODS,
     'leaf': '',
     'leaves': [],
+    'query_positions': '',
     'is_optimize_pi': True,
     'is_optimize_pi_average': False,
     'is_optimize_alpha': True,
@@ -182,6 +183,21 @@ DEFAULT_FORM_ARGUMENTS = {
 
 DEFAULT_ARGUMENTS = DefaultArgs(**{
     'with_internal_nodes': True,
+    'is_optimize_branch_lengths': True,
+    'is_streaming_marginal': False,
+    'is_float32_probability': False,
+    'site_block_size': 0,
+    'threads': 1,
+    'processes': 1,
+    'is_sequential_simulation': False,
+    'false_discovery_rate': 0.05,
+    'correlation_threshold': 0.0,
+    'is_float32_correlation': False,
+    'is_approximate_correlation': False,
+    'screen_threshold': 0.0,
+    'seed': None,
+    'optimization_ftol': 1e-10,
+    'optimization_gtol': 1e-6,
     'sep': '\t'
     })
 
@@ -266,6 +282,36 @@ USAGE = '''\tRequired parameters:
 \t\t\tSpecify is_optimize_alpha. Default is 1.
 \t\t--is_optimize_bl <type=int> 
 \t\t\tSpecify is_optimize_bl. Default is 1.
+\t\t--is_optimize_branch_lengths <type=int> 
+\t\t\tAlso fit every branch length individually (with is_optimize_bl). Default is 1.
+\t\t--is_streaming_marginal <type=int> 
+\t\t\tDo not keep the full marginal tensors, only the exported probabilities (saves memory). Default is 0.
+\t\t--is_float32_probability <type=int> 
+\t\t\tStore the node and branch probabilities as float32. Default is 0.
+\t\t--site_block_size <type=int> 
+\t\t\tNumber of site patterns evaluated at once (a multiple of 32), 0 to fit the available memory. Default is 0.
+\t\t--threads <type=int> 
+\t\t\tNumber of threads evaluating site blocks in parallel. Default is 1.
+\t\t--processes <type=int> 
+\t\t\tNumber of processes simulating datasets in parallel. Default is 1.
+\t\t--is_sequential_simulation <type=int> 
+\t\t\tStop simulating datasets once the coevolution calls are resolved (at most number_datasets). Default is 0.
+\t\t--false_discovery_rate <type=float> 
+\t\t\tFalse discovery rate of the coevolution calls of the sequential simulation. Default is 0.05.
+\t\t--correlation_threshold <type=float> 
+\t\t\tReport only the pairs of sites with an absolute correlation of at least this value. Default is 0.0.
+\t\t--is_float32_correlation <type=int> 
+\t\t\tCompute the correlations between sites in float32. Default is 0.
+\t\t--is_approximate_correlation <type=int> 
+\t\t\tSearch the pairs of sites above correlation_threshold with random projections (approximate). Default is 0.
+\t\t--screen_threshold <type=float> 
+\t\t\tCorrelate only the pairs of sites whose branch events reach this absolute phi coefficient. Default is 0.0.
+\t\t--seed <type=int> 
+\t\t\tSeed of the random number generators (the same seed gives the same simulated datasets). Default is None.
+\t\t--optimization_ftol <type=float> 
+\t\t\tRelative tolerance on the log-likelihood of the parameter optimization. Default is 1e-10.
+\t\t--optimization_gtol <type=float> 
+\t\t\tTolerance on the projected gradient of the parameter optimization. Default is 1e-06.
 \t\t--file_interactive_tree_html <type=int> 
 \t\t\tSpecify file_interactive_tree_html. Default is 0.
 \t\t--file_newick_tree_png <type=int> 
@@ -299,6 +345,8 @@ USAGE = '''\tRequired parameters:
 \t\t\tDefault is 'midpoint'.
 \t\t--leaf <type=str> 
 \t\t\tSpecify leaf for outgroup rooting. Default is ''.
+\t\t--query_positions <type=str> 
+\t\t\tComma separated positions (0-based) correlated with all the other positions only. Default is ''.
 \t\t--e_mail <type=str> 
 \t\t\tSpecify e_mail (technical parameter, do not change).'''
 
@@ -303,6 +303,7 @@ def check_data(*args) -> List[Tuple[str, str]]:
     file_phylogenetic_tree_nwk = bool(args[26])
     rooting_method = args[27].strip()
     leaf = args[28].strip()
+    query_positions = str(args[29]).strip()
 
     if not isinstance(categories_quantity, int) or not 1 <= categories_quantity <= 16:
         err_list.append((f'Number of rate categories value error [ {categories_quantity} ]',
@@ -408,6 +409,10 @@ def check_data(*args) -> List[Tuple[str, str]]:
     if (not isinstance(leaf, str) or not leaf) and rooting_method == 'outgroup':
         err_list.append((f'Leaf value error [ {leaf} ]', f'The value must be a non-empty string.'))
 
+    if query_positions and not re.fullmatch(r'\d+([\s,]+\d+)*', query_positions):
+        err_list.append((f'Query positions value error [ {query_positions} ]',
+                         f'The value must be a comma separated list of positions.'))
+
     if not msa:
         err_list.append(('MSA error', 'No MSA was provided.'))
     elif not msa.startswith('>'):
@@ -427,6 +432,10 @@ def check_data(*args) -> List[Tuple[str, str]]:
 
         if min(len_list) != max(len_list):
             err_list.append((f'MSA error', f'The MSA contains sequences of different lengths.'))
+        if (query_positions and re.fullmatch(r'\d+([\s,]+\d+)*', query_positions) and
+                max(map(int, re.split(r'[\s,]+', query_positions))) >= min(len_list)):
+            err_list.append((f'Query positions value error [ {query_positions} ]',
+                             f'The positions must be between 0 and {min(len_list) - 1}.'))
         if incorrect_characters:
             err_list.append(('MSA error',
                              f'MSA file contains an illegal character(s) [ {incorrect_characters.strip()} ]. '
@@ -0,0 +1,1139 @@
+import os
+import numpy as np
+
+from copy import copy
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, List, Tuple, Union, Dict
+
+from .node import Node
+
+eps = 5e-324
+marginal_block_size = 2 ** 24
+expectation_block_size = 32
+available_memory_fraction = 0.5
+default_available_memory = 2 ** 32
+marginal_attributes = ('marginal_vector', 'marginal_bl_vector', 'probability_vector', 'branch_probability_vector',
+                       'probability_vector_loss', 'probability_vector_gain', 'probabilities_sequence_characters')
+scale_names = {'up_vector': ('up_scale', ),
+               'down_vector': ('down_scale', ),
+               'marginal_vector': ('up_scale', 'down_scale'),
+               'marginal_bl_vector': ('up_scale', 'down_scale')}
+
+
+class CompiledTree:
+    nodes: List[Node]
+    index: Dict[int, int]
+    nodes_length: int
+    parent: np.ndarray
+    depth: np.ndarray
+    rank: np.ndarray
+    children_index: np.ndarray
+    is_leaf: np.ndarray
+    parent_position: np.ndarray
+    levels: List[Tuple[np.ndarray, np.ndarray, List[slice], np.ndarray]]
+    pre_order: np.ndarray
+    post_order: np.ndarray
+    leaves: np.ndarray
+    internal: np.ndarray
+    branch_length: np.ndarray
+    distance_to_root: np.ndarray
+    distance_to_nearest: np.ndarray
+    levels_to_nearest: np.ndarray
+    frequency: Optional[np.ndarray]
+    pattern_index: Optional[np.ndarray]
+    pattern_weights: Optional[np.ndarray]
+    pmatrix: Optional[np.ndarray]
+    up_vector: Optional[np.ndarray]
+    down_vector: Optional[np.ndarray]
+    contribution: Optional[np.ndarray]
+    up_scale: Optional[np.ndarray]
+    down_scale: Optional[np.ndarray]
+    marginal_vector: Optional[np.ndarray]
+    marginal_bl_vector: Optional[np.ndarray]
+    leaf_vector: Optional[np.ndarray]
+    block_length: int
+    threads: int
+    likelihood_vector: Optional[np.ndarray]
+    rate_likelihood_vector: Optional[np.ndarray]
+    branch_expectation: Optional[np.ndarray]
+    dirty: np.ndarray
+    down_valid: np.ndarray
+    is_resident: bool
+    root_expectation: Optional[np.ndarray]
+    log_likelihood_vector: Optional[np.ndarray]
+    probability_vector: Optional[np.ndarray]
+    branch_probability_vector: Optional[np.ndarray]
+    probabilities_sequence_characters: Optional[np.ndarray]
+    sequence_indices: Optional[np.ndarray]
+    node_vectors: Dict[str, Optional[np.ndarray]]
+    is_likelihood_node: np.ndarray
+
+    def __init__(self, nodes: List[Node]) -> None:
+        """
+        Array-backed representation of a tree topology.
+
+        All partial likelihoods are kept in contiguous tensors of shape (nodes, rates, states, patterns) and the
+        up/down/marginal passes are evaluated level by level with batched numpy operations. Node attributes are
+        views into these tensors.
+
+        To avoid underflow on large trees the up and down vectors of every node are rescaled by a power of two per
+        pattern (shared by all rates and states). The accumulated base-2 exponents are kept in `up_scale` and
+        `down_scale` (shape (nodes, patterns)), so the true up vector of node `n` is
+        `up_vector[n] * 2 ** up_scale[n]`. Log-likelihoods are computed in log space from the scaled tensors;
+        marginal and branch probabilities are ratios, so the scaling cancels out. The exported node information
+        unscales the vectors (`get_node_unscaled_vector`).
+
+        The tensors are attached to the nodes by reference in `node_vectors` and `Node` slices them only when one
+        of its array attributes is read (`get_node_attribute`), so no per-node views are kept.
+
+        Args:
+            nodes (List[Node]): All nodes of the tree in pre-order (the root first).
+        """
+        self.nodes = list(nodes)
+        self.nodes_length = len(self.nodes)
+        self.index = index = {id(current_node): i for i, current_node in enumerate(self.nodes)}
+        for i, current_node in enumerate(self.nodes):
+            current_node.index = i
+
+        self.parent = np.full(self.nodes_length, -1, dtype=np.int64)
+        self.depth = np.zeros(self.nodes_length, dtype=np.int64)
+        self.rank = np.zeros(self.nodes_length, dtype=np.int64)
+        max_degree = max([len(current_node.children) for current_node in self.nodes] + [1])
+        self.children_index = np.full((self.nodes_length, max_degree), -1, dtype=np.int64)
+
+        for i, current_node in enumerate(self.nodes):
+            for j, child in enumerate(current_node.children):
+                child_index = index[id(child)]
+                self.parent[child_index] = i
+                self.depth[child_index] = self.depth[i] + 1
+                self.rank[child_index] = j
+                self.children_index[i, j] = child_index
+
+        self.pre_order = np.arange(self.nodes_length)
+        self.post_order = self.get_post_order()
+        self.is_leaf = self.children_index[:, 0] < 0
+        is_leaf = self.is_leaf
+        self.leaves = np.where(is_leaf)[0]
+        self.internal = np.where(~is_leaf)[0]
+
+        self.levels = []
+        self.parent_position = np.zeros(self.nodes_length, dtype=np.int64)
+        for current_depth in range(1, int(self.depth.max()) + 1):
+            level_nodes = np.where(self.depth == current_depth)[0]
+            level_nodes = level_nodes[np.argsort(self.rank[level_nodes], kind='stable')]
+            bounds = np.searchsorted(self.rank[level_nodes], np.arange(max_degree + 1))
+            rank_slices = [slice(bounds[j], bounds[j + 1]) for j in range(max_degree) if bounds[j] < bounds[j + 1]]
+            level_fathers = self.parent[level_nodes[rank_slices[0]]]
+            self.parent_position[level_nodes] = np.searchsorted(level_fathers, self.parent[level_nodes])
+            self.levels.append((level_nodes, self.parent[level_nodes], rank_slices,
+                                level_nodes[~is_leaf[level_nodes]]))
+
+        self.branch_length = np.zeros(self.nodes_length, dtype=np.float64)
+        self.distance_to_root = np.zeros(self.nodes_length, dtype=np.float64)
+        self.distance_to_nearest = np.zeros(self.nodes_length, dtype=np.float64)
+        self.levels_to_nearest = np.zeros(self.nodes_length, dtype=np.int64)
+        self.frequency = self.pattern_index = self.pattern_weights = self.pmatrix = None
+        self.up_vector = self.down_vector = self.contribution = self.marginal_vector = self.marginal_bl_vector = None
+        self.up_scale = self.down_scale = None
+        self.leaf_vector = self.likelihood_vector = self.rate_likelihood_vector = self.log_likelihood_vector = None
+        self.branch_expectation = self.root_expectation = None
+        self.dirty = np.zeros(self.nodes_length, dtype=bool)
+        self.down_valid = np.zeros(self.nodes_length, dtype=bool)
+        self.is_resident = False
+        self.block_length = self.threads = 1
+        self.probability_vector = self.branch_probability_vector = None
+        self.probabilities_sequence_characters = self.sequence_indices = None
+        self.node_vectors = {}
+        self.is_likelihood_node = np.zeros(self.nodes_length, dtype=bool)
+
+    def get_post_order(self) -> np.ndarray:
+        post_order, stack = [], [(0, False)]
+        while stack:
+            i, is_visited = stack.pop()
+            if is_visited:
+                post_order.append(i)
+            else:
+                stack.append((i, True))
+                stack.extend((child, False) for child in self.children_index[i][::-1] if child >= 0)
+
+        return np.asarray(post_order, dtype=np.int64)
+
+    def set_patterns(self, pattern_index: Optional[np.ndarray], pattern_weights: Optional[np.ndarray]) -> None:
+        self.pattern_index = pattern_index
+        self.pattern_weights = pattern_weights
+
+    def expand_patterns(self, vector: Optional[np.ndarray], axis: int = -1) -> Optional[np.ndarray]:
+
+        return vector if vector is None or self.pattern_index is None else np.take(vector, self.pattern_index, axis)
+
+    def set_pmatrix(self, pmatrix: np.ndarray) -> None:
+        self.pmatrix = np.ascontiguousarray(pmatrix, dtype=np.float64)
+        self.is_resident = False
+        self.node_vectors['pmatrix'] = self.pmatrix
+
+    def get_pmatrix(self, pi_1: Union[float, np.float64], coefficient_bl: Union[float, np.float64],
+                    rate_vector: np.ndarray, branch_length: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Transition matrices of the two-state gain/loss model for every branch and rate category.
+
+        Uses the closed form of expm(Q * t) for Q = [[-a, a], [b, -b]], a = 1 / (2 * (1 - pi_1)),
+        b = 1 / (2 * pi_1): P(t) = (1 / mu) * [[b + a * e, a - a * e], [b - b * e, a + b * e]], mu = a + b,
+        e = exp(-mu * t).
+
+        Args:
+            pi_1 (Union[float, np.float64]): Stationary frequency of state 1.
+            coefficient_bl (Union[float, np.float64]): Branch length coefficient.
+            rate_vector (np.ndarray): Rate categories.
+            branch_length (np.ndarray, optional): Branch lengths, `branch_length` of all nodes by default.
+
+        Returns:
+            np.ndarray: Transition matrices of shape (nodes, rates, 2, 2).
+        """
+        branch_length = self.branch_length if branch_length is None else np.asarray(branch_length, dtype=np.float64)
+        a = 1.0 / (2 * (1 - pi_1))
+        b = 1.0 / (2 * pi_1)
+        mu = a + b
+        t = branch_length[:, np.newaxis] * (coefficient_bl * np.asarray(rate_vector, dtype=np.float64))
+        e = np.exp(-mu * t)
+
+        pmatrix = np.empty(t.shape + (2, 2), dtype=np.float64)
+        pmatrix[..., 0, 0] = (b + a * e) / mu
+        pmatrix[..., 0, 1] = a * (1 - e) / mu
+        pmatrix[..., 1, 0] = b * (1 - e) / mu
+        pmatrix[..., 1, 1] = (a + b * e) / mu
+
+        return pmatrix
+
+    def get_pmatrix_derivatives(self, pi_1: Union[float, np.float64], coefficient_bl: Union[float, np.float64],
+                                rate_vector: np.ndarray, rate_vector_derivative: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        Derivatives of the two-state transition matrices with respect to the model parameters.
+
+        With mu = 1 / (2 * pi_1 * (1 - pi_1)) and e = exp(-mu * t) the matrices are
+        P(t) = [[1 - pi_1 + pi_1 * e, pi_1 * (1 - e)], [(1 - pi_1) * (1 - e), pi_1 + (1 - pi_1) * e]] and
+        t = branch length * coefficient_bl * rate.
+
+        Args:
+            pi_1 (Union[float, np.float64]): Stationary frequency of state 1.
+            coefficient_bl (Union[float, np.float64]): Branch length coefficient.
+            rate_vector (np.ndarray): Rate categories.
+            rate_vector_derivative (np.ndarray): Derivatives of the rate categories with respect to alpha.
+
+        Returns:
+            Dict[str, np.ndarray]: Derivatives of shape (nodes, rates, 2, 2) for 'pi_1', 'alpha' and 'coefficient_bl'.
+        """
+        mu = 1.0 / (2 * pi_1 * (1 - pi_1))
+        rate_vector = np.asarray(rate_vector, dtype=np.float64)
+        t = self.branch_length[:, np.newaxis] * (coefficient_bl * rate_vector)
+        e = np.exp(-mu * t)
+
+        dt = np.empty(t.shape + (2, 2), dtype=np.float64)
+        dt[..., 0, 0] = -pi_1 * mu * e
+        dt[..., 0, 1] = pi_1 * mu * e
+        dt[..., 1, 0] = (1 - pi_1) * mu * e
+        dt[..., 1, 1] = -(1 - pi_1) * mu * e
+
+        de = t * e * mu * (1 - 2 * pi_1) / (pi_1 * (1 - pi_1))
+        dpi = np.empty_like(dt)
+        dpi[..., 0, 0] = -(1 - e) + pi_1 * de
+        dpi[..., 0, 1] = (1 - e) - pi_1 * de
+        dpi[..., 1, 0] = -(1 - e) - (1 - pi_1) * de
+        dpi[..., 1, 1] = (1 - e) + (1 - pi_1) * de
+
+        dt_dcoefficient = self.branch_length[:, np.newaxis] * rate_vector
+        dt_dalpha = self.branch_length[:, np.newaxis] * (coefficient_bl * np.asarray(rate_vector_derivative,
+                                                                                      dtype=np.float64))
+
+        return {'pi_1': dpi,
+                'alpha': dt * dt_dalpha[..., np.newaxis, np.newaxis],
+                'coefficient_bl': dt * dt_dcoefficient[..., np.newaxis, np.newaxis]}
+
+    def get_branch_length_gradient(self, pi_1: Union[float, np.float64], coefficient_bl: Union[float, np.float64],
+                                   rate_vector: np.ndarray) -> np.ndarray:
+        """
+        Derivatives of the log-likelihood of the two-state model with respect to the lengths of all branches.
+
+        With mu = 1 / (2 * pi_1 * (1 - pi_1)) and e = exp(-mu * t), dP/dt = mu * e * (S - I) with S the stationary
+        matrix, and t = branch length * coefficient_bl * rate. The derivatives are contracted with
+        `branch_expectation` (see `calculate_expectation`), so one up/down pass gives the whole gradient, whether
+        the site blocks are resident or not.
+
+        Args:
+            pi_1 (Union[float, np.float64]): Stationary frequency of state 1.
+            coefficient_bl (Union[float, np.float64]): Branch length coefficient.
+            rate_vector (np.ndarray): Rate categories.
+
+        Returns:
+            np.ndarray: Derivatives for all nodes (0 for the root).
+        """
+        mu = 1.0 / (2 * pi_1 * (1 - pi_1))
+        rate = coefficient_bl * np.asarray(rate_vector, dtype=np.float64)
+        e = np.exp(-mu * self.branch_length[:, np.newaxis] * rate)
+        derivative = np.asarray(((-pi_1, pi_1), (1 - pi_1, pi_1 - 1)), dtype=np.float64)
+        pmatrix_derivative = (mu * rate * e)[..., np.newaxis, np.newaxis] * derivative
+        gradient = np.sum(pmatrix_derivative * self.branch_expectation, axis=(1, 2, 3))
+        gradient[0] = 0.0
+
+        return gradient
+
+    def get_log_likelihood(self) -> np.float64:
+        pattern_weights = (np.ones(self.log_likelihood_vector.shape[-1]) if self.pattern_weights is None
+                           else self.pattern_weights)
+
+        return np.sum(self.log_likelihood_vector[0] * pattern_weights)
+
+    def optimize_branch_lengths(self, pi_1: Union[float, np.float64], coefficient_bl: Union[float, np.float64],
+                                rate_vector: np.ndarray, bounds: Tuple[float, float] = (1e-6, 10.0),
+                                iterations: int = 5, tolerance: float = 1e-6) -> None:
+        """
+        One sweep of per-branch Newton optimisation of the branch lengths of the two-state model, with the other
+        branches fixed.
+
+        Requires the up, down and contribution tensors of the whole alignment (a single site block). The tree is
+        visited depth first: before a branch is optimised its down vector is recomputed from its parent and its
+        siblings, and after its subtree is done its up vector and contribution are recomputed from its children, so
+        every branch is optimised against up-to-date vectors and a sweep costs about one up and one down pass.
+        As P(t) = S + e * (I - S) with S the stationary matrix and e = exp(-rate * t), the likelihood of a pattern
+        is sum_r A_r + e_r * B_r for every branch, so the Newton steps only cost O(rates * patterns). Branches of
+        zero length (e.g. resolved multifurcations) are kept. Updates `branch_length` and `pmatrix` in place.
+
+        Args:
+            pi_1 (Union[float, np.float64]): Stationary frequency of state 1.
+            coefficient_bl (Union[float, np.float64]): Branch length coefficient.
+            rate_vector (np.ndarray): Rate categories.
+            bounds (Tuple[float, float], optional): Bounds of the branch lengths. (1e-6, 10.0) (default)
+            iterations (int, optional): Maximal number of Newton steps per branch. 5 (default)
+            tolerance (float, optional): Newton step (on log(t)) below which the search stops. 1e-6 (default)
+        """
+        stationary = np.asarray((1 - pi_1, pi_1), dtype=np.float64)
+        derivative = np.eye(2) - stationary
+        rate = (1.0 / (2 * pi_1 * (1 - pi_1))) * coefficient_bl * np.asarray(rate_vector, dtype=np.float64)
+        pattern_weights = (np.ones(self.up_vector.shape[-1]) if self.pattern_weights is None
+                           else np.asarray(self.pattern_weights, dtype=np.float64))
+
+        stack = [(0, False)]
+        while stack:
+            i, is_visited = stack.pop()
+            if is_visited:
+                self.set_node_up_vector(i)
+                continue
+
+            if i:
+                self.set_node_down_vector(i)
+                if self.branch_length[i] > 0.0:
+                    self.branch_length[i] = self.get_branch_length_estimate(i, stationary, rate, pattern_weights,
+                                                                            bounds, iterations, tolerance)
+                    e = np.exp(-rate * self.branch_length[i])
+                    self.pmatrix[i] = stationary + e[:, np.newaxis, np.newaxis] * derivative
+
+            stack.append((i, True))
+            stack.extend((child, False) for child in reversed(self.get_children(i)))
+        self.down_valid[:] = False
+
+    def get_branch_length_estimate(self, i: int, stationary: np.ndarray, rate: np.ndarray,
+                                   pattern_weights: np.ndarray, bounds: Tuple[float, float], iterations: int,
+                                   tolerance: float) -> float:
+        """
+        Maximum likelihood length of one branch given its current down and up vectors (safeguarded Newton search
+        on log(t)).
+
+        Args:
+            i (int): Index of the node below the branch.
+            stationary (np.ndarray): Stationary frequencies.
+            rate (np.ndarray): Substitution rates of the rate categories (mu * coefficient_bl * rate).
+            pattern_weights (np.ndarray): Multiplicities of the patterns.
+            bounds (Tuple[float, float]): Bounds of the branch length.
+            iterations (int): Maximal number of Newton steps.
+            tolerance (float): Newton step (on log(t)) below which the search stops.
+
+        Returns:
+            float: The branch length.
+        """
+        outside = np.sum(self.down_vector[i] * self.frequency[:, np.newaxis], axis=1)
+        inside = np.einsum('y,ryl->rl', stationary, self.up_vector[i])
+        constant = outside * inside
+        variable = np.sum(self.down_vector[i] * self.frequency[:, np.newaxis] * self.up_vector[i], axis=1) - constant
+        likelihood = np.sum(constant + np.exp(-rate * self.branch_length[i])[:, np.newaxis] * variable, axis=0)
+        weights = np.where(likelihood > 0.0, pattern_weights, 0.0)
+
+        def get_terms(log_length: float) -> Tuple[float, float, float]:
+            exponent = (rate * np.exp(log_length))[:, np.newaxis]
+            e = np.exp(-exponent)
+            value = np.sum(constant + e * variable, axis=0)
+            value = np.where(weights > 0.0, value, 1.0)
+            # derivatives with respect to log(t)
+            first = np.sum(-exponent * e * variable, axis=0) / value
+            second = np.sum((exponent ** 2 - exponent) * e * variable, axis=0) / value
+
+            return weights @ np.log(value), weights @ first, weights @ (second - first ** 2)
+
+        lower, upper = np.log(bounds)
+        log_length = min(max(float(np.log(self.branch_length[i])), lower), upper)
+        value, gradient, hessian = get_terms(log_length)
+        for _ in range(iterations):
+            step = min(max(-gradient / hessian if hessian < 0.0 else float(np.sign(gradient)), -2.0), 2.0)
+            for _ in range(30):
+                new_log_length = min(max(log_length + step, lower), upper)
+                new_value, new_gradient, new_hessian = get_terms(new_log_length)
+                if new_value >= value:
+                    break
+                step /= 2
+            else:
+                break
+            step = new_log_length - log_length
+            log_length, value, gradient, hessian = new_log_length, new_value, new_gradient, new_hessian
+            if abs(step) < tolerance:
+                break
+
+        return float(np.exp(log_length))
+
+    def get_children(self, i: int) -> np.ndarray:
+        children = self.children_index[i]
+
+        return children[children >= 0]
+
+    def set_node_up_vector(self, i: int) -> None:
+        """
+        Recompute the up vector of one node from the contributions of its children (leaves keep their vectors),
+        then its own contribution.
+
+        Args:
+            i (int): Index of the node.
+        """
+        children = self.get_children(i)
+        if len(children):
+            self.up_vector[i] = np.prod(self.contribution[children], axis=0)
+            self.up_scale[i] = np.sum(self.up_scale[children], axis=0)
+            self.rescale(self.up_vector, self.up_scale, np.asarray((i, )))
+        if i:
+            self.contribution[i] = self.pmatrix[i] @ self.up_vector[i]
+
+    def set_node_down_vector(self, i: int) -> None:
+        """
+        Recompute the down vector of one non-root node from the contributions of its siblings and the down vector of
+        its parent.
+
+        Args:
+            i (int): Index of the node.
+        """
+        parent = self.parent[i]
+        siblings = self.get_children(parent)
+        siblings = siblings[siblings != i]
+        self.down_vector[i] = np.prod(self.contribution[siblings], axis=0) if len(siblings) else 1.0
+        self.down_scale[i] = np.sum(self.up_scale[siblings], axis=0)
+        if parent:
+            self.down_vector[i] *= self.pmatrix[parent] @ self.down_vector[parent]
+            self.down_scale[i] += self.down_scale[parent]
+        self.rescale(self.down_vector, self.down_scale, np.asarray((i, )))
+
+    def mark_dirty(self, nodes: Union[int, List[int], np.ndarray]) -> None:
+        """
+        Mark the branches whose length, transition matrices or leaf data changed since the last calculation.
+
+        Args:
+            nodes (Union[int, List[int], np.ndarray]): Indices of the nodes below the branches.
+        """
+        self.dirty[nodes] = True
+
+    def set_node_pmatrix(self, i: int, pmatrix: np.ndarray) -> None:
+        self.pmatrix[i] = pmatrix
+        self.mark_dirty(i)
+
+    def set_node_leaf_vector(self, i: int, leaf_vector: np.ndarray) -> None:
+        """
+        Replace the allowed states of one leaf.
+
+        Args:
+            i (int): Index of the leaf.
+            leaf_vector (np.ndarray): Allowed states of shape (states, patterns).
+        """
+        self.leaf_vector[np.searchsorted(self.leaves, i)] = leaf_vector
+        if self.is_resident:
+            self.up_vector[i] = leaf_vector[np.newaxis]
+        self.mark_dirty(i)
+
+    def get_path(self, i: int) -> List[int]:
+        path = [i]
+        while path[-1]:
+            path.append(int(self.parent[path[-1]]))
+
+        return path
+
+    def calculate_dirty(self) -> None:
+        """
+        Bring the likelihoods up to date after `mark_dirty` changes, recomputing only the up vectors on the paths
+        from the changed branches to the root, O(depth) per changed branch instead of O(nodes).
+
+        A down vector does not depend on the branches of its own subtree (nor on its own branch), so the down
+        vectors of the nodes on the path of every changed branch stay valid and all others are only flagged as stale;
+        `calculate_down_path` recomputes them on demand (`get_node_attribute` does it when a stale down vector is
+        read). The marginal tensors and the node and branch probabilities depend on every branch, so they are
+        detached from the nodes until the next marginal pass. Requires the tensors of the whole alignment (a single
+        site block) from a previous `calculate`.
+        """
+        dirty_nodes = np.where(self.dirty)[0]
+        path_mask = np.zeros(self.nodes_length, dtype=bool)
+        for i in dirty_nodes:
+            path = self.get_path(int(i))
+            is_path = np.zeros(self.nodes_length, dtype=bool)
+            is_path[path] = True
+            self.down_valid &= is_path
+            path_mask |= is_path
+        path_nodes = np.where(path_mask)[0]
+        path_nodes = path_nodes[np.argsort(-self.depth[path_nodes], kind='stable')]
+        for i in path_nodes:
+            self.set_node_up_vector(int(i))
+
+        internal = path_nodes[~self.is_leaf[path_nodes]]
+        rate_vector_length = self.up_vector.shape[1]
+        likelihood_vector = np.einsum('j,nrjl->nl', self.frequency, self.up_vector[internal]) / rate_vector_length
+        log_likelihood_vector = self.get_log_likelihood_vector(likelihood_vector, self.up_scale[internal])
+        self.log_likelihood_vector[internal] = log_likelihood_vector
+        self.likelihood_vector[internal] = np.exp(log_likelihood_vector)
+        self.rate_likelihood_vector[:] = np.einsum('j,rjl->rl', self.frequency, self.up_vector[0])
+        self.set_node_likelihoods(internal)
+        for attribute_name in marginal_attributes:
+            self.node_vectors.pop(attribute_name, None)
+        self.dirty[:] = False
+
+    def calculate_down_path(self, i: int) -> None:
+        """
+        Make the down vector of one node valid, recomputing the stale down vectors on its path from the root,
+        O(depth).
+
+        Args:
+            i (int): Index of the node.
+        """
+        path = []
+        while i and not self.down_valid[i]:
+            path.append(i)
+            i = int(self.parent[i])
+        if not self.down_valid[0]:
+            self.down_vector[0] = 1.0
+            self.down_scale[0] = 0
+            self.down_valid[0] = True
+        for i in reversed(path):
+            self.set_node_down_vector(i)
+            self.down_valid[i] = True
+
+    def set_branch_length(self) -> None:
+        self.branch_length = np.asarray([current_node.distance_to_father for current_node in self.nodes],
+                                        dtype=np.float64)
+
+    def set_distances(self) -> None:
+        """
+        Distances of all nodes to the root and to the nearest leaf of their subtree (and the number of levels to it)
+        from `branch_length`, in one pre-order pass and one bottom-up pass over the levels. Distances are rounded
+        to 14 decimals like the sums of the node path vectors they replace.
+        """
+        parent, branch_length = self.parent.tolist(), self.branch_length.tolist()
+        distance_to_root = [0.0] * self.nodes_length
+        for i in range(1, self.nodes_length):
+            distance_to_root[i] = distance_to_root[parent[i]] + branch_length[i]
+        self.distance_to_root = np.asarray([round(distance, 14) for distance in distance_to_root], dtype=np.float64)
+
+        nearest_leaf = np.where(self.is_leaf, self.distance_to_root, np.inf)
+        self.levels_to_nearest = np.where(self.is_leaf, 0, self.nodes_length)
+        for level_nodes, level_fathers, _, _ in reversed(self.levels):
+            np.minimum.at(nearest_leaf, level_fathers, nearest_leaf[level_nodes])
+            np.minimum.at(self.levels_to_nearest, level_fathers, self.levels_to_nearest[level_nodes] + 1)
+        self.distance_to_nearest = np.asarray([round(distance, 14) for distance in
+                                               (nearest_leaf - self.distance_to_root).tolist()], dtype=np.float64)
+
+    @staticmethod
+    def get_available_memory() -> int:
+        """
+        Memory (in bytes) currently available to the process: the free physical memory, further limited by the
+        cgroup memory limit when one is set (e.g. a Slurm allocation).
+
+        Returns:
+            int: Available memory in bytes.
+        """
+        try:
+            memory = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+        except (ValueError, OSError, AttributeError):
+            memory = default_available_memory
+        for limit_file, usage_file in (('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory.current'),
+                                       ('/sys/fs/cgroup/memory/memory.limit_in_bytes',
+                                        '/sys/fs/cgroup/memory/memory.usage_in_bytes')):
+            try:
+                with open(limit_file) as f:
+                    limit = f.read().strip()
+                with open(usage_file) as f:
+                    usage = int(f.read().strip())
+            except (OSError, ValueError):
+                continue
+            if limit.isdigit():
+                memory = min(memory, max(int(limit) - usage, 0))
+            break
+
+        return memory
+
+    def get_block_length(self, rate_vector_length: int, alphabet_length: int, patterns_length: int,
+                         site_block_size: Optional[int] = None, threads: int = 1) -> int:
+        """
+        Number of site patterns evaluated at once.
+
+        A block shorter than the alignment is a multiple of `expectation_block_size` patterns, so that the
+        expectations are summed over the same chunks of patterns whatever the block length (see
+        `calculate_expectation`) and the results do not depend on the block length nor on the number of threads.
+
+        Args:
+            rate_vector_length (int): Number of rate categories.
+            alphabet_length (int): Number of states.
+            patterns_length (int): Number of site patterns.
+            site_block_size (int, optional): Explicit block size, `None` or 0 to choose it from the available memory
+                (shared by `threads` blocks in flight, with at least one block per thread).
+            threads (int, optional): Number of worker threads. 1 (default)
+
+        Returns:
+            int: Block length, between 1 and `patterns_length`.
+        """
+        if not site_block_size:
+            itemsize = np.dtype(np.float64).itemsize
+            output_length = (patterns_length * (2 + alphabet_length + alphabet_length ** 2) +
+                             self.get_chunks_length(patterns_length) * rate_vector_length * alphabet_length ** 2)
+            output_bytes = itemsize * self.nodes_length * output_length
+            bytes_per_pattern = (itemsize * self.nodes_length * rate_vector_length * alphabet_length *
+                                 (5 + alphabet_length))
+            memory = self.get_available_memory() * available_memory_fraction - output_bytes
+            site_block_size = int(max(memory, 0) // (bytes_per_pattern * threads))
+            if threads > 1:
+                site_block_size = min(site_block_size, -(-patterns_length // threads))
+        if site_block_size < patterns_length:
+            site_block_size = max(site_block_size // expectation_block_size, 1) * expectation_block_size
+
+        return int(min(max(site_block_size, 1), max(patterns_length, 1)))
+
+    @staticmethod
+    def get_chunks_length(patterns_length: int) -> int:
+
+        return -(-patterns_length // expectation_block_size)
+
+    def allocate(self, rate_vector_length: int, alphabet_length: int, patterns_length: int,
+                 site_block_size: Optional[int] = None, threads: int = 1) -> None:
+        """
+        Allocate the per-pattern results and the work tensors of one site block.
+
+        Args:
+            rate_vector_length (int): Number of rate categories.
+            alphabet_length (int): Number of states.
+            patterns_length (int): Number of site patterns.
+            site_block_size (int, optional): Patterns per block, `None` or 0 to choose it from the available memory.
+            threads (int, optional): Number of worker threads evaluating site blocks. 1 (default)
+        """
+        self.threads = max(int(threads), 1)
+        self.block_length = self.get_block_length(rate_vector_length, alphabet_length, patterns_length,
+                                                  site_block_size, self.threads)
+        if self.likelihood_vector is None or self.likelihood_vector.shape != (self.nodes_length, patterns_length):
+            self.likelihood_vector = np.empty((self.nodes_length, patterns_length), dtype=np.float64)
+            self.log_likelihood_vector = np.empty((self.nodes_length, patterns_length), dtype=np.float64)
+        if self.rate_likelihood_vector is None or self.rate_likelihood_vector.shape != (rate_vector_length,
+                                                                                          patterns_length):
+            self.rate_likelihood_vector = np.empty((rate_vector_length, patterns_length), dtype=np.float64)
+        self.allocate_block(rate_vector_length, alphabet_length, self.block_length)
+        self.marginal_vector = self.marginal_bl_vector = None
+
+    def allocate_block(self, rate_vector_length: int, alphabet_length: int, block_length: int) -> None:
+        shape = (self.nodes_length, rate_vector_length, alphabet_length, block_length)
+        if self.up_vector is None or self.up_vector.shape != shape:
+            self.up_vector = np.empty(shape, dtype=np.float64)
+            self.down_vector = np.empty(shape, dtype=np.float64)
+            self.contribution = np.empty(shape, dtype=np.float64)
+            self.up_scale = np.zeros((self.nodes_length, block_length), dtype=np.int64)
+            self.down_scale = np.zeros((self.nodes_length, block_length), dtype=np.int64)
+
+    def is_chunked(self) -> bool:
+
+        return self.block_length < self.likelihood_vector.shape[-1]
+
+    def get_blocks(self) -> List[slice]:
+        patterns_length = self.likelihood_vector.shape[-1]
+
+        return [slice(start, min(start + self.block_length, patterns_length))
+                for start in range(0, patterns_length, self.block_length)]
+
+    def set_leaf_up_vectors(self, sequences: np.ndarray, alphabet: Tuple[str, ...]) -> None:
+        """
+        Store the states allowed by the observed characters of the leaves.
+
+        Args:
+            sequences (np.ndarray): Characters of every leaf (in `leaves` order) at every pattern,
+                shape (leaves, patterns).
+            alphabet (Tuple[str, ...]): The alphabet of the MSA.
+        """
+        mask_gap = (sequences == '-') | (sequences == '?')
+        self.leaf_vector = np.stack([(sequences == character) | mask_gap for character in alphabet], axis=1)
+
+    def get_worker(self) -> 'CompiledTree':
+        """
+        Shallow copy sharing the topology, the transition matrices and the full-length outputs, with its own work
+        tensors, so that several site blocks can be evaluated at the same time.
+
+        Returns:
+            CompiledTree: The worker.
+        """
+        worker = copy(self)
+        worker.node_vectors, worker.is_likelihood_node = dict(self.node_vectors), self.is_likelihood_node.copy()
+        worker.up_vector = worker.down_vector = worker.contribution = worker.up_scale = worker.down_scale = None
+
+        return worker
+
+    def get_replicate(self) -> 'CompiledTree':
+        """
+        Copy sharing the topology and the transition matrices, with its own leaf data, work tensors and outputs, to
+        evaluate other alignments over the same leaves (e.g. simulated ones) with `calculate_vectors` while the
+        tensors and the Node attributes of this tree are left untouched.
+
+        Returns:
+            CompiledTree: The replicate.
+        """
+        replicate = self.get_worker()
+        replicate.leaf_vector = replicate.pattern_index = replicate.pattern_weights = None
+        replicate.likelihood_vector = replicate.log_likelihood_vector = replicate.rate_likelihood_vector = None
+        replicate.marginal_vector = replicate.marginal_bl_vector = None
+        replicate.probability_vector = replicate.branch_probability_vector = None
+        replicate.probabilities_sequence_characters = replicate.sequence_indices = None
+        replicate.branch_expectation = replicate.root_expectation = None
+        replicate.dirty, replicate.down_valid = self.dirty.copy(), self.down_valid.copy()
+        replicate.is_resident = False
+
+        return replicate
+
+    def set_block(self, block: slice) -> None:
+        rate_vector_length, alphabet_length = self.rate_likelihood_vector.shape[0], self.leaf_vector.shape[1]
+        self.allocate_block(rate_vector_length, alphabet_length, block.stop - block.start)
+        self.up_vector[self.leaves] = self.leaf_vector[:, np.newaxis, :, block]
+
+    @staticmethod
+    def rescale(vector: np.ndarray, scale: np.ndarray, nodes: np.ndarray) -> None:
+        """
+        Rescale the vectors of the given nodes in place so that their maximum over rates and states lies in
+        [0.5, 1) for every pattern, adding the (exact, power of two) scaling exponents to `scale`.
+
+        Args:
+            vector (np.ndarray): Up or down tensor of shape (nodes, [parameter sets, ]rates, states, patterns).
+            scale (np.ndarray): Matching base-2 exponents of shape (nodes, [parameter sets, ]patterns).
+            nodes (np.ndarray): Indices of the nodes to rescale.
+        """
+        if not len(nodes):
+            return
+        exponent = np.frexp(np.max(vector[nodes], axis=(-3, -2)))[1]
+        vector[nodes] = np.ldexp(vector[nodes], -exponent[..., np.newaxis, np.newaxis, :])
+        scale[nodes] += exponent
+
+    def get_log_likelihood_vector(self, likelihood_vector: np.ndarray, scale: np.ndarray) -> np.ndarray:
+        invalid_mask = (likelihood_vector <= 0.0) | np.isnan(likelihood_vector) | np.isinf(likelihood_vector)
+        likelihood_vector = np.where(invalid_mask, 1.0, likelihood_vector)
+
+        return np.where(invalid_mask, np.log(eps), np.log(likelihood_vector) + scale * np.log(2.0))
+
+    def calculate(self, alphabet: Optional[Tuple[str, ...]] = None, is_down: bool = False, is_marginal: bool = False,
+                  is_streaming: bool = False, probability_dtype: type = np.float64,
+                  is_expectation: bool = False) -> None:
+        """
+        Run the up pass and, optionally, the down and marginal passes over all site blocks.
+
+        Sites are independent, so every block of patterns goes through the passes on its own and only the
+        per-pattern results (log-likelihoods, per-rate root likelihoods, node and branch probabilities) are written
+        to the full-length outputs. When the whole alignment fits in one block the work tensors stay alive and Node
+        attributes are views into them; otherwise they are transient and the marginal tensors are never stored.
+
+        With `threads` > 1 the blocks are shared out among workers on a thread pool (numpy releases the GIL in the
+        batched kernels). Every block is computed exactly as in the serial path and written to its own slice of the
+        outputs, and the per-node sums are taken afterwards, so the results do not depend on the number of threads.
+
+        Args:
+            alphabet (Tuple[str, ...], optional): The alphabet of the MSA, required for the marginal pass.
+            is_down (bool, optional): Run the down pass. `False` (default)
+            is_marginal (bool, optional): Run the down and marginal passes. `False` (default)
+            is_streaming (bool, optional): Do not store the marginal tensors. `False` (default)
+            probability_dtype (type, optional): Storage type of the resulting probabilities. `np.float64` (default)
+            is_expectation (bool, optional): Run the down pass and accumulate `branch_expectation` and
+                `root_expectation` (see `calculate_expectation`). `False` (default)
+        """
+        self.calculate_vectors(is_down, is_marginal, is_streaming, probability_dtype, is_expectation)
+
+        is_chunked = not self.is_resident
+        self.set_node_likelihoods()
+        self.set_node_vectors('up_vector', None if is_chunked else self.up_vector)
+        self.set_node_vectors('up_scale', None if is_chunked else self.up_scale)
+        if is_down or is_marginal or is_expectation:
+            self.set_node_vectors('down_vector', None if is_chunked else self.down_vector)
+            self.set_node_vectors('down_scale', None if is_chunked else self.down_scale)
+        if is_marginal:
+            self.set_node_probabilities(alphabet)
+
+    def calculate_vectors(self, is_down: bool = False, is_marginal: bool = False, is_streaming: bool = False,
+                          probability_dtype: type = np.float64, is_expectation: bool = False) -> None:
+        """
+        The passes of `calculate` without updating the Node attributes: only the tensors and the per-pattern
+        outputs of the compiled tree are written (the node and branch probabilities are not expanded to MSA
+        positions).
+
+        Args:
+            is_down (bool, optional): Run the down pass. `False` (default)
+            is_marginal (bool, optional): Run the down and marginal passes. `False` (default)
+            is_streaming (bool, optional): Do not store the marginal tensors. `False` (default)
+            probability_dtype (type, optional): Storage type of the resulting probabilities. `np.float64` (default)
+            is_expectation (bool, optional): Accumulate `branch_expectation` and `root_expectation`. `False` (default)
+        """
+        is_chunked = self.is_chunked()
+        blocks = self.get_blocks()
+        if is_expectation:
+            rate_vector_length, alphabet_length = self.rate_likelihood_vector.shape[0], self.leaf_vector.shape[1]
+            chunks_length = self.get_chunks_length(self.likelihood_vector.shape[-1])
+            self.branch_expectation = np.zeros((chunks_length, self.nodes_length, rate_vector_length, alphabet_length,
+                                                alphabet_length), dtype=np.float64)
+            self.root_expectation = np.zeros((chunks_length, rate_vector_length, alphabet_length), dtype=np.float64)
+        if is_marginal:
+            patterns_length = self.likelihood_vector.shape[-1]
+            alphabet_length = self.up_vector.shape[2]
+            self.probability_vector = np.empty((self.nodes_length, patterns_length, alphabet_length),
+                                               dtype=probability_dtype)
+            self.branch_probability_vector = np.empty((self.nodes_length, patterns_length, alphabet_length ** 2),
+                                                      dtype=probability_dtype)
+            self.marginal_vector = self.marginal_bl_vector = None
+
+        threads = min(self.threads, len(blocks))
+        if threads > 1:
+            workers = [self.get_worker() for _ in range(threads)]
+            with ThreadPoolExecutor(max_workers=threads) as executor:
+                futures = [executor.submit(worker.calculate_blocks, blocks, range(i, len(blocks), threads), is_down,
+                                           is_marginal, is_streaming or is_chunked, is_expectation)
+                           for i, worker in enumerate(workers)]
+                for future in futures:
+                    future.result()
+        else:
+            self.calculate_blocks(blocks, range(len(blocks)), is_down, is_marginal, is_streaming or is_chunked,
+                                  is_expectation)
+
+        self.is_resident = not is_chunked
+        self.dirty[:] = False
+        self.down_valid[:] = self.is_resident and (is_down or is_marginal or is_expectation)
+        if is_expectation:
+            self.branch_expectation = np.sum(self.branch_expectation, axis=0)
+            self.root_expectation = np.sum(self.root_expectation, axis=0)
+
+    def calculate_blocks(self, blocks: List[slice], block_indices: range, is_down: bool = False,
+                         is_marginal: bool = False, is_streaming: bool = False, is_expectation: bool = False) -> None:
+        for i in block_indices:
+            block = blocks[i]
+            self.set_block(block)
+            self.calculate_up(block)
+            if is_down or is_marginal or is_expectation:
+                self.calculate_down()
+            if is_marginal:
+                self.calculate_marginal(block, is_streaming)
+            if is_expectation:
+                self.calculate_expectation(block)
+
+    def propagate_up(self, pmatrix: np.ndarray, up_vector: np.ndarray, up_scale: np.ndarray,
+                     contribution: Optional[np.ndarray] = None) -> None:
+        """
+        Level-wise up pass over tensors whose leaf vectors are already set.
+
+        Args:
+            pmatrix (np.ndarray): Transition matrices of shape (nodes, [parameter sets, ]rates, states, states).
+            up_vector (np.ndarray): Up tensor of shape (nodes, [parameter sets, ]rates, states, patterns).
+            up_scale (np.ndarray): Matching base-2 exponents of shape (nodes, [parameter sets, ]patterns).
+            contribution (np.ndarray, optional): Stores `pmatrix @ up_vector` of every non-root node when given.
+        """
+        up_vector[self.internal] = 1.0
+        up_scale[:] = 0
+
+        for level_nodes, level_parents, rank_slices, level_internal in reversed(self.levels):
+            self.rescale(up_vector, up_scale, level_internal)
+            level_contribution = pmatrix[level_nodes] @ up_vector[level_nodes]
+            if contribution is not None:
+                contribution[level_nodes] = level_contribution
+            for rank_slice in rank_slices:
+                up_vector[level_parents[rank_slice]] *= level_contribution[rank_slice]
+                up_scale[level_parents[rank_slice]] += up_scale[level_nodes[rank_slice]]
+        self.rescale(up_vector, up_scale, self.pre_order[:1])
+
+    def calculate_up(self, block: slice) -> None:
+        up_vector, up_scale = self.up_vector, self.up_scale
+        self.propagate_up(self.pmatrix, up_vector, up_scale, self.contribution)
+
+        rate_vector_length = up_vector.shape[1]
+        likelihood_vector = np.einsum('j,nrjl->nl', self.frequency, up_vector[self.internal]) / rate_vector_length
+        log_likelihood_vector = self.get_log_likelihood_vector(likelihood_vector, up_scale[self.internal])
+        self.log_likelihood_vector[self.internal, block] = log_likelihood_vector
+        self.likelihood_vector[self.internal, block] = np.exp(log_likelihood_vector)
+        self.rate_likelihood_vector[:, block] = np.einsum('j,rjl->rl', self.frequency, up_vector[0])
+
+    def get_log_likelihood_grid(self, pmatrix: np.ndarray, frequency: np.ndarray,
+                                site_block_size: Optional[int] = None) -> np.ndarray:
+        """
+        Log-likelihoods of the alignment under several parameter sets at once.
+
+        The parameter sets are a leading batch axis of the transition matrices and of the up tensor, so one
+        level-wise up pass (per site block) evaluates all of them; scaling is kept per parameter set.
+
+        Args:
+            pmatrix (np.ndarray): Transition matrices of shape (parameter sets, nodes, rates, states, states).
+            frequency (np.ndarray): Root frequencies of shape (parameter sets, states).
+            site_block_size (int, optional): Patterns per block, `None` or 0 to choose it from the available memory.
+
+        Returns:
+            np.ndarray: Log-likelihood of every parameter set, weighted by the pattern multiplicities.
+        """
+        parameters_length, _, rate_vector_length, alphabet_length, _ = pmatrix.shape
+        pmatrix = np.ascontiguousarray(np.moveaxis(pmatrix, 0, 1), dtype=np.float64)
+        patterns_length = self.leaf_vector.shape[-1]
+        pattern_weights = np.ones(patterns_length) if self.pattern_weights is None else self.pattern_weights
+        block_length = self.get_block_length(parameters_length * rate_vector_length, alphabet_length, patterns_length,
+                                             site_block_size)
+
+        log_likelihood_vector = np.empty((parameters_length, patterns_length), dtype=np.float64)
+        for start in range(0, patterns_length, block_length):
+            block = slice(start, min(start + block_length, patterns_length))
+            up_vector = np.empty((self.nodes_length, parameters_length, rate_vector_length, alphabet_length,
+                                  block.stop - block.start), dtype=np.float64)
+            up_scale = np.zeros((self.nodes_length, parameters_length, block.stop - block.start), dtype=np.int64)
+            up_vector[self.leaves] = self.leaf_vector[:, np.newaxis, np.newaxis, :, block]
+            self.propagate_up(pmatrix, up_vector, up_scale)
+
+            likelihood = np.einsum('kj,krjl->kl', frequency, up_vector[0]) / rate_vector_length
+            log_likelihood_vector[:, block] = self.get_log_likelihood_vector(likelihood, up_scale[0])
+
+        return np.sum(log_likelihood_vector * pattern_weights, axis=1)
+
+    def calculate_down(self) -> None:
+        up_scale, down_vector, down_scale = self.up_scale, self.down_vector, self.down_scale
+        down_vector[0] = 1.0
+        down_scale[:] = 0
+        children_scale = np.zeros_like(up_scale)
+        np.add.at(children_scale, self.parent[1:], up_scale[1:])
+
+        for level_nodes, level_parents, rank_slices, _ in self.levels:
+            contribution = self.contribution[level_nodes]
+            total_down = np.empty_like(contribution)
+            prefix = np.ones((rank_slices[0].stop, ) + contribution.shape[1:], dtype=np.float64)
+            for rank_slice in rank_slices:
+                positions = self.parent_position[level_nodes[rank_slice]]
+                total_down[rank_slice] = prefix[positions]
+                prefix[positions] *= contribution[rank_slice]
+            suffix = np.ones_like(prefix)
+            for rank_slice in reversed(rank_slices):
+                positions = self.parent_position[level_nodes[rank_slice]]
+                total_down[rank_slice] *= suffix[positions]
+                suffix[positions] *= contribution[rank_slice]
+            total_scale = children_scale[level_parents] - up_scale[level_nodes]
+
+            mask = level_parents != 0
+            fathers = level_parents[mask]
+            total_down[mask] *= self.pmatrix[fathers] @ down_vector[fathers]
+            total_scale[mask] += down_scale[fathers]
+            down_vector[level_nodes] = total_down
+            down_scale[level_nodes] = total_scale
+            self.rescale(down_vector, down_scale, level_nodes)
+
+    def calculate_expectation(self, block: slice) -> None:
+        """
+        Accumulate the weighted, likelihood-normalised products of outside and inside vectors of one site block.
+
+        By reversibility `frequency * down_vector[b]` is the outside probability at the parent end of branch `b`, so
+        the likelihood of a pattern is L = sum(frequency * down[b] * (P[b] @ up[b])) for every branch `b`.
+        `branch_expectation[b, r, x, y]` = sum_l w_l * frequency[x] * down[b, r, x, l] * up[b, r, y, l] / L_l and
+        `root_expectation[r, x]` = sum_l w_l * up[root, r, x, l] / L_l (w_l are the pattern weights). Every ratio
+        is taken between tensors with the same scaling, so the scaling exponents cancel out. Hence
+        dlnL/dtheta = sum(dP/dtheta * branch_expectation) + sum(dfrequency/dtheta * root_expectation) and
+        P * branch_expectation are the expected numbers of transitions along every branch.
+
+        The sums over the patterns are taken per chunk of `expectation_block_size` patterns (blocks start at chunk
+        boundaries, see `get_block_length`) and the chunks are added in the same order at the end of
+        `calculate_vectors`, so the results are the same for any block length. The products are formed for blocks of
+        nodes bounded by `marginal_block_size` elements.
+
+        Args:
+            block (slice): Patterns of the current site block.
+        """
+        rate_vector_length, alphabet_length, block_length = self.up_vector.shape[1:]
+        pattern_weights = (np.ones(block_length) if self.pattern_weights is None else self.pattern_weights[block])
+        outside = self.down_vector[1:] * self.frequency[:, np.newaxis]
+        likelihood = np.sum(outside * self.contribution[1:], axis=(1, 2))
+        root_likelihood = np.einsum('j,rjl->l', self.frequency, self.up_vector[0])
+        valid_mask = (root_likelihood > 0.0) & np.all(likelihood > 0.0, axis=0)
+        weights = np.where(valid_mask, pattern_weights, 0.0)
+        outside *= (weights / np.where(likelihood > 0.0, likelihood, 1.0))[:, np.newaxis, np.newaxis, :]
+
+        chunks = slice(block.start // expectation_block_size, self.get_chunks_length(block.stop))
+        nodes_block_length = max(1, marginal_block_size // (rate_vector_length * alphabet_length ** 2 * block_length))
+        for start in range(1, self.nodes_length, nodes_block_length):
+            nodes_block = slice(start, start + nodes_block_length)
+            products = (outside[nodes_block.start - 1:nodes_block.stop - 1, :, :, np.newaxis] *
+                        self.up_vector[nodes_block, :, np.newaxis])
+            self.branch_expectation[chunks, nodes_block] = self.get_chunk_sums(products)
+        self.root_expectation[chunks] = self.get_chunk_sums(self.up_vector[0] * (
+            weights / np.where(valid_mask, root_likelihood, 1.0)))
+
+    @staticmethod
+    def get_chunk_sums(vector: np.ndarray) -> np.ndarray:
+        """
+        Sums of a block over its chunks of `expectation_block_size` patterns (the last one zero padded).
+
+        Args:
+            vector (np.ndarray): Values of shape (..., patterns).
+
+        Returns:
+            np.ndarray: Sums of shape (chunks, ...).
+        """
+        patterns_length = vector.shape[-1]
+        padded = np.zeros(vector.shape[:-1] + (CompiledTree.get_chunks_length(patterns_length) *
+                                               expectation_block_size, ), dtype=vector.dtype)
+        padded[..., :patterns_length] = vector
+        chunk_sums = np.sum(padded.reshape(vector.shape[:-1] + (-1, expectation_block_size)), axis=-1)
+
+        return np.moveaxis(chunk_sums, -1, 0)
+
+    def calculate_marginal(self, block: slice, is_streaming: bool = False) -> None:
+        """
+        Compute the node and branch probabilities of one site block.
+
+        In streaming mode the (rates, states, patterns) and (rates, states, states, patterns) marginal tensors are
+        evaluated for blocks of nodes bounded by `marginal_block_size` elements, reduced straight away to the exported
+        per-node/per-branch probabilities and discarded, so `marginal_vector` and `marginal_bl_vector` are not kept.
+
+        Args:
+            block (slice): Patterns of the current site block.
+            is_streaming (bool, optional): Do not store the marginal tensors. `False` (default)
+        """
+        rate_vector_length, alphabet_length, block_length = self.up_vector.shape[1:]
+        nodes_block_length = self.nodes_length
+        if is_streaming:
+            nodes_block_length = max(1, marginal_block_size // (rate_vector_length * alphabet_length ** 2 *
+                                                                block_length))
+
+        for start in range(0, self.nodes_length, nodes_block_length):
+            nodes_block = slice(start, start + nodes_block_length)
+            marginal_vector, marginal_bl_vector = self.get_marginal_vectors(nodes_block)
+            (self.probability_vector[nodes_block, block],
+             self.branch_probability_vector[nodes_block, block]) = self.get_probability_vectors(marginal_vector,
+                                                                                                marginal_bl_vector)
+            if not is_streaming:
+                self.marginal_vector, self.marginal_bl_vector = marginal_vector, marginal_bl_vector
+
+    def get_marginal_vectors(self, nodes_block: slice) -> Tuple[np.ndarray, np.ndarray]:
+        up_vector, down_vector = self.up_vector[nodes_block], self.down_vector[nodes_block]
+        pmatrix = self.pmatrix[nodes_block]
+
+        marg = np.swapaxes(pmatrix, -1, -2) @ (down_vector * self.frequency[:, np.newaxis])
+        marginal_vector = up_vector * marg
+        marginal_bl_vector = np.einsum('i,nril,nrij,nrjl->nrjil', self.frequency, down_vector, pmatrix, up_vector)
+
+        return marginal_vector, marginal_bl_vector
+
+    @staticmethod
+    def get_probability_vectors(marginal_vector: np.ndarray, marginal_bl_vector: np.ndarray
+                                ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Reduce marginal tensors over the rate categories and normalise them by the likelihood of every pattern.
+
+        Args:
+            marginal_vector (np.ndarray): Shape (nodes, rates, states, patterns).
+            marginal_bl_vector (np.ndarray): Shape (nodes, rates, states, states, patterns).
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Node probabilities of shape (nodes, patterns, states) and branch
+                probabilities of shape (nodes, patterns, states * states).
+        """
+        nodes_length, rate_vector_length = marginal_vector.shape[:2]
+        likelihoods = np.sum(marginal_vector, axis=(1, 2)) / rate_vector_length
+        invalid_mask = (likelihoods == 0.0) | np.isnan(likelihoods) | np.isinf(likelihoods)
+        likelihoods = np.where(invalid_mask, eps, likelihoods)
+        summed_marginal = np.sum(marginal_vector, axis=1)
+        summed_marginal_bl = np.sum(marginal_bl_vector, axis=1)
+        probability_vector = summed_marginal / (rate_vector_length * likelihoods[:, np.newaxis, :])
+        branch_probability = summed_marginal_bl / (rate_vector_length * likelihoods[:, np.newaxis, np.newaxis, :])
+
+        probability_vector = probability_vector.transpose(0, 2, 1)
+        branch_probability = branch_probability.transpose(0, 3, 1, 2).reshape(nodes_length,
+                                                                             probability_vector.shape[1], -1)
+
+        return probability_vector, branch_probability
+
+    def set_node_likelihoods(self, nodes: Optional[np.ndarray] = None) -> None:
+        self.node_vectors['pattern_weights'] = (np.ones(self.log_likelihood_vector.shape[-1]) if
+                                                self.pattern_weights is None else self.pattern_weights)
+        self.node_vectors['likelihood_vector'] = self.likelihood_vector
+        self.node_vectors['log_likelihood_vector'] = self.log_likelihood_vector
+        self.is_likelihood_node[self.internal if nodes is None else nodes] = True
+
+    def set_node_vectors(self, attribute_name: str, vector: Optional[np.ndarray]) -> None:
+        self.node_vectors[attribute_name] = vector
+
+    def clean_node_vectors(self) -> None:
+        self.node_vectors = {'pmatrix': self.node_vectors.get('pmatrix')}
+        self.is_likelihood_node = np.zeros(self.nodes_length, dtype=bool)
+
+    def get_node_attribute(self, attribute_name: str, i: int) -> Optional[Union[np.ndarray, np.float64]]:
+        """
+        The value of an array attribute of the node `i`: a view into the attached tensor, or the likelihood of the
+        node computed from its log-likelihood vector. A stale down vector (see `calculate_dirty`) is recomputed
+        first.
+
+        Args:
+            attribute_name (str): A name from `Node.vector_attributes` or `pmatrix`.
+            i (int): The index of the node.
+
+        Returns:
+            Optional[Union[np.ndarray, np.float64]]: The value, `None` when nothing is attached.
+        """
+        if attribute_name in ('likelihood_vector', 'log_likelihood_vector', 'log_likelihood', 'likelihood'):
+            if not self.is_likelihood_node[i]:
+                return None
+            if attribute_name in ('likelihood_vector', 'log_likelihood_vector'):
+                return self.node_vectors[attribute_name][i]
+            log_likelihood = np.sum(self.node_vectors['log_likelihood_vector'][i] *
+                                    self.node_vectors['pattern_weights'])
+            return log_likelihood if attribute_name == 'log_likelihood' else np.exp(log_likelihood)
+        vector = self.node_vectors.get(attribute_name)
+        if vector is None:
+            return None
+        if attribute_name == 'down_vector' and not self.down_valid[i]:
+            self.calculate_down_path(i)
+
+        return vector[i]
+
+    def get_node_unscaled_vector(self, attribute_name: str, i: int) -> Optional[np.ndarray]:
+        """
+        The true values of the up, down or marginal vector of the node `i`: the stored mantissas times two to the
+        power of the matching exponents (`up_scale`, `down_scale`, or both for the marginal tensors). Values below
+        the float64 range underflow to zero.
+
+        Args:
+            attribute_name (str): A name from `scale_names`.
+            i (int): The index of the node.
+
+        Returns:
+            Optional[np.ndarray]: The vector, `None` when nothing is attached.
+        """
+        vector = self.get_node_attribute(attribute_name, i)
+        if vector is None:
+            return None
+        scale = sum(self.node_vectors[scale_name][i] for scale_name in scale_names[attribute_name])
+
+        return np.ldexp(vector, scale)
+
+    def set_node_probabilities(self, alphabet: Tuple[str, ...]) -> None:
+        max_indices = np.argmax(self.probability_vector, axis=2)
+        probabilities_sequence_characters = np.take_along_axis(self.probability_vector, max_indices[:, :, np.newaxis],
+                                                               axis=2)[:, :, 0]
+
+        self.probability_vector = self.expand_patterns(self.probability_vector, 1)
+        self.branch_probability_vector = self.expand_patterns(self.branch_probability_vector, 1)
+        self.probabilities_sequence_characters = self.expand_patterns(probabilities_sequence_characters)
+        self.sequence_indices = self.expand_patterns(max_indices)
+
+        self.node_vectors.update({'marginal_vector': self.marginal_vector,
+                                  'marginal_bl_vector': self.marginal_bl_vector,
+                                  'probability_vector': self.probability_vector,
+                                  'branch_probability_vector': self.branch_probability_vector,
+                                  'probability_vector_loss': self.branch_probability_vector[:, :, 1],
+                                  'probability_vector_gain': self.branch_probability_vector[:, :, 2],
+                                  'probabilities_sequence_characters': self.probabilities_sequence_characters})
+        characters = np.asarray(alphabet)
+        for i, current_node in enumerate(self.nodes):
+            current_node.sequence = ''.join(characters[self.sequence_indices[i]])
@@ -1,26 +1,52 @@
 import numpy as np
 
-from typing import Optional, Dict, Union, List, Tuple, Any
+from typing import Optional, Dict, Union, List, Tuple, Any, Sequence
 from scipy.linalg import expm
 from json import loads, dumps
 
 from .npencoder import NpEncoder
 
-eps = 5e-324
+default_alphabet = ('0', '1')
+default_frequency = np.asarray((0.5, 0.5))
 
 
 class Node:
+    __slots__ = ('father', 'children', 'name', 'node_type', 'distance_to_father', 'distance_to_root',
+                 'distance_to_nearest', 'distance_to_father_taking_into_coefficient',
+                 'distance_to_root_taking_into_coefficient', 'distance_to_nearest_taking_into_coefficient', 'level',
+                 'levels_to_nearest', 'sequence_likelihood', 'sequence', 'ancestral_sequence', 'aliases', 'tree',
+                 'index', 'pmatrix', 'log_likelihood_vector', 'log_likelihood', 'likelihood_vector', 'likelihood',
+                 'up_vector', 'down_vector', 'marginal_vector', 'marginal_bl_vector', 'probability_vector',
+                 'branch_probability_vector', 'probability_vector_gain', 'probability_vector_loss',
+                 'probabilities_sequence_characters')
+    vector_attributes = ('log_likelihood_vector', 'log_likelihood', 'likelihood_vector', 'likelihood', 'up_vector',
+                         'down_vector', 'marginal_vector', 'marginal_bl_vector', 'probability_vector',
+                         'branch_probability_vector', 'probability_vector_gain', 'probability_vector_loss',
+                         'probabilities_sequence_characters')
+    info_keys = ('node', 'distance', 'distance_taking_into_coefficient', 'distance_to_root',
+                 'distance_to_root_taking_into_coefficient', 'distance_to_nearest',
+                 'distance_to_nearest_taking_into_coefficient', 'level', 'levels_to_nearest', 'node_type', 'father_name',
+                 'full_distance', 'full_distance_taking_into_coefficient', 'children', 'up_vector', 'down_vector',
+                 'likelihood', 'sequence_likelihood', 'log_likelihood', 'log_likelihood_vector', 'marginal_vector',
+                 'marginal_bl_vector', 'probability_vector', 'sequence', 'probabilities_sequence_characters',
+                 'ancestral_sequence', 'branch_probability_vector', 'probability_vector_gain',
+                 'probability_vector_loss', 'alphabet', 'pi_1', 'frequency', 'coefficient_bl', 'pmatrix')
+    info_attributes = {'node': 'name',
+                       'distance': 'distance_to_father',
+                       'distance_taking_into_coefficient': 'distance_to_father_taking_into_coefficient',
+                       'full_distance': 'distance_to_root_vector',
+                       'full_distance_taking_into_coefficient': 'distance_to_root_vector_taking_into_coefficient'}
+    pattern_keys = ('up_vector', 'down_vector', 'log_likelihood_vector', 'marginal_vector', 'marginal_bl_vector')
+    scaled_keys = ('up_vector', 'down_vector', 'marginal_vector', 'marginal_bl_vector')
     father: Optional['Node']
     children: List['Node']
     name: str
     node_type: str
     distance_to_father: Union[float, np.float64]
     distance_to_root: Union[float, np.float64]
-    distance_to_root_vector: List[Union[float, np.float64]]
     distance_to_nearest: Union[float, np.float64]
     distance_to_father_taking_into_coefficient: Union[float, np.float64]
     distance_to_root_taking_into_coefficient: Union[float, np.float64]
-    distance_to_root_vector_taking_into_coefficient: List[Union[float, np.float64]]
     distance_to_nearest_taking_into_coefficient: Union[float, np.float64]
     level: int
     levels_to_nearest: int
@@ -28,6 +54,7 @@ class Node:
     pi_1: Union[float, np.float64]
     frequency: Optional[np.ndarray]
     coefficient_bl: Union[float, np.float64, int]
+    pattern_index: Optional[np.ndarray]
     pmatrix: Optional[np.ndarray]
     log_likelihood_vector: Optional[np.ndarray]
     log_likelihood: Union[float, np.float64, None]
@@ -45,45 +72,85 @@ class Node:
     sequence: str
     probabilities_sequence_characters: Optional[np.ndarray]
     ancestral_sequence: str
-    aliases = Dict[str, str]
+    aliases: Dict[str, str]
+    tree: Optional[Any]
+    index: int
 
     def __init__(self, name: Optional[str]) -> None:
+        """
+        A node of a phylogenetic tree.
+
+        The model parameters (`alphabet`, `pi_1`, `frequency`, `coefficient_bl`, `pattern_index`) are read from the
+        tree the node belongs to, and the likelihood and probability arrays (`pmatrix`, `up_vector`, ...) are views
+        into the tensors of its compiled tree, taken only when they are accessed. Assigning one of these arrays
+        stores it on the node instead.
+
+        Args:
+            name (str): The name of the node.
+        """
         self.father = None
         self.children = []
         self.name = name
         self.node_type = ''
         self.distance_to_father = 0.0
         self.distance_to_root = 0.0
-        self.distance_to_root_vector = []
         self.distance_to_nearest = 0.0
         self.distance_to_father_taking_into_coefficient = 0.0
         self.distance_to_root_taking_into_coefficient = 0.0
-        self.distance_to_root_vector_taking_into_coefficient = []
         self.distance_to_nearest_taking_into_coefficient = 0.0
         self.level = 0
         self.levels_to_nearest = 0
-        self.alphabet = ('0', '1')
-        self.pi_1 = 0.5
-        self.frequency = np.asarray((0.5, 0.5))
-        self.coefficient_bl = 1.0
-        self.pmatrix = None
-        self.log_likelihood_vector = None
-        self.log_likelihood = None
-        self.likelihood_vector = None
-        self.likelihood = None
         self.sequence_likelihood = 1.0
-        self.up_vector = None
-        self.down_vector = None
-        self.marginal_vector = None
-        self.marginal_bl_vector = None
-        self.probability_vector = None
-        self.branch_probability_vector = None
-        self.probability_vector_gain = None
-        self.probability_vector_loss = None
         self.sequence = ''
-        self.probabilities_sequence_characters = None
         self.ancestral_sequence = ''
         self.aliases = dict()
+        self.tree = None
+        self.index = 0
+
+    def __getattr__(self, name: str) -> Any:
+        if name != 'pmatrix' and name not in Node.vector_attributes:
+            raise AttributeError(f"'Node' object has no attribute '{name}'")
+        compiled_tree = None if self.tree is None else self.tree.compiled_tree
+
+        return None if compiled_tree is None else compiled_tree.get_node_attribute(name, self.index)
+
+    def __getstate__(self) -> Dict[str, Any]:
+
+        return {name: getattr(self, name) for name in Node.__slots__ if name != 'tree'}
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.tree = None
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    @property
+    def alphabet(self) -> Tuple[str, ...]:
+
+        return self.get_model_value('alphabet', default_alphabet)
+
+    @property
+    def pi_1(self) -> Union[float, np.float64]:
+
+        return self.get_model_value('pi_1', 0.5)
+
+    @property
+    def frequency(self) -> Optional[np.ndarray]:
+
+        return self.get_model_value('frequency', default_frequency)
+
+    @property
+    def coefficient_bl(self) -> Union[float, np.float64, int]:
+
+        return self.get_model_value('coefficient_bl', 1.0)
+
+    @property
+    def pattern_index(self) -> Optional[np.ndarray]:
+
+        return self.get_model_value('pattern_index', None)
+
+    def get_model_value(self, name: str, default: Any) -> Any:
+
+        return default if self.tree is None or self.tree.frequency is None else getattr(self.tree, name)
 
     def __str__(self) -> str:
         return self.get_name(True)
@@ -93,7 +160,7 @@ class Node:
                 'distance_to_nearest', 'distance_to_father_taking_into_coefficient',
                 'distance_to_root_taking_into_coefficient', 'distance_to_root_vector_taking_into_coefficient',
                 'distance_to_nearest_taking_into_coefficient', 'level', 'levels_to_nearest', 'alphabet', 'pi_1',
-                'frequency', 'coefficient_bl', 'pmatrix', 'log_likelihood_vector', 'log_likelihood',
+                'frequency', 'coefficient_bl', 'pattern_index', 'pmatrix', 'log_likelihood_vector', 'log_likelihood',
                 'sequence_likelihood', 'likelihood', 'up_vector', 'down_vector', 'marginal_vector',
                 'marginal_bl_vector', 'probability_vector', 'branch_probability_vector', 'probability_vector_gain',
                 'probability_vector_loss', 'sequence', 'probabilities_sequence_characters', 'ancestral_sequence',
@@ -120,10 +187,6 @@ class Node:
             list: A list of descendant nodes from a given node, including the node itself or a list of dictionaries
             with information about these nodes.
         """
-        list_result = []
-        mode = 'pre-order' if mode is None or mode.lower() not in ('pre-order', 'in-order', 'post-order', 'level-order'
-                                                                   ) else mode.lower()
-
         def resolve_item(trees_node: 'Node') -> Union[str, 'Node', Dict[str, Any]]:
             if only_node_list:
                 return trees_node
@@ -131,180 +194,127 @@ class Node:
                 return trees_node.get_node_info()
             return trees_node.name
 
-        def get_list(trees_node: Node) -> None:
-            nonlocal list_result, filters, mode
-
-            if trees_node.check_filter_compliance(filters):
-                list_item = resolve_item(trees_node)
-                if mode == 'pre-order':
-                    list_result.append(list_item)
+        return [resolve_item(trees_node) for trees_node in self.get_traversal(mode) if
+                trees_node.check_filter_compliance(filters)]
 
-                for i, child in enumerate(trees_node.children):
-                    get_list(child)
-                    if mode == 'in-order' and not i:
-                        list_result.append(list_item)
-
-                if not trees_node.children:
-                    if mode == 'in-order':
-                        list_result.append(list_item)
-
-                if mode == 'post-order':
-                    list_result.append(list_item)
-            else:
-                for child in trees_node.children:
-                    get_list(child)
+    def get_traversal(self, mode: Optional[str] = None) -> List['Node']:
+        """
+        Traverse the subtree of the node without recursion.
 
+        Args:
+            mode (str, optional): None (default), 'pre-order', 'in-order', 'post-order', 'level-order'.
+        Returns:
+            list: A list of descendant nodes from a given node, including the node itself, in the order of `mode`.
+        """
+        mode = self.get_mode(mode)
+        list_result = []
         if mode == 'level-order':
-            nodes_list = [self]
+            list_result.append(self)
+            for trees_node in list_result:
+                list_result.extend(trees_node.children)
+        elif mode == 'in-order':
+            nodes_list = [(self, False)]
             while nodes_list:
-                newick_node = nodes_list.pop(0)
-                if newick_node.check_filter_compliance(filters):
-                    list_result.append(resolve_item(newick_node))
-
-                for nodes_child in newick_node.children:
-                    nodes_list.append(nodes_child)
+                trees_node, is_visited = nodes_list.pop()
+                if is_visited or not trees_node.children:
+                    list_result.append(trees_node)
+                else:
+                    nodes_list.extend((child, False) for child in reversed(trees_node.children[1:]))
+                    nodes_list.append((trees_node, True))
+                    nodes_list.append((trees_node.children[0], False))
         else:
-            get_list(self)
+            nodes_list = [self]
+            while nodes_list:
+                trees_node = nodes_list.pop()
+                list_result.append(trees_node)
+                nodes_list.extend(trees_node.children if mode == 'post-order' else reversed(trees_node.children))
+            if mode == 'post-order':
+                list_result.reverse()
 
         return list_result
 
-    def get_node_info(self) -> Dict[str, Union[float, np.float64, bool, str, np.ndarray, List[float],
-                                    List[np.float64]]]:
-
-        result = {'node': self.name,
-                  'distance': self.distance_to_father,
-                  'distance_taking_into_coefficient': self.distance_to_father_taking_into_coefficient,
-                  'distance_to_root': self.distance_to_root,
-                  'distance_to_root_taking_into_coefficient': self.distance_to_root_taking_into_coefficient,
-                  'distance_to_nearest': self.distance_to_nearest,
-                  'distance_to_nearest_taking_into_coefficient': self.distance_to_nearest_taking_into_coefficient,
-                  'level': self.level,
-                  'levels_to_nearest': self.levels_to_nearest,
-                  'node_type': self.node_type,
-                  'father_name': self.father.name if self.father else '',
-                  'full_distance': self.distance_to_root_vector,
-                  'full_distance_taking_into_coefficient': self.distance_to_root_vector_taking_into_coefficient,
-                  'children': [i.name for i in self.children],
-                  'up_vector': self.up_vector,
-                  'down_vector': self.down_vector,
-                  'likelihood': self.likelihood,
-                  'sequence_likelihood': self.sequence_likelihood,
-                  'log_likelihood': self.log_likelihood,
-                  'log_likelihood_vector': self.log_likelihood_vector,
-                  'marginal_vector': self.marginal_vector,
-                  'marginal_bl_vector': self.marginal_bl_vector,
-                  'probability_vector': self.probability_vector,
-                  'sequence': self.sequence,
-                  'probabilities_sequence_characters': self.probabilities_sequence_characters,
-                  'ancestral_sequence': self.ancestral_sequence,
-                  'branch_probability_vector': self.branch_probability_vector,
-                  'probability_vector_gain': self.probability_vector_gain,
-                  'probability_vector_loss': self.probability_vector_loss,
-                  'alphabet': self.alphabet,
-                  'pi_1': self.pi_1,
-                  'frequency': self.frequency,
-                  'coefficient_bl': self.coefficient_bl,
-                  'pmatrix': self.pmatrix}
-
-        return loads(dumps(result, cls=NpEncoder))
-
-    def get_node_by_name(self, node_name: str) -> Optional['Node']:
-        if node_name == self.name:
-            return self
-        else:
-            for child in self.children:
-                newick_node = child.get_node_by_name(node_name)
-                if newick_node:
-                    return newick_node
-        return None
-
-    def get_pmatrix(self, rate: Union[float, np.float64, np.ndarray] = 1.0):
-
-        return self.get_one_parameter_pmatrix(rate)
-
-    def calculate_up(self, rate_vector_length: int, alphabet_length: int, msa_length: int) -> None:
-        total_up = np.ones((rate_vector_length, alphabet_length, msa_length))
+    @staticmethod
+    def get_mode(mode: Optional[str] = None) -> str:
 
-        for child in self.children:
-            child_contribution = np.einsum('rji,ril->rjl', child.pmatrix, child.up_vector)
+        return 'pre-order' if mode is None or mode.lower() not in ('pre-order', 'in-order', 'post-order',
+                                                                   'level-order') else mode.lower()
 
-            total_up *= child_contribution
+    def get_node_info(self, keys: Optional[Sequence[str]] = None
+                      ) -> Dict[str, Union[float, np.float64, bool, str, np.ndarray, List[float], List[np.float64]]]:
+        """
+        Collect the information about the node as JSON compatible values.
 
-        self.up_vector = total_up
+        Args:
+            keys (Sequence, optional): The keys of `Node.info_keys` to collect, all of them by default (None).
+        Returns:
+            dict: The requested keys with their values, arrays are converted to lists.
+        """
+        result = {key: self.get_info_value(key) for key in (Node.info_keys if keys is None else keys)}
 
-        weighted_vector = self.up_vector * self.frequency[:, np.newaxis]
+        return loads(dumps(result, cls=NpEncoder))
 
-        likelihood_per_site = np.sum(np.mean(weighted_vector, axis=0), axis=0)
+    def get_info_value(self, key: str) -> Any:
+        """
+        Get the raw value of one key of the node information.
 
-        # invalid_mask = (likelihood_per_site == 0.0) | np.isnan(likelihood_per_site) | np.isinf(likelihood_per_site)
-        invalid_mask = (likelihood_per_site <= 0.0) | np.isnan(likelihood_per_site)
-        likelihood_per_site = np.where(invalid_mask, eps, likelihood_per_site)
+        The value is taken directly from the node fields (or the arrays of the compiled tree) without JSON encoding, so
+        table builders only pay for the columns they export.
 
-        self.likelihood_vector = likelihood_per_site
-        self.likelihood = np.prod(likelihood_per_site)
-        self.log_likelihood_vector = np.log(likelihood_per_site)
-        self.log_likelihood = np.sum(self.log_likelihood_vector)
+        Args:
+            key (str): One of `Node.info_keys`.
+        Returns:
+            Any: The value of the key, the pattern vectors are expanded to the sites and the up, down and marginal
+                vectors are unscaled.
+        """
+        if key == 'father_name':
+            return self.father.name if self.father else ''
+        if key == 'children':
+            return [i.name for i in self.children]
+        if key in Node.scaled_keys:
+            return self.expand_patterns(self.get_unscaled_vector(key))
+        if key in Node.pattern_keys:
+            return self.expand_patterns(getattr(self, key))
 
-    def calculate_down(self, rate_vector_length: int, alphabet_length: int, msa_length: int) -> None:
-        total_down = np.ones((rate_vector_length, alphabet_length, msa_length))
-        if not self.father:
-            self.down_vector = total_down
+        return getattr(self, Node.info_attributes.get(key, key))
 
-        else:
-            brothers = [b for b in self.father.children if b != self]
-            for brother in brothers:
-                brother_contrib = np.einsum('rji,ril->rjl', brother.pmatrix, brother.up_vector)
-                total_down *= brother_contrib
+    def get_unscaled_vector(self, attribute_name: str) -> Optional[np.ndarray]:
+        """
+        The up, down or marginal vector of the node without the power-of-two scaling of the compiled tree (see
+        `CompiledTree.get_node_unscaled_vector`). A vector assigned to the node is returned as it is.
 
-            if self.father.father:
-                father_contrib = np.einsum('rji,ril->rjl', self.father.pmatrix, self.father.down_vector)
-                total_down *= father_contrib
+        Args:
+            attribute_name (str): One of `Node.scaled_keys`.
+        Returns:
+            np.ndarray: The vector, None when it is not calculated.
+        """
+        try:
+            return object.__getattribute__(self, attribute_name)
+        except AttributeError:
+            compiled_tree = None if self.tree is None else self.tree.compiled_tree
 
-        # sum_vector = np.sum(accumulated_down, axis=-1, keepdims=True)
-        # self.down_vector2 = accumulated_down + 1e-300
-        self.down_vector = total_down
+            return None if compiled_tree is None else compiled_tree.get_node_unscaled_vector(attribute_name,
+                                                                                             self.index)
 
-    def calculate_marginal(self, rate_vector_length: int, msa_length: int) -> None:
-        marg = np.einsum('i,rij,ril->rjl', self.frequency, self.pmatrix, self.down_vector)
+    def get_node_by_name(self, node_name: str) -> Optional['Node']:
 
-        self.marginal_vector = self.up_vector * marg
-        self.marginal_bl_vector = np.einsum('i,ril,rij,rjl->rjil', self.frequency, self.down_vector,
-                                            self.pmatrix, self.up_vector)
+        return next((newick_node for newick_node in self.get_traversal() if newick_node.name == node_name), None)
 
-        likelihoods = np.sum(self.marginal_vector, axis=(0, 1)) / rate_vector_length
-        invalid_mask = (likelihoods == 0.0) | np.isnan(likelihoods) | np.isinf(likelihoods)
-        likelihoods = np.where(invalid_mask, eps, likelihoods)
-        summed_marginal = np.sum(self.marginal_vector, axis=0)
-        summed_marginal_bl = np.sum(self.marginal_bl_vector, axis=0)
-        current_branch_prob = summed_marginal_bl / (rate_vector_length * likelihoods[None, None, :])
+    def get_pmatrix(self, rate: Union[float, np.float64, np.ndarray] = 1.0):
 
-        self.probability_vector = (summed_marginal / (rate_vector_length * likelihoods)).T
-        self.branch_probability_vector = current_branch_prob.transpose(2, 0, 1).reshape(msa_length, -1)
-        self.probability_vector_loss = self.branch_probability_vector[:, 1]
-        self.probability_vector_gain = self.branch_probability_vector[:, 2]
+        return self.get_one_parameter_pmatrix(rate)
 
-        max_indices = np.argmax(self.probability_vector, axis=1)
-        reconstructed_chars = np.array(self.alphabet)[max_indices]
+    def expand_patterns(self, vector: Optional[np.ndarray], axis: int = -1) -> Optional[np.ndarray]:
 
-        self.probabilities_sequence_characters = self.probability_vector[np.arange(msa_length), max_indices]
-        self.sequence = ''.join(reconstructed_chars)
+        return vector if vector is None or self.pattern_index is None else np.take(vector, self.pattern_index, axis)
 
     def clean_all(self):
-        self.log_likelihood_vector = None
-        self.log_likelihood = None
-        self.likelihood_vector = None
-        self.likelihood = None
+        for attribute_name in Node.vector_attributes:
+            try:
+                delattr(self, attribute_name)
+            except AttributeError:
+                pass
         self.sequence_likelihood = 1.0
-        self.up_vector = None
-        self.down_vector = None
-        self.marginal_vector = None
-        self.marginal_bl_vector = None
-        self.probability_vector = None
-        self.branch_probability_vector = None
-        self.probability_vector_gain = None
-        self.probability_vector_loss = None
         self.sequence = ''
-        self.probabilities_sequence_characters = None
         self.ancestral_sequence = ''
 
     def get_one_parameter_pmatrix(self, rate: Union[float, np.float64, np.ndarray] = 1.0) -> np.ndarray:
@@ -382,6 +392,37 @@ class Node:
         if distance_to_father is not None:
             child.distance_to_father = distance_to_father
 
+    @property
+    def distance_to_root_vector(self) -> List[Union[float, np.float64]]:
+
+        return self.get_path_vector('distance_to_father')
+
+    @property
+    def distance_to_root_vector_taking_into_coefficient(self) -> List[Union[float, np.float64]]:
+
+        return self.get_path_vector('distance_to_father_taking_into_coefficient')
+
+    def get_path_vector(self, attribute: str) -> List[Union[float, np.float64]]:
+        """
+        Collect a branch attribute along the path from the root to the node.
+
+        The path vectors are not stored on the nodes, they are built from the fathers when an exporter asks for them.
+
+        Args:
+            attribute (str): The branch attribute, e.g. `distance_to_father`.
+        Returns:
+            list: `0.0` for the root followed by the attribute of every branch on the path, from the root down.
+        """
+        list_result = []
+        newick_node = self
+        while newick_node.father is not None:
+            list_result.append(getattr(newick_node, attribute))
+            newick_node = newick_node.father
+        list_result.append(0.0)
+        list_result.reverse()
+
+        return list_result
+
     def get_full_distance_to_father(self, return_list: bool = False) -> Union[List[float], float]:
         list_result = []
         father = self
@@ -391,16 +432,6 @@ class Node:
         result = [i['distance'] for i in list_result]
         return result if return_list else sum(result)
 
-    def set_levels_and_distance_to_nearest(self) -> None:
-        nodes_info_list = self.get_list_nodes_info(filters={'node_type': ['leaf']}, only_node_list=True)
-        levels_list = []
-        distance_list = []
-        for newick_node in nodes_info_list:
-            levels_list.append(round(newick_node.level - self.level))
-            distance_list.append(round(newick_node.distance_to_root - self.distance_to_root, 14))
-        self.levels_to_nearest = min(levels_list)
-        self.distance_to_nearest = min(distance_list)
-
     def get_filter_value(self, key: str) -> Any:
         if key == 'father_name':
             return self.father.name if self.father else ''
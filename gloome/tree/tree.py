@@ -8,19 +8,32 @@ from shutil import rmtree
 from json import loads, dumps
 from pathlib import Path
 from d3blocks import D3Blocks
-from typing import Optional, List, Union, Dict, Tuple, Set, Any, Callable
+from typing import Optional, List, Union, Dict, Tuple, Set, Any, Callable, Sequence
 from Bio import Phylo
 from Bio.Phylo.NewickIO import Writer
-from numpy import ndarray, dtype, void
-from scipy.stats import gamma, pearsonr, distributions
+from scipy.stats import gamma, pearsonr, distributions, beta
 from scipy.special import gammainc
-from scipy.optimize import minimize_scalar
+from scipy.sparse import csr_matrix
+from scipy.optimize import minimize_scalar, minimize
 from io import StringIO
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor
 
 from .node import Node
 from .npencoder import NpEncoder
+from .compiled_tree import CompiledTree
 
 eps = 5e-324
+simulation_block_size = 2 ** 21
+correlation_block_size = 2 ** 22
+projection_length = 256
+projection_recall = 0.99
+sequential_batch_length = 10
+sequential_extreme_limit = 10
+sequential_error_probability = 1e-3
+simulation_arguments: Dict[str, Any] = {}
+optimization_grid = {'pi_1': np.asarray((0.2, 0.5, 0.8)), 'alpha': np.asarray((0.3, 1.0, 3.0)),
+                     'coefficient_bl': np.asarray((0.5, 1.0, 2.0))}
 
 
 class Tree:
@@ -32,6 +45,7 @@ class Tree:
     categories_quantity: Optional[int] = None
     pi_1: Optional[Union[float, np.float64, int]] = None
     coefficient_bl: Optional[Union[float, np.float64, int]] = 1,
+    frequency: Optional[np.ndarray] = None
     log_likelihood_vector: Optional[np.ndarray] = None
     log_likelihood: Optional[Union[float, np.float64]] = None
     likelihood_vector: Optional[np.ndarray] = None
@@ -46,9 +60,32 @@ class Tree:
     nodes_objects: Optional[List[Node]] = None
     nodes_objects_post_order: Optional[List[Node]] = None
     leaves_objects: Optional[List[Node]] = None
+    traversals: Dict[str, List[Node]]
+    node_types: Dict[str, np.ndarray]
+    compiled_tree: Optional[CompiledTree] = None
     alphabet_length: int
     msa_length: int
     rate_vector_length: int
+    patterns_length: int
+    pattern_index: Optional[np.ndarray] = None
+    pattern_weights: Optional[np.ndarray] = None
+    pattern_columns: Optional[np.ndarray] = None
+    is_streaming_marginal: bool = False
+    is_float32_probability: bool = False
+    site_block_size: int = 0
+    threads: int = 1
+    processes: int = 1
+    seed: Optional[int] = None
+    is_sequential_simulation: bool = False
+    false_discovery_rate: float = 0.05
+    simulated_datasets_quantity: int = 0
+    correlation_threshold: float = 0.0
+    is_float32_correlation: bool = False
+    is_approximate_correlation: bool = False
+    query_positions: Tuple[int, ...] = ()
+    screen_threshold: float = 0.0
+    optimization_ftol: float = 1e-10
+    optimization_gtol: float = 1e-6
 
     def __init__(self, data: Optional[Union[str, Node]] = None, node_name: Optional[str] = None, **kwargs) -> None:
         """
@@ -66,10 +103,30 @@ class Tree:
             is_optimize_pi_average (bool, optional): `None` (default)
             is_optimize_alpha (bool, optional): `None` (default)
             is_optimize_bl (bool, optional): `None` (default)
+            is_optimize_branch_lengths (bool, optional): `None` (default)
+            is_streaming_marginal (bool, optional): `None` (default)
+            is_float32_probability (bool, optional): `None` (default)
+            site_block_size (int, optional): `None` (default)
+            threads (int, optional): `None` (default)
+            processes (int, optional): `None` (default)
+            is_sequential_simulation (bool, optional): `None` (default)
+            false_discovery_rate (float, optional): `None` (default)
+            correlation_threshold (float, optional): `None` (default)
+            is_float32_correlation (bool, optional): `None` (default)
+            is_approximate_correlation (bool, optional): `None` (default)
+            query_positions (Union[str, Sequence[int]], optional): `None` (default)
+            screen_threshold (float, optional): `None` (default)
+            optimization_ftol (float, optional): `None` (default)
+            optimization_gtol (float, optional): `None` (default)
+            seed (int, optional): `None` (default)
         """
         available_parameters = {'data', 'node_name', 'msa', 'categories_quantity', 'alpha', 'beta', 'pi_0', 'pi_1',
                                 'coefficient_bl', 'is_optimize_pi', 'is_optimize_pi_average', 'is_optimize_alpha',
-                                'is_optimize_bl', 'seed'}
+                                'is_optimize_bl', 'is_optimize_branch_lengths', 'is_streaming_marginal',
+                                'is_float32_probability', 'site_block_size', 'threads', 'processes',
+                                'is_sequential_simulation', 'false_discovery_rate', 'correlation_threshold',
+                                'is_float32_correlation', 'is_approximate_correlation', 'query_positions',
+                                'screen_threshold', 'optimization_ftol', 'optimization_gtol', 'seed'}
         invalid_parameters = set(kwargs.keys()) - available_parameters
         for key in invalid_parameters:
             del kwargs[key]
@@ -79,21 +136,21 @@ class Tree:
             self.newick_to_tree(data)
             if node_name and isinstance(node_name, str):
                 self.rename_nodes(self, node_name)
-        elif isinstance(data, Node):
-            self.root = data
         else:
-            self.root = Node('root')
-
-        self.all_nodes_objects = self.get_all_nodes()
-        self.all_nodes = {current_node.name: current_node for current_node in self.all_nodes_objects}
-        self.nodes_objects = self.get_nodes()
-        self.nodes_objects_post_order = self.get_nodes(mode='post-order')
-        self.leaves_objects = self.get_leaves()
+            self.root = data if isinstance(data, Node) else Node('root')
+            self.set_topology()
 
         self.msa = self.alphabet = self.categories_quantity = self.alpha = None
         self.rate_vector = (1.0, )
         self.rate_vector_length = 1
-        self.pi_1, self.coefficient_bl = None, 1
+        self.pi_1, self.coefficient_bl, self.frequency = None, 1, None
+        self.pattern_index = self.pattern_weights = self.pattern_columns = None
+        self.is_streaming_marginal = self.is_float32_probability = False
+        self.site_block_size, self.threads, self.processes, self.seed = 0, 1, 1, None
+        self.is_sequential_simulation, self.false_discovery_rate, self.simulated_datasets_quantity = False, 0.05, 0
+        self.correlation_threshold, self.is_float32_correlation, self.is_approximate_correlation = 0.0, False, False
+        self.query_positions, self.screen_threshold = (), 0.0
+        self.optimization_ftol, self.optimization_gtol = 1e-10, 1e-6
         self.log_likelihood_vector = self.likelihood_vector = self.correlation_vector = self.posterior_rates = None
         self.log_likelihood = self.likelihood = 0.0
 
@@ -114,7 +171,9 @@ class Tree:
                 'log_likelihood_vector', 'log_likelihood', 'likelihood_vector', 'likelihood', 'posterior_rates',
                 'correlation_vector', 'calculated_ancestor_sequence', 'calculated_tree', 'calculated_likelihood',
                 'all_nodes', 'all_nodes_objects', 'nodes_objects', 'nodes_objects_post_order', 'leaves_objects',
-                'alphabet_length', 'msa_length', 'rate_vector_length']
+                'compiled_tree', 'alphabet_length', 'msa_length', 'rate_vector_length', 'patterns_length', 'pattern_index',
+                'pattern_weights', 'is_streaming_marginal', 'is_float32_probability', 'site_block_size',
+                'threads', 'optimization_ftol', 'optimization_gtol']
 
     def __dict__(self) -> Dict[str, Optional[Union[Node, float, np.float64, int, np.ndarray, bool, Tuple[str, ...],
                                Tuple[Union[float, np.float64, int], ...], Dict[str, str], List[Node]]]]:
@@ -141,9 +200,19 @@ class Tree:
                 'nodes_objects': self.nodes_objects,
                 'nodes_objects_post_order': self.nodes_objects_post_order,
                 'leaves_objects': self.leaves_objects,
+                'compiled_tree': self.compiled_tree,
                 'alphabet_length': self.alphabet_length,
                 'msa_length': self.msa_length,
-                'rate_vector_length': self.rate_vector_length}
+                'rate_vector_length': self.rate_vector_length,
+                'patterns_length': self.patterns_length,
+                'pattern_index': self.pattern_index,
+                'pattern_weights': self.pattern_weights,
+                'is_streaming_marginal': self.is_streaming_marginal,
+                'is_float32_probability': self.is_float32_probability,
+                'site_block_size': self.site_block_size,
+                'threads': self.threads,
+                'optimization_ftol': self.optimization_ftol,
+                'optimization_gtol': self.optimization_gtol}
 
     def __len__(self) -> int:
 
@@ -180,6 +249,17 @@ class Tree:
         for key, value in items:
             print(f'{key}:\t{value}')
 
+    @staticmethod
+    def get_query_positions(query_positions: Union[str, Sequence[int]]) -> Tuple[int, ...]:
+        """
+        Sorted unique query positions (0-based, as in the result tables) of a comma or whitespace separated string
+        or a sequence of positions.
+        """
+        if isinstance(query_positions, str):
+            query_positions = [int(position) for position in re.split(r'[\s,]+', query_positions.strip()) if position]
+
+        return tuple(sorted({int(position) for position in query_positions}))
+
     def set_tree_data(self, msa: Optional[Union[Dict[str, str], str]] = None,
                       categories_quantity: Optional[int] = None,
                       alpha: Optional[float] = None,
@@ -191,10 +271,54 @@ class Tree:
                       is_optimize_pi_average: Optional[bool] = None,
                       is_optimize_alpha: Optional[bool] = None,
                       is_optimize_bl: Optional[bool] = None,
+                      is_optimize_branch_lengths: Optional[bool] = None,
+                      is_streaming_marginal: Optional[bool] = None,
+                      is_float32_probability: Optional[bool] = None,
+                      site_block_size: Optional[int] = None,
+                      threads: Optional[int] = None,
+                      processes: Optional[int] = None,
+                      is_sequential_simulation: Optional[bool] = None,
+                      false_discovery_rate: Optional[float] = None,
+                      correlation_threshold: Optional[float] = None,
+                      is_float32_correlation: Optional[bool] = None,
+                      is_approximate_correlation: Optional[bool] = None,
+                      query_positions: Optional[Union[str, Sequence[int]]] = None,
+                      screen_threshold: Optional[float] = None,
+                      optimization_ftol: Optional[float] = None,
+                      optimization_gtol: Optional[float] = None,
                       seed: Optional[int] = None) -> None:
 
         if seed is not None:
             np.random.seed(seed)
+            self.seed = seed
+        if is_streaming_marginal is not None:
+            self.is_streaming_marginal = bool(is_streaming_marginal)
+        if is_float32_probability is not None:
+            self.is_float32_probability = bool(is_float32_probability)
+        if site_block_size is not None:
+            self.site_block_size = int(site_block_size)
+        if threads is not None:
+            self.threads = max(int(threads), 1)
+        if processes is not None:
+            self.processes = max(int(processes), 1)
+        if is_sequential_simulation is not None:
+            self.is_sequential_simulation = bool(is_sequential_simulation)
+        if false_discovery_rate is not None:
+            self.false_discovery_rate = float(false_discovery_rate)
+        if correlation_threshold is not None:
+            self.correlation_threshold = float(correlation_threshold)
+        if is_float32_correlation is not None:
+            self.is_float32_correlation = bool(is_float32_correlation)
+        if is_approximate_correlation is not None:
+            self.is_approximate_correlation = bool(is_approximate_correlation)
+        if query_positions is not None:
+            self.query_positions = self.get_query_positions(query_positions)
+        if screen_threshold is not None:
+            self.screen_threshold = float(screen_threshold)
+        if optimization_ftol is not None:
+            self.optimization_ftol = float(optimization_ftol)
+        if optimization_gtol is not None:
+            self.optimization_gtol = float(optimization_gtol)
 
         if isinstance(msa, str):
             self.msa = self.get_msa_dict(msa)
@@ -209,29 +333,100 @@ class Tree:
 
         self.msa_length = len(next(iter(self.msa.values())))
         self.alphabet_length = len(self.alphabet)
+        self.set_site_patterns()
+        self.compiled_tree.set_patterns(self.pattern_index, self.pattern_weights)
 
         self.set_all(categories_quantity, alpha, beta, pi_0, pi_1, coefficient_bl)
 
-        self.optimize_coefficient_bl(is_optimize_bl)
-        self.optimize_pi(is_optimize_pi, is_optimize_pi_average)
-        self.optimize_alpha(is_optimize_alpha)
-
-        if (is_optimize_alpha or is_optimize_pi or is_optimize_pi_average) and is_optimize_bl:
+        if self.alphabet_length == 2:
+            self.optimize_pi(is_optimize_pi_average=is_optimize_pi_average)
+            self.optimize_parameters(is_optimize_pi, is_optimize_alpha, is_optimize_bl)
+        else:
             self.optimize_coefficient_bl(is_optimize_bl)
+            self.optimize_pi(is_optimize_pi, is_optimize_pi_average)
+            self.optimize_alpha(is_optimize_alpha)
+
+            if (is_optimize_alpha or is_optimize_pi or is_optimize_pi_average) and is_optimize_bl:
+                self.optimize_coefficient_bl(is_optimize_bl)
+
+        if is_optimize_bl and is_optimize_branch_lengths:
+            self.optimize_branch_lengths(is_optimize_branch_lengths)
+            if self.alphabet_length == 2:
+                self.optimize_parameters(is_optimize_pi, is_optimize_alpha)
+            else:
+                self.optimize_pi(is_optimize_pi)
+                self.optimize_alpha(is_optimize_alpha)
 
         self.set_all(categories_quantity=self.categories_quantity, alpha=self.alpha, pi_1=self.pi_1,
                      coefficient_bl=self.coefficient_bl)
         self.set_distance_taking_into_coefficient()
 
-    def set_distance_taking_into_coefficient(self) -> None:
+    def set_topology(self) -> None:
+        """
+        Cache the traversals of the tree.
+
+        The traversal orders, the node type columns and the name index are computed once per topology and answer
+        the node queries of the tree. Call it again after changing the structure of the tree.
+        """
+        self.traversals, self.node_types = {}, {}
+        self.all_nodes_objects = self.get_all_nodes()
+        self.all_nodes = {current_node.name: current_node for current_node in reversed(self.all_nodes_objects)}
+        self.nodes_objects = self.get_nodes()
+        self.nodes_objects_post_order = self.get_nodes(mode='post-order')
+        self.leaves_objects = self.get_leaves()
+        self.compiled_tree = CompiledTree(self.all_nodes_objects)
         for current_node in self.all_nodes_objects:
-            current_node.distance_to_father_taking_into_coefficient = (current_node.distance_to_father *
-                                                                       self.coefficient_bl)
-            current_node.distance_to_nearest_taking_into_coefficient = (current_node.distance_to_nearest *
-                                                                        self.coefficient_bl)
-            current_node.distance_to_root_taking_into_coefficient = current_node.distance_to_root * self.coefficient_bl
-            current_node.distance_to_root_vector_taking_into_coefficient = [i * self.coefficient_bl for i in
-                                                                            current_node.distance_to_root_vector]
+            current_node.tree = self
+        self.set_distances()
+
+    def set_distances(self) -> None:
+        """
+        Set the levels of all nodes and their distances to the root and to the nearest leaf from the branch lengths.
+        """
+        self.compiled_tree.set_branch_length()
+        self.compiled_tree.set_distances()
+        for current_node, depth, distance_to_root, distance_to_nearest, levels_to_nearest in zip(
+                self.compiled_tree.nodes, self.compiled_tree.depth.tolist(),
+                self.compiled_tree.distance_to_root.tolist(), self.compiled_tree.distance_to_nearest.tolist(),
+                self.compiled_tree.levels_to_nearest.tolist()):
+            current_node.level = depth + 1
+            current_node.distance_to_root = distance_to_root
+            current_node.distance_to_nearest = distance_to_nearest
+            current_node.levels_to_nearest = levels_to_nearest
+
+    def get_traversal(self, mode: Optional[str] = None) -> List[Node]:
+        mode = Node.get_mode(mode)
+        if mode not in self.traversals:
+            self.traversals[mode] = self.root.get_traversal(mode)
+            self.node_types[mode] = np.asarray([current_node.node_type for current_node in self.traversals[mode]])
+
+        return self.traversals[mode]
+
+    def get_filter_mask(self, mode: Optional[str] = None, filters: Optional[Dict[str, List[Union[float, int, str,
+                        List[float]]]]] = None) -> np.ndarray:
+        nodes_list = self.get_traversal(mode)
+        if not filters:
+            return np.ones(len(nodes_list), dtype=bool)
+
+        mask = np.zeros(len(nodes_list), dtype=bool)
+        for key, values in filters.items():
+            if key == 'node_type':
+                mask |= np.isin(self.node_types[Node.get_mode(mode)], values)
+            else:
+                mask |= np.asarray([any(current_node.get_filter_value(key) == value for value in values) for
+                                    current_node in nodes_list], dtype=bool)
+
+        return mask
+
+    def set_distance_taking_into_coefficient(self) -> None:
+        compiled_tree = self.compiled_tree
+        for current_node, distance_to_father, distance_to_nearest, distance_to_root in zip(
+                compiled_tree.nodes, (compiled_tree.branch_length * self.coefficient_bl).tolist(),
+                (compiled_tree.distance_to_nearest * self.coefficient_bl).tolist(),
+                (compiled_tree.distance_to_root * self.coefficient_bl).tolist()):
+            current_node.distance_to_father_taking_into_coefficient = distance_to_father
+            current_node.distance_to_nearest_taking_into_coefficient = distance_to_nearest
+            current_node.distance_to_root_taking_into_coefficient = distance_to_root
 
     def print_node_list(self, with_additional_details: bool = False, mode: Optional[str] = None,
                         filters: Optional[Dict[str, List[Union[float, int, str, List[float]]]]] = None) -> None:
@@ -255,11 +450,12 @@ class Tree:
             str_result = f'{str_result}\n{i}'
         print(str_result, '\n')
 
-    def get_tree_info(self, filters: Optional[Dict[str, List[Union[float, int, str, List[float]]]]] = None
-                      ) -> pd.Series:
-        nodes_info = self.get_list_nodes_info(True, filters=filters)
+    def get_tree_info(self, filters: Optional[Dict[str, List[Union[float, int, str, List[float]]]]] = None,
+                      keys: Optional[Sequence[str]] = None) -> pd.Series:
+        nodes_list = self.get_list_nodes_info(filters=filters, only_node_list=True)
 
-        return pd.Series([pd.Series(i) for i in nodes_info], index=[i.get('node') for i in nodes_info])
+        return pd.Series([pd.Series(current_node.get_node_info(keys)) for current_node in nodes_list],
+                         index=[current_node.name for current_node in nodes_list])
 
     def get_list_nodes_info(self, with_additional_details: bool = False, mode: Optional[str] = None, filters:
                             Optional[Dict[str, List[Union[float, int, str, List[float]]]]] = None, only_node_list:
@@ -281,7 +477,16 @@ class Tree:
             list: A list of all nodes of the tree or a list of dictionaries with information about these nodes.
         """
 
-        return self.root.get_list_nodes_info(with_additional_details, mode, filters, only_node_list)
+        nodes_list = self.get_traversal(mode)
+        if filters:
+            nodes_list = [current_node for current_node, is_compliant in zip(nodes_list, self.get_filter_mask(
+                          mode, filters)) if is_compliant]
+        if only_node_list:
+            return list(nodes_list)
+        if with_additional_details:
+            return [current_node.get_node_info() for current_node in nodes_list]
+
+        return [current_node.name for current_node in nodes_list]
 
     def get_leaves(self, only_node_list: bool = True, mode: Optional[str] = None) -> List[Union[Node, str]]:
 
@@ -306,11 +511,11 @@ class Tree:
 
     def get_node_count(self, filters: Optional[Dict[str, List[Union[float, int, str, List[float]]]]] = None) -> int:
 
-        return len(self.get_list_nodes_info(filters=filters, only_node_list=True))
+        return int(self.get_filter_mask(filters=filters).sum())
 
     def get_node_by_name(self, name: str) -> Optional[Node]:
 
-        return self.root.get_node_by_name(name)
+        return self.all_nodes.get(name)
 
     def get_newick(self, with_internal_nodes: bool = False,
                    decimal_length: int = 0,
@@ -348,7 +553,7 @@ class Tree:
             bool: `True` if a node with the specified name is found; `False` otherwise.
         """
 
-        return name in self.get_list_nodes_info()
+        return name in self.all_nodes
 
     def newick_to_tree(self, newick: str) -> Optional['Tree']:
         """
@@ -369,50 +574,53 @@ class Tree:
         newick = newick.replace(' ', '').strip()
         if newick.startswith('(') and newick.endswith(';'):
 
-            len_newick = len(newick)
-            list_end = [i for i in range(len_newick) if newick[i:i + 1] == ')']
-            list_start = [i for i in range(len_newick) if newick[i:i + 1] == '(']
-            list_children = []
-
+            tokens = re.split(r'([(),;])', newick)
             num = self.__counter()
-
-            while list_start:
-                int_start = list_start.pop(-1)
-                int_end = min([i for i in list_end if i > int_start]) + 1
-                list_end.pop(list_end.index(int_end - 1))
-                node_name = newick[int_end: min([x for x in [newick.find(':', int_end), newick.find(',', int_end),
-                                                 newick.find(';', int_end), newick.find(')', int_end)] if x >= 0])]
-                distance_to_father = newick[int_end + len(node_name): min([x for x in [newick.find(',', int_end),
-                                                                          newick.find(';', int_end), newick.find(')',
-                                                                          int_end)] if x >= 0])]
-
-                (visibility, node_name) = (True, node_name) if node_name else (False, 'nd' + str(num()).rjust(4, '0'))
-
-                sub_str = newick[int_start:int_end]
-                list_children.append({'children': sub_str, 'node': node_name, 'distance_to_father': distance_to_father,
-                                      'visibility': visibility})
-
-            list_children.sort(key=lambda x: len(x.get('children')), reverse=True)
-            for i in range(len(list_children)):
-                for j in range(i + 1, len(list_children)):
-                    node_name = list_children[j].get('node') if list_children[j].get('visibility') else ''
-                    list_children[i].update({'children': list_children[i].get('children').replace(
-                        list_children[j].get('children') + node_name, list_children[j].get('node'))})
-            for dict_children in list_children:
-                if list_children.index(dict_children):
-                    newick_node = self.get_node_by_name(dict_children.get('node'))
-                else:
-                    newick_node = self.__set_node(
-                        f'{dict_children.get("node")}{dict_children.get("distance_to_father")}', num)
-                    newick_node.distance_to_root_vector = [0.0]
-                    newick_node.level = 1
-                    self.root = newick_node
-                self.__set_children_list_from_string(dict_children.get('children'), newick_node, num)
-            for current_node in self.get_list_nodes_info(only_node_list=True):
-                current_node.set_levels_and_distance_to_nearest()
-                current_node.aliases = {'node': 'name', 'distance': 'distance_to_father'}
+            nodes_list, fathers_list, spans, stack = [], [], {}, []
+            position = len(tokens[0])
+
+            for i in range(1, len(tokens), 2):
+                delimiter, label = tokens[i], tokens[i + 1]
+                if delimiter == ';':
+                    break
+                if delimiter == ')':
+                    newick_node = stack.pop()
+                    newick_node.name, newick_node.distance_to_father = self.__get_label(label)
+                    spans[newick_node] = position - spans[newick_node] + 1
+                elif delimiter == '(':
+                    newick_node = Node('')
+                    newick_node.node_type = 'node' if stack else 'root'
+                    if stack:
+                        stack[-1].add_child(newick_node)
+                    else:
+                        self.root = newick_node
+                    nodes_list.append(newick_node)
+                    fathers_list.append(newick_node)
+                    spans[newick_node] = position
+                    stack.append(newick_node)
+                if delimiter != ')' and tokens[i + 2] != '(':
+                    newick_node = Node('')
+                    newick_node.name, newick_node.distance_to_father = self.__get_label(label.strip())
+                    newick_node.node_type = 'leaf'
+                    stack[-1].add_child(newick_node)
+                    nodes_list.append(newick_node)
+                position += len(delimiter) + len(label)
+
+            for newick_node in reversed(fathers_list):
+                if not newick_node.name:
+                    newick_node.name = 'nd' + str(num()).rjust(4, '0')
+            if any(not newick_node.name for newick_node in nodes_list):
+                for father in sorted(reversed(fathers_list), key=lambda x: spans[x], reverse=True):
+                    for newick_node in father.children:
+                        if not newick_node.name:
+                            newick_node.name = 'nd' + str(num()).rjust(4, '0')
+
+            aliases = {'node': 'name', 'distance': 'distance_to_father'}
+            for current_node in nodes_list:
+                current_node.aliases = aliases
                 if current_node.node_type in ('node', ) and self.is_bootstrap_value(current_node.name):
                     current_node.name = 'nd' + str(num()).rjust(4, '0')
+            self.set_topology()
 
             return self
 
@@ -448,35 +656,35 @@ class Tree:
 
         return list_result
 
-    def __set_children_list_from_string(self, str_children: str, father: Node, num) -> None:
-        str_children = str_children[1:-1] if str_children.startswith('(') and str_children.endswith(
-            ')') else str_children
-        lst_nodes = str_children.split(',')
-        father.node_type = 'node' if father.father else 'root'
-        for str_node in lst_nodes:
-            newick_node = self.__set_node(str_node.strip(), num)
-            newick_node.node_type = 'leaf'
-            newick_node.father = father
-            newick_node.distance_to_root_vector = father.distance_to_root_vector.copy()
-            newick_node.level = father.level + 1
-            newick_node.distance_to_root_vector.append(newick_node.distance_to_father)
-            newick_node.distance_to_root = round(sum(newick_node.distance_to_root_vector), 14)
-            father.add_child(newick_node)
-
     def check_tree_for_binary(self) -> bool:
-        nodes_list = self.get_list_nodes_info(True)
-        for current_node in nodes_list:
-            for key in current_node.keys():
-                if key == 'children' and len(current_node.get(key)) > 2:
-                    return False
 
-        return True
+        return all(len(current_node.children) <= 2 for current_node in self.get_traversal())
 
     def tree_to_table(self, sort_values_by: Optional[Tuple[str, ...]] = None, decimal_length: int = 8, columns: Optional
                       [Dict[str, str]] = None, filters: Optional[Dict[str, List[Union[float, int, str, List[float]]]]] =
                       None, distance_type: type = str, list_type: type = str, lists: Optional[Tuple[str, ...]] = None,
                       taking_into_coefficient: bool = True, decimals: int = 4) -> pd.DataFrame:
-        nodes_info = self.get_list_nodes_info(True, None, filters)
+        """
+        Build a table of the tree nodes.
+
+        The table is built column by column: only the keys of `columns` are read from the nodes (or the arrays of the
+        compiled tree) and the numeric list columns are rounded at once, so the other node information is never
+        encoded.
+
+        Args:
+            sort_values_by (Tuple, optional): The column names to sort the table by.
+            decimal_length (int, optional): The width of the distances when `distance_type` is `str`, 8 (default).
+            columns (Dict, optional): The keys of `Node.info_keys` mapped to the column names.
+            filters (Dict, optional): The node filters, e.g. {'node_type': ['leaf']}.
+            distance_type (type, optional): The type of the distance to parent, `str` (default).
+            list_type (type, optional): The type of the list columns, `str` (default) joins the values with spaces.
+            lists (Tuple, optional): The keys whose values are lists.
+            taking_into_coefficient (bool, optional): `True` (default).
+            decimals (int, optional): The decimals of the values of the list columns, 4 (default).
+        Returns:
+            DataFrame: One row per node and one column per key of `columns`.
+        """
+        nodes_list = self.get_list_nodes_info(filters=filters, only_node_list=True)
 
         suffix = '_taking_into_coefficient' if taking_into_coefficient else ''
         distance_name = f'distance{suffix}'
@@ -514,25 +722,27 @@ class Tree:
                                      'probability_vector_loss')
         exceptions = ('sequence', 'ancestral_sequence')
 
-        for node_info in nodes_info:
-            for i in set(node_info.keys()) - set(columns.keys()):
-                node_info.pop(i)
-            if not node_info.get('father_name'):
-                node_info.update({'father_name': 'root'})
-            if columns.get(distance_name):
-                distance_value = node_info.pop(distance_name)
+        table_columns = {}
+        for key, column_name in columns.items():
+            if key not in Node.info_keys and not (column_name and key in lists):
+                continue
+            values = [current_node.get_info_value(key) if key in Node.info_keys else None for current_node in
+                      nodes_list]
+            if key == 'father_name':
+                values = [value if value else 'root' for value in values]
+            if column_name and key == distance_name:
                 if distance_type is str:
-                    distance_value = f'{distance_value:.10f}'.ljust(decimal_length, "0"
-                                                                    ) if distance_value else ' ' * decimal_length
+                    values = [f'{value:.10f}'.ljust(decimal_length, "0") if value else ' ' * decimal_length for value
+                              in values]
                 else:
-                    distance_value = distance_type(distance_value)
-                node_info.update({distance_name: distance_value})
-            for i in lists:
-                if columns.get(i):
-                    node_info.update({i: self.get_list_decimals(node_info.get(i), list_type, decimals,
-                                                                i in exceptions)})
-
-        tree_table = pd.DataFrame([i for i in nodes_info], index=None)
+                    values = [distance_type(value) for value in values]
+            elif column_name and key in lists:
+                values = self.get_column_decimals(values, list_type, decimals, key in exceptions)
+            else:
+                values = [self.get_json_value(value) for value in values]
+            table_columns.update({key: values})
+
+        tree_table = pd.DataFrame(table_columns, index=None)
         tree_table = tree_table.rename(columns=columns)
         tree_table = tree_table.reindex(columns=columns.values())
         if isinstance(list_type, (list, tuple, set)):
@@ -569,20 +779,21 @@ class Tree:
         return 'OK' if self.calculated_ancestor_sequence else ''
 
     def calculate_marginal(self) -> None:
-        for current_node in self.all_nodes_objects:
-            current_node.calculate_marginal(self.rate_vector_length, self.msa_length)
+        self.compiled_tree.calculate(self.alphabet, is_marginal=True, is_streaming=self.is_streaming_marginal,
+                                     probability_dtype=np.float32 if self.is_float32_probability else np.float64)
 
     def calculate_down(self) -> None:
-        for current_node in self.all_nodes_objects:
-            current_node.calculate_down(self.rate_vector_length, self.alphabet_length, self.msa_length)
+        self.compiled_tree.calculate(is_down=True)
 
     def calculate_up(self) -> None:
         self.initialize_leaf_up_vectors()
         self.initialize_node_up_vectors()
+        self.set_likelihood()
 
-        self.likelihood_vector = self.root.likelihood_vector
+    def set_likelihood(self) -> None:
+        self.likelihood_vector = self.expand_patterns(self.root.likelihood_vector)
         self.likelihood = self.root.likelihood
-        self.log_likelihood_vector = self.root.log_likelihood_vector
+        self.log_likelihood_vector = self.expand_patterns(self.root.log_likelihood_vector)
         self.log_likelihood = self.root.log_likelihood
 
         self.calculated_likelihood = True
@@ -594,43 +805,60 @@ class Tree:
         return self.log_likelihood
 
     def initialize_node_up_vectors(self) -> None:
-        for current_node in self.nodes_objects_post_order:
-            current_node.calculate_up(self.rate_vector_length, self.alphabet_length, self.msa_length)
+        self.compiled_tree.calculate()
 
-    def initialize_leaf_up_vectors(self) -> None:
-        for leaf in self.leaves_objects:
-            sequence = np.asarray(list(self.msa[leaf.name]))
-            up_vector = np.zeros((self.rate_vector_length, self.alphabet_length, self.msa_length), dtype=np.float64)
-            mask_0 = (sequence == '0')
-            mask_1 = (sequence == '1')
+    def initialize_leaf_up_vectors(self, threads: Optional[int] = None) -> None:
+        compiled_tree = self.compiled_tree
+        compiled_tree.allocate(self.rate_vector_length, self.alphabet_length, self.patterns_length,
+                               self.site_block_size, self.threads if threads is None else threads)
+        sequences = np.asarray([list(self.msa[compiled_tree.nodes[i].name]) for i in compiled_tree.leaves])
+        compiled_tree.set_leaf_up_vectors(sequences[:, self.pattern_columns], self.alphabet)
 
-            up_vector[:, 0, mask_0] = 1.0
-            up_vector[:, 1, mask_1] = 1.0
+    def set_site_patterns(self) -> None:
+        """
+        Collapse identical MSA columns into unique site patterns.
 
-            mask_gap = (sequence == '-') | (sequence == '?')
-            up_vector[:, :, mask_gap] = 1.0
+        Phyletic-pattern matrices usually contain many identical columns, so the up/down/marginal passes are run
+        once per unique pattern. `pattern_index` maps every MSA position to its pattern, `pattern_weights` holds the
+        multiplicity of every pattern and `pattern_columns` the first MSA position of every pattern.
+        """
+        msa_text = ''.join(self.msa[leaf.name] for leaf in self.leaves_objects)
+        msa_matrix = np.frombuffer(msa_text.encode(), dtype=np.uint8).reshape(-1, self.msa_length)
+        self.pattern_columns, self.pattern_index, self.pattern_weights = self.get_site_patterns(msa_matrix)
+        self.patterns_length = len(self.pattern_columns)
 
-            leaf.up_vector = up_vector
+    @staticmethod
+    def get_site_patterns(msa_matrix: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        _, pattern_columns, pattern_index, pattern_weights = np.unique(msa_matrix, axis=1, return_index=True,
+                                                                       return_inverse=True, return_counts=True)
+
+        return pattern_columns, pattern_index.reshape(-1), pattern_weights
+
+    def expand_patterns(self, vector: Optional[np.ndarray], axis: int = -1) -> Optional[np.ndarray]:
+
+        return vector if vector is None or self.pattern_index is None else np.take(vector, self.pattern_index, axis)
 
     def get_msa_dict(self, msa: str, alphabet: Optional[Union[Tuple[str, ...], str]] = None, only_leaves: bool = True
                      ) -> Dict[str, Union[Tuple[int, ...], str]]:
         node_types = ['leaf'] if only_leaves else ['leaf', 'node', 'root']
-        nodes_info = self.get_list_nodes_info(True, 'pre-order', {'node_type': node_types})
+        nodes_list = self.get_list_nodes_info(mode='pre-order', filters={'node_type': node_types},
+                                              only_node_list=True)
         msa_list = msa.strip().split()
         msa_list_size, msa_dict = len(msa_list), dict()
         if msa_list_size == 1:
-            for i, node_info in enumerate(nodes_info):
+            for i, current_node in enumerate(nodes_list):
                 if alphabet:
                     value = [0] * len(alphabet)
                     value[alphabet.index(msa[i])] = 1
                     value = tuple(value)
                 else:
                     value = msa[i]
-                msa_dict.update({node_info.get('node'): value})
+                msa_dict.update({current_node.name: value})
         else:
+            node_names = {current_node.name for current_node in nodes_list}
             for j in range(msa_list_size // 2):
                 node_name = msa_list[j + j][1::]
-                if self.find_dict_in_iterable(nodes_info, 'node', node_name):
+                if node_name in node_names:
                     value = msa_list[j + j + 1]
                     value = ''.join(value)
                     msa_dict.update({node_name: value})
@@ -646,9 +874,9 @@ class Tree:
         if self.msa and not self.calculated_tree:
             self.clean_all()
 
-            self.calculate_up()
-            self.calculate_down()
+            self.initialize_leaf_up_vectors()
             self.calculate_marginal()
+            self.set_likelihood()
 
             self.calculated_tree = True
 
@@ -749,17 +977,245 @@ class Tree:
         return file_name
 
     @staticmethod
-    def get_row_correlations(matrix: np.ndarray) -> np.ndarray:
-        centered = matrix - matrix.mean(axis=1, keepdims=True)
+    def get_correlated_pairs(matrix: np.ndarray, threshold: Optional[float] = None, dtype: type = np.float64,
+                             query: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Pearson correlations of the pairs of rows i < j of `matrix`, evaluated for stripes of rows against the rows
+        that follow them, so that at most `correlation_block_size` correlations are held at once instead of the full
+        correlation matrix.
+
+        Args:
+            matrix (np.ndarray): One variable per row, shape (variables, observations).
+            threshold (float, optional): Keep only the pairs with |r| >= threshold, `None` or 0 (default) keeps all
+                pairs.
+            dtype (type, optional): Floating point type of the computation. `np.float64` (default)
+            query (np.ndarray, optional): Rows whose pairs with all the rows are evaluated (one-vs-all), all the pairs
+                are evaluated if `None` (default).
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: Row indices i and j and correlations of the kept pairs, in the
+                order of `np.triu_indices`.
+        """
+        centered = np.asarray(matrix, dtype=dtype)
+        centered = centered - centered.mean(axis=1, keepdims=True)
         norms = np.sqrt((centered ** 2).sum(axis=1))
+        rows_length = len(centered)
+        rows = np.arange(rows_length) if query is None else np.unique(query)
+        is_query = np.zeros(rows_length, dtype=bool)
+        is_query[rows] = True
+        stripe_length = max(1, correlation_block_size // max(rows_length, 1))
+
+        i_list, j_list, r_list = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype)]
+        for start in range(0, len(rows), stripe_length):
+            current_rows = rows[start:start + stripe_length]
+            first = current_rows[0] if query is None else 0
+            columns = np.arange(first, rows_length)
+            current_centered = centered[start:start + stripe_length] if query is None else centered[current_rows]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                correlations = (current_centered @ centered[first:].T) / np.outer(norms[current_rows], norms[first:])
+            np.clip(correlations, -1.0, 1.0, out=correlations)
+            # a pair of two query rows is evaluated once, from its first row
+            mask = ((columns[None, :] > current_rows[:, None]) |
+                    ((columns[None, :] < current_rows[:, None]) & ~is_query[columns][None, :]))
+            if threshold:
+                mask &= np.abs(correlations) >= threshold
+            i, j = np.nonzero(mask)
+            i_list.append(np.minimum(current_rows[i], columns[j]))
+            j_list.append(np.maximum(current_rows[i], columns[j]))
+            r_list.append(correlations[i, j])
+
+        i, j, r_values = np.concatenate(i_list), np.concatenate(j_list), np.concatenate(r_list)
+        if query is not None:
+            order = np.lexsort((j, i))
+            i, j, r_values = i[order], j[order], r_values[order]
+
+        return i, j, r_values
+
+    @staticmethod
+    def get_approximate_pairs(matrix: np.ndarray, threshold: float, dtype: type = np.float64,
+                              random_generator: Optional[np.random.Generator] = None
+                              ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Pairs of rows i < j of `matrix` with a Pearson correlation of |r| >= threshold, searched with sign random
+        projections instead of all the pairs.
+
+        The centered rows are projected once on `projection_length` random directions. Every table hashes a row to
+        the signs of a random subset of `bits_length` of these projections, a row and its negation sharing a bucket,
+        so that correlated and anti-correlated rows collide with probability about
+        (1 - arccos(|r|) / pi) ** bits_length. The number of tables is chosen for a recall of `projection_recall` at
+        the threshold, `bits_length` for the least expected work, and the exact correlation is computed only for the
+        pairs colliding in some table.
 
-        return (centered @ centered.T) / np.outer(norms, norms)
+        Args:
+            matrix (np.ndarray): One variable per row, shape (variables, observations).
+            threshold (float): Minimal absolute correlation of the kept pairs.
+            dtype (type, optional): Floating point type of the computation. `np.float64` (default)
+            random_generator (np.random.Generator, optional): Generator of the projections. `None` (default)
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray]: Row indices i and j and correlations of the kept pairs, in the
+                order of `np.triu_indices`.
+        """
+        random_generator = np.random.default_rng() if random_generator is None else random_generator
+        normalized = Tree.get_normalized_rows(matrix, dtype)
+        valid = np.flatnonzero(normalized.any(axis=1))
+        rows_length, columns_length = normalized.shape
+        valid_length = len(valid)
+
+        collision = 1.0 - np.arccos(min(threshold, 1.0)) / np.pi
+        bits_range = np.arange(1, min(projection_length, 52) + 1)
+        with np.errstate(divide='ignore'):
+            tables_range = np.maximum(np.ceil(np.log1p(-projection_recall) / np.log1p(-collision ** bits_range)), 1)
+        costs = tables_range * (bits_range + np.log2(max(valid_length, 2)) +
+                                valid_length * columns_length * 0.5 ** bits_range)
+        bits_length = int(bits_range[np.argmin(costs)])
+        tables_length = int(tables_range[bits_length - 1]) if valid_length > 1 else 0
+        mask = (1 << bits_length) - 1
+        weights = 2.0 ** np.arange(bits_length)
+
+        projections = random_generator.standard_normal((projection_length, columns_length)) @ normalized[valid].T
+        signs = (projections > 0).astype(np.float64)  # Shape: (projection_length, valid rows)
+        pair_codes = [np.zeros(0, dtype=np.int64)]
+        for _ in range(tables_length):
+            codes = (weights @ signs[random_generator.choice(projection_length, bits_length, replace=False)]
+                     ).astype(np.int64)
+            keys = np.minimum(codes, codes ^ mask)
+            order = np.argsort(keys)
+            sorted_keys, order = keys[order], valid[order]
+            for offset in range(1, valid_length):
+                same = sorted_keys[offset:] == sorted_keys[:-offset]
+                if not same.any():
+                    break
+                first, second = order[:-offset][same], order[offset:][same]
+                pair_codes.append(np.minimum(first, second) * rows_length + np.maximum(first, second))
+
+        pair_codes = np.unique(np.concatenate(pair_codes))
+        i, j = pair_codes // rows_length, pair_codes % rows_length
+        r_values = Tree.get_pairs_correlations(normalized, i, j)
+        kept = np.abs(r_values) >= threshold
+
+        return i[kept], j[kept], r_values[kept]
 
     @staticmethod
-    def benjamini_hochberg(p_values: np.ndarray) -> np.ndarray:
+    def get_normalized_rows(matrix: np.ndarray, dtype: type = np.float64) -> np.ndarray:
+        """
+        Rows of `matrix` centered and scaled to unit norm (constant rows are left as zeros), so that the Pearson
+        correlation of two rows is their dot product.
+        """
+        normalized = np.asarray(matrix, dtype=dtype)
+        normalized = normalized - normalized.mean(axis=1, keepdims=True)
+        norms = np.sqrt((normalized ** 2).sum(axis=1))
+        valid = norms > 0
+        normalized[valid] /= norms[valid, None]
+
+        return normalized
+
+    @staticmethod
+    def get_pairs_correlations(normalized: np.ndarray, i: np.ndarray, j: np.ndarray) -> np.ndarray:
+        """
+        Pearson correlations of the pairs of rows (i, j) of the normalized rows `normalized` (see
+        get_normalized_rows), evaluated for at most `correlation_block_size` values at once.
+        """
+        r_values = np.zeros(len(i), dtype=normalized.dtype)
+        stripe_length = max(1, correlation_block_size // max(normalized.shape[1], 1))
+        for start in range(0, len(i), stripe_length):
+            stop = min(start + stripe_length, len(i))
+            r_values[start:stop] = np.einsum('ij,ij->i', normalized[i[start:stop]], normalized[j[start:stop]])
+
+        return np.clip(r_values, -1.0, 1.0)
+
+    @staticmethod
+    def get_screened_pairs(events: np.ndarray, threshold: float, query: Optional[np.ndarray] = None
+                           ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Pairs of rows i < j of the boolean event matrix `events` (sites x branch events) whose phi coefficient
+        (n * c - a * b) / sqrt(a * b * (n - a) * (n - b)) reaches |phi| >= threshold, where a and b are the numbers
+        of events of the rows, c the number of their shared events and n the number of columns.
+
+        The shared events (the population counts of the ANDed bitsets of all pairs) come from one sparse product of
+        the event matrix, so only the pairs sharing some event are generated. A pair without shared events has
+        |phi| = sqrt(a * b / ((n - a) * (n - b))) and is left out, as this is small for sparse events. The simulated
+        datasets are screened the same way, so the empirical p-values compare the screened pairs of a rate bin, and
+        the q-values are still computed over all the candidate pairs (see benjamini_hochberg).
+
+        Args:
+            events (np.ndarray): Events of every row, shape (sites, events).
+            threshold (float): Minimal absolute phi coefficient of the kept pairs.
+            query (np.ndarray, optional): Rows whose pairs with all the rows are screened (one-vs-all), all the pairs
+                are screened if `None` (default).
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Row indices i and j of the kept pairs, in the order of `np.triu_indices`.
+        """
+        event_matrix = csr_matrix(events, dtype=np.int64)
+        rows_length, columns_length = events.shape
+        quantities = np.asarray(event_matrix.sum(axis=1)).ravel()
+        rows = np.arange(rows_length) if query is None else np.unique(query)
+        is_query = np.zeros(rows_length, dtype=bool)
+        is_query[rows] = True
+
+        shared_events = (event_matrix[rows] @ event_matrix.T).tocoo()
+        i, j, shared_quantities = rows[shared_events.row], shared_events.col, shared_events.data
+        kept = (j > i) | ((j < i) & ~is_query[j])
+        i, j, shared_quantities = np.minimum(i, j)[kept], np.maximum(i, j)[kept], shared_quantities[kept]
+        first, second = quantities[i], quantities[j]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            phi = ((columns_length * shared_quantities - first * second) /
+                   np.sqrt(first * second * (columns_length - first) * (columns_length - second)))
+        kept = np.abs(phi) >= threshold
+        order = np.lexsort((j[kept], i[kept]))
+
+        return i[kept][order], j[kept][order]
+
+    def get_site_correlations(self, matrix: np.ndarray, sites: np.ndarray,
+                              event_threshold: Union[np.float64, float] = 0.5
+                              ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Optional[Tuple[np.ndarray, np.ndarray]]]:
+        """
+        Correlated pairs of rows of `matrix` (see get_correlated_pairs), the rows being the sites `sites`. Only the
+        pairs of the `query_positions` with all the sites are evaluated if these are given. With a positive
+        `screen_threshold` only the pairs passing the event screen (see get_screened_pairs, an event being a
+        probability of at least `event_threshold`) are correlated, otherwise the pairs are searched approximately (see
+        get_approximate_pairs) with `is_approximate_correlation` and a positive `correlation_threshold`.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray, np.ndarray, Optional[Tuple[np.ndarray, np.ndarray]]]: Row indices i and j
+                and correlations of the kept pairs, and the row indices of all the screened pairs (`None` without the
+                screen).
+        """
+        dtype = np.float32 if self.is_float32_correlation else np.float64
+        query = np.flatnonzero(np.isin(sites, self.query_positions)) if self.query_positions else None
+        if self.screen_threshold > 0:
+            i, j = self.get_screened_pairs(matrix >= event_threshold, self.screen_threshold, query)
+            r_values = self.get_pairs_correlations(self.get_normalized_rows(matrix, dtype), i, j)
+            kept = np.abs(r_values) >= self.correlation_threshold
+
+            return i[kept], j[kept], r_values[kept], (i, j)
+        if query is not None:
+            return *self.get_correlated_pairs(matrix, self.correlation_threshold, dtype, query), None
+        if self.is_approximate_correlation and self.correlation_threshold > 0:
+            return *self.get_approximate_pairs(matrix, self.correlation_threshold, dtype,
+                                               np.random.default_rng(self.seed)), None
+
+        return *self.get_correlated_pairs(matrix, self.correlation_threshold, dtype), None
+
+    @staticmethod
+    def benjamini_hochberg(p_values: np.ndarray, pairs_length: Optional[int] = None) -> np.ndarray:
+        """
+        Benjamini-Hochberg q-values of a family of `pairs_length` tests of which only `p_values` are given, the other
+        tests (e.g. the pairs left out by `correlation_threshold`, missed by the approximate search or left out by the
+        event screen) counting as p-values of 1.
+
+        Args:
+            p_values (np.ndarray): P-values of the given tests.
+            pairs_length (int, optional): Size of the family, `None` (default) for the given tests only.
+
+        Returns:
+            np.ndarray: Q-values of the given tests.
+        """
+        pairs_length = len(p_values) if pairs_length is None else max(pairs_length, len(p_values))
         order = np.argsort(p_values)
         ranked = p_values[order]
-        scale = len(p_values) / np.arange(1, len(p_values) + 1)
+        scale = pairs_length / np.arange(1, len(p_values) + 1)
         q_sorted = np.minimum.accumulate((ranked * scale)[::-1])[::-1]
         q = np.empty_like(q_sorted)
         q[order] = np.clip(q_sorted, 0, 1)
@@ -767,16 +1223,82 @@ class Tree:
         return q
 
     @staticmethod
-    def empirical_p(r: Any, bin_key: str, null_pool: Any) -> Union[np.float64, float]:
-        if bin_key not in null_pool or len(null_pool[bin_key]) == 0:
-            return 1.0
+    def empirical_p(count_extreme: np.ndarray, null_length: np.ndarray) -> np.ndarray:
 
-        null_distribution = np.asarray(null_pool[bin_key], dtype=float)
-        n = null_distribution.size
-        count_extreme = np.sum(np.abs(null_distribution) >= np.abs(r))
-        p_value = (count_extreme + 1) / (n + 1)
+        return np.where(null_length > 0, (count_extreme + 1) / (null_length + 1), 1.0)
 
-        return p_value
+    @staticmethod
+    def get_extreme_counts(r_values: np.ndarray, bins: np.ndarray, null_r_values: np.ndarray, null_bins: np.ndarray
+                           ) -> np.ndarray:
+        """
+        Count the null correlations at least as extreme as every observed one (|r_null| >= |r|) within its rate bin.
+
+        The null values are sorted once by bin and absolute value, and all the observed values of a bin are located
+        with one `searchsorted`, so only these counts (not the null values) have to be kept between batches of
+        replicates. Null correlations below `correlation_threshold` may be left out, as they are less extreme than
+        every observed one.
+
+        Args:
+            r_values (np.ndarray): Observed correlations.
+            bins (np.ndarray): Rate bins of the observed correlations, shape (pairs, 2).
+            null_r_values (np.ndarray): Null correlations.
+            null_bins (np.ndarray): Rate bins of the null correlations, shape (null pairs, 2).
+
+        Returns:
+            np.ndarray: Number of extreme null correlations of every observed pair.
+        """
+        count_extreme = np.zeros(len(r_values), dtype=np.int64)
+        categories_length = int(max(np.max(bins, initial=0), np.max(null_bins, initial=0))) + 1
+        codes = bins[:, 0] * categories_length + bins[:, 1]
+        null_codes = null_bins[:, 0] * categories_length + null_bins[:, 1]
+        null_values = np.abs(null_r_values)
+        order = np.lexsort((null_values, null_codes))
+        null_codes, null_values = null_codes[order], null_values[order]
+
+        for code in np.unique(codes):
+            start, stop = np.searchsorted(null_codes, (code, code + 1))
+            mask = codes == code
+            count_extreme[mask] = stop - start - np.searchsorted(null_values[start:stop], np.abs(r_values[mask]))
+
+        return count_extreme
+
+    def get_pairs_length(self, candidates: np.ndarray) -> int:
+        """
+        Number of candidate pairs tested, i.e. all the pairs of the sites `candidates`, or only the pairs with some of
+        the `query_positions` if these are given, whatever the pairs kept by `correlation_threshold`, found by the
+        approximate search or passing the event screen.
+        """
+        candidates_length = len(candidates)
+        if not self.query_positions:
+            return candidates_length * (candidates_length - 1) // 2
+        query_length = int(np.count_nonzero(np.isin(candidates, self.query_positions)))
+
+        return query_length * (candidates_length - query_length) + query_length * (query_length - 1) // 2
+
+    def get_bin_lengths(self, bins: np.ndarray, candidates: np.ndarray, categories: np.ndarray,
+                        screened_bins: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Number of pairs of the sites `candidates` (with the rate categories `categories`) in the rate bin of every row
+        of `bins`, only counting the pairs with some of the `query_positions` if these are given, or the screened
+        pairs (with the rate bins `screened_bins`, see get_screened_pairs) if these are given.
+        """
+        if screened_bins is not None:
+            codes = bins[:, 0] * self.rate_vector_length + bins[:, 1]
+            screened_codes = np.sort(screened_bins[:, 0] * self.rate_vector_length + screened_bins[:, 1])
+
+            return np.searchsorted(screened_codes, codes, side='right') - np.searchsorted(screened_codes, codes)
+
+        def get_pairs_quantities(current_candidates: np.ndarray) -> np.ndarray:
+            quantities = np.bincount(categories[current_candidates], minlength=self.rate_vector_length)
+            first, second = quantities[bins[:, 0]], quantities[bins[:, 1]]
+
+            return np.where(bins[:, 0] == bins[:, 1], first * (first - 1) // 2, first * second)
+
+        bin_lengths = get_pairs_quantities(candidates)
+        if self.query_positions:
+            bin_lengths -= get_pairs_quantities(candidates[~np.isin(candidates, self.query_positions)])
+
+        return bin_lengths
 
     def identify_event_candidates(self, event_threshold: Union[np.float64, float] = 0.5
                                   ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
@@ -798,22 +1320,28 @@ class Tree:
 
         site_matrix = np.empty((self.msa_length, 2 * len(nodes_objects)))
         site_matrix[:, 0::2], site_matrix[:, 1::2] = loss.T, gain.T
+        candidates, categories = self.get_event_candidates(site_matrix, self.posterior_rates, event_threshold)
+
+        return site_matrix, candidates, categories
 
+    def get_event_candidates(self, site_matrix: np.ndarray, posterior_rates: np.ndarray,
+                             event_threshold: Union[np.float64, float] = 0.5) -> Tuple[np.ndarray, np.ndarray]:
         candidates = np.where((site_matrix.max(axis=1) > event_threshold) & (site_matrix.var(axis=1) > 0))[0]
-        categories = np.abs(self.posterior_rates[:, None] - np.array(self.rate_vector)[None, :]).argmin(axis=1)
+        categories = np.abs(posterior_rates[:, None] - np.array(self.rate_vector)[None, :]).argmin(axis=1)
 
-        return site_matrix, candidates, categories
+        return candidates, categories
 
-    def get_bins(self, site_matrix: np.ndarray, candidates: np.ndarray, categories: np.ndarray
-                 ) -> Tuple[ndarray[Any, dtype[Any]], ndarray[Any, Any], List[Tuple[Union[Union[ndarray[Any, Any],
-                            ndarray[Any, dtype[Any]], ndarray[Any, dtype[void]]], Any], ...]]]:
-        correlations = self.get_row_correlations(site_matrix[candidates])
-        i_idx, j_idx = np.triu_indices(len(candidates), k=1)
+    def get_bins(self, site_matrix: np.ndarray, candidates: np.ndarray, categories: np.ndarray,
+                 event_threshold: Union[np.float64, float] = 0.5
+                 ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, Optional[np.ndarray]]:
+        i_idx, j_idx, r_values, screened = self.get_site_correlations(site_matrix[candidates], candidates,
+                                                                      event_threshold)
         pairs = np.column_stack((candidates[i_idx], candidates[j_idx]))
-        r_values = correlations[i_idx, j_idx]
-        bins = [tuple(sorted((categories[a], categories[b]))) for a, b in pairs]
+        bins = np.sort(categories[pairs], axis=1)
+        screened_bins = None if screened is None else np.sort(
+            categories[np.column_stack((candidates[screened[0]], candidates[screened[1]]))], axis=1)
 
-        return pairs, r_values, bins
+        return pairs, r_values, bins, screened_bins
 
     def simulate_datasets(self, file_path: str = '',
                           sep: str = '\t',
@@ -844,42 +1372,55 @@ class Tree:
         p11 = (a + b * e) / mu
         event_threshold = 0.5
 
-        newick_text = self.get_newick()
-
-        null_pool, pairs, r_values, bins = {}, None, None, None
+        pairs, r_values, bins, count_extreme, null_length, pairs_length = None, None, None, None, None, None
 
         if use_coevolution_file:
             site_matrix, candidates, categories = self.identify_event_candidates(event_threshold)
-            pairs, r_values, bins = self.get_bins(site_matrix, candidates, categories)
-
-            null_pool = {current_bin: [] for current_bin in set(bins)}
-
-        for i in range(number_datasets):
-            header = f'iterations = {i}'
-            current_msa = self.generate_msa(msa_type=str,
-                                            site_rate=self.posterior_rates,
-                                            p01=p01, p11=p11,
-                                            sites_quantity=self.msa_length,
-                                            branch_length=branch_length,
-                                            leaves=self.leaves_objects)
-            phylo_tree = Tree(newick_text, msa=current_msa, categories_quantity=self.categories_quantity,
-                              alpha=self.alpha, pi_1=self.pi_1, coefficient_bl=self.coefficient_bl)
-            phylo_tree.calculate_tree()
-            phylo_tree.set_posterior_rates_vector()
-
-            if use_coevolution_file:
-                current_site_matrix, current_candidates, current_categories = (
-                    phylo_tree.identify_event_candidates(event_threshold))
-                current_pairs, current_r_values, current_bins = phylo_tree.get_bins(current_site_matrix,
-                                                                                    current_candidates,
-                                                                                    current_categories)
-                for current_bin, r_value in zip(current_bins, current_r_values):
-                    null_pool.setdefault(current_bin, []).append(r_value)
-
-            if use_simulated_datasets_file:
-                current_content = f'{header}\n\n{current_msa}\n\n\n'
-                with open(file_simulated_datasets, 'a', encoding='utf-8') as file:
-                    file.write(current_content)
+            pairs, r_values, bins, _ = self.get_bins(site_matrix, candidates, categories, event_threshold)
+            pairs_length = self.get_pairs_length(candidates)
+
+            count_extreme = np.zeros(len(r_values), dtype=np.int64)
+            null_length = np.zeros(len(r_values), dtype=np.int64)
+
+        processes = max(min(self.processes, number_datasets), 1)
+        is_sequential = self.is_sequential_simulation and use_coevolution_file
+        batch_length = max(1, simulation_block_size // (self.compiled_tree.nodes_length * max(self.msa_length, 1)))
+        batch_length = min(batch_length, sequential_batch_length if is_sequential else
+                           -(-number_datasets // processes))
+        seed_sequences = np.random.SeedSequence(self.seed).spawn(number_datasets)
+        batches = [seed_sequences[start:start + batch_length] for start in range(0, number_datasets, batch_length)]
+        arguments = {'p01': p01, 'p11': p11, 'branch_length': branch_length, 'event_threshold': event_threshold,
+                     'use_simulated_datasets_file': use_simulated_datasets_file,
+                     'use_coevolution_file': use_coevolution_file, 'r_values': r_values, 'bins': bins}
+
+        with (ProcessPoolExecutor(max_workers=processes, initializer=initialize_simulation, initargs=(self, arguments))
+              if processes > 1 else nullcontext()) as executor:
+            if executor is None:
+                compiled_tree = self.compiled_tree.get_replicate() if use_coevolution_file else None
+                futures = []
+                results = (self.simulate_replicates(batch, compiled_tree, **arguments) for batch in batches)
+            else:
+                futures = [executor.submit(simulate_replicates, batch) for batch in batches]
+                results = (future.result() for future in futures)
+
+            start = 0
+            for fasta_list, current_count_extreme, current_null_length in results:
+                if use_coevolution_file:
+                    count_extreme += current_count_extreme
+                    null_length += current_null_length
+
+                if use_simulated_datasets_file:
+                    current_content = ''.join(f'iterations = {i}\n\n{current_fasta}\n\n\n'
+                                              for i, current_fasta in enumerate(fasta_list, start))
+                    with open(file_simulated_datasets, 'a', encoding='utf-8') as file:
+                        file.write(current_content)
+                start += len(fasta_list)
+
+                if is_sequential and self.is_simulation_resolved(count_extreme, null_length, pairs_length):
+                    break
+            for future in futures:
+                future.cancel()
+        self.simulated_datasets_quantity = start
 
         result = {}
 
@@ -887,31 +1428,20 @@ class Tree:
             result.update({'Simulated datasets (fastas)': file_simulated_datasets})
 
         if use_coevolution_file:
-            pos1_list = []
-            pos2_list = []
-            rate_bin_list = []
-            r_list = []
-            p_value_list = []
-            direction_list = []
-
-            for i, (current_pair, current_r_value, current_bin) in enumerate(zip(pairs, r_values, bins)):
-                current_p_value = self.empirical_p(current_r_value, current_bin, null_pool)
-                pos1_list.append(current_pair[0])
-                pos2_list.append(current_pair[1])
-                r_list.append(current_r_value)
-                rate_bin_list.append(current_bin)
-                p_value_list.append(current_p_value)
-                direction_list.append('co-occurrence' if current_r_value >= 0 else 'avoidance')
-
-            p_values = np.asarray(p_value_list)
-            q_values = self.benjamini_hochberg(p_values)
-            df = pd.DataFrame({'POS1': np.asarray(pos1_list, np.int32),
-                               'POS2': np.asarray(pos2_list, np.int32),
-                               'r': np.round(np.asarray(r_list), decimals=14),
-                               'rate-bin': rate_bin_list,
+            p_values = self.empirical_p(count_extreme, null_length)
+            # the q-values control the false discovery rate over all the candidate pairs (see get_pairs_length), the
+            # pairs left out by the event screen included, although the p-values of the screened pairs are conditional
+            # on passing the screen
+            q_values = self.benjamini_hochberg(p_values, pairs_length)
+            df = pd.DataFrame({'POS1': pairs[:, 0].astype(np.int32),
+                               'POS2': pairs[:, 1].astype(np.int32),
+                               'r': np.round(r_values, decimals=14),
+                               'rate-bin': [tuple(current_bin) for current_bin in bins.tolist()],
                                'p-value': np.round(p_values, decimals=14),
                                'q-value': np.round(q_values, decimals=14),
-                               'direction': direction_list})
+                               'direction': np.where(r_values >= 0, 'co-occurrence', 'avoidance')})
+            if is_sequential:
+                df['datasets'] = self.simulated_datasets_quantity
             df.sort_values(by=['q-value', 'p-value', 'r'], key=lambda x: x.abs() if x.name == 'r' else x, inplace=True,
                            ascending=[True, True, False])
             df.to_csv(file_coevolution, sep=sep, index=False)
@@ -919,6 +1449,139 @@ class Tree:
 
         return result
 
+    def is_simulation_resolved(self, count_extreme: np.ndarray, null_length: np.ndarray,
+                               pairs_length: Optional[int] = None) -> bool:
+        """
+        Sequential Monte Carlo stopping rule (in the spirit of Besag and Clifford): the simulation can stop once no
+        further dataset is expected to change the Benjamini-Hochberg calls at `false_discovery_rate`.
+
+        Every p-value is bounded by a Clopper-Pearson interval (`sequential_error_probability` per pair). As the
+        Benjamini-Hochberg procedure is monotone in the p-values, the calls are resolved when it rejects the same
+        pairs with all p-values at their upper bounds as at their lower bounds. In addition, as in the Besag-Clifford
+        procedure, a pair that is not rejected has to have reached `sequential_extreme_limit` extreme null
+        correlations (or to be rejected at the upper bounds).
+
+        Args:
+            count_extreme (np.ndarray): Number of extreme null correlations of every pair.
+            null_length (np.ndarray): Number of null correlations of every pair.
+            pairs_length (int, optional): Number of candidate pairs tested (see `benjamini_hochberg`). `None` (default)
+
+        Returns:
+            bool: Whether the calls of all pairs are resolved.
+        """
+        if not len(count_extreme):
+            return True
+
+        lower = np.where(count_extreme > 0, beta.ppf(sequential_error_probability / 2, np.maximum(count_extreme, 1),
+                                                     null_length - count_extreme + 1), 0.0)
+        upper = np.where(count_extreme < null_length, beta.ppf(1 - sequential_error_probability / 2,
+                                                               count_extreme + 1,
+                                                               np.maximum(null_length - count_extreme, 1)), 1.0)
+        is_upper_rejected = self.benjamini_hochberg(upper, pairs_length) <= self.false_discovery_rate
+        is_lower_rejected = self.benjamini_hochberg(lower, pairs_length) <= self.false_discovery_rate
+
+        return bool(np.all(is_upper_rejected == is_lower_rejected) and
+                    np.all(is_upper_rejected | (count_extreme >= sequential_extreme_limit)))
+
+    def simulate_replicates(self, seed_sequences: List[np.random.SeedSequence], compiled_tree: Optional[CompiledTree],
+                            p01: np.ndarray, p11: np.ndarray, branch_length: np.ndarray,
+                            event_threshold: Union[np.float64, float] = 0.5, use_simulated_datasets_file: bool = True,
+                            use_coevolution_file: bool = False, r_values: Optional[np.ndarray] = None,
+                            bins: Optional[np.ndarray] = None
+                            ) -> Tuple[List[str], Optional[np.ndarray], Optional[np.ndarray]]:
+        """
+        Simulate a batch of datasets, every dataset drawn by its own generator, so that a dataset only depends on its
+        seed sequence and not on the batch or the process it is simulated in.
+
+        Args:
+            seed_sequences (List[np.random.SeedSequence]): Seed sequence of every dataset.
+            compiled_tree (CompiledTree, optional): A replicate of the compiled tree (see
+                `CompiledTree.get_replicate`), required with `use_coevolution_file`.
+            p01 (np.ndarray): Probabilities of state 1 after a branch from state 0, shape (branches, msa_length).
+            p11 (np.ndarray): Probabilities of state 1 after a branch from state 1, shape (branches, msa_length).
+            branch_length (np.ndarray): Lengths of the branches.
+            event_threshold (Union[np.float64, float], optional): See `identify_event_candidates`. 0.5 (default)
+            use_simulated_datasets_file (bool, optional): Return the datasets as FASTA text. `True` (default)
+            use_coevolution_file (bool, optional): Count the null correlations of the datasets (see
+                `get_extreme_counts`). `False` (default)
+            r_values (np.ndarray, optional): Observed correlations, required with `use_coevolution_file`.
+            bins (np.ndarray, optional): Rate bins of the observed correlations, required with `use_coevolution_file`.
+
+        Returns:
+            Tuple[List[str], Optional[np.ndarray], Optional[np.ndarray]]: The FASTA text of every dataset (empty
+                without `use_simulated_datasets_file`), the numbers of extreme null correlations and of null
+                correlations of every observed pair (`None` without `use_coevolution_file`).
+        """
+        msa_list = [self.generate_msa(msa_type=dict,
+                                      site_rate=self.posterior_rates,
+                                      p01=p01, p11=p11,
+                                      sites_quantity=self.msa_length,
+                                      branch_length=branch_length,
+                                      leaves=self.leaves_objects,
+                                      random_generator=np.random.default_rng(seed_sequence))
+                    for seed_sequence in seed_sequences]
+        count_extreme = null_length = None
+
+        if use_coevolution_file:
+            null_r_values, null_bins, null_length = [], [], np.zeros(len(r_values), dtype=np.int64)
+            site_matrices, posterior_rates = self.calculate_simulated_datasets(compiled_tree, msa_list)
+            for current_site_matrix, current_posterior_rates in zip(site_matrices, posterior_rates):
+                current_candidates, current_categories = self.get_event_candidates(current_site_matrix,
+                                                                                   current_posterior_rates,
+                                                                                   event_threshold)
+                current_pairs, current_r_values, current_bins, current_screened_bins = self.get_bins(
+                    current_site_matrix, current_candidates, current_categories, event_threshold)
+                null_r_values.append(current_r_values)
+                null_bins.append(current_bins)
+                null_length += self.get_bin_lengths(bins, current_candidates, current_categories,
+                                                    current_screened_bins)
+            count_extreme = self.get_extreme_counts(r_values, bins, np.concatenate(null_r_values),
+                                                    np.concatenate(null_bins))
+
+        fasta_list = ([self.get_fasta_text(current_msa) for current_msa in msa_list] if use_simulated_datasets_file
+                      else [''] * len(msa_list))
+
+        return fasta_list, count_extreme, null_length
+
+    def calculate_simulated_datasets(self, compiled_tree: CompiledTree, msa_list: List[Dict[str, str]]
+                                     ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Branch probabilities and posterior rates of simulated alignments, evaluated with the topology and the
+        transition matrices of this tree.
+
+        Sites are independent, so the alignments are evaluated at once as a single alignment made of the columns of
+        all of them (identical columns, also across alignments, are collapsed into one site pattern). Only the leaf
+        data of `compiled_tree` is replaced, the tree itself is not modified.
+
+        Args:
+            compiled_tree (CompiledTree): A replicate of the compiled tree (see `CompiledTree.get_replicate`).
+            msa_list (List[Dict[str, str]]): Alignments of `msa_length` sites over the leaves of the tree.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Interleaved loss/gain probabilities of every branch (as in
+                `identify_event_candidates`) of shape (alignments, msa_length, 2 * branches) and posterior rates of
+                shape (alignments, msa_length).
+        """
+        names = [compiled_tree.nodes[i].name for i in compiled_tree.leaves]
+        msa_text = ''.join(current_msa[name] for name in names for current_msa in msa_list)
+        msa_matrix = np.frombuffer(msa_text.encode(), dtype=np.uint8).reshape(len(names), -1)
+        pattern_columns, pattern_index, pattern_weights = self.get_site_patterns(msa_matrix)
+        sequences = msa_matrix[:, pattern_columns].view('S1').astype(str)
+
+        compiled_tree.set_patterns(pattern_index, pattern_weights)
+        compiled_tree.allocate(self.rate_vector_length, self.alphabet_length, len(pattern_columns),
+                               self.site_block_size, self.threads)
+        compiled_tree.set_leaf_up_vectors(sequences, self.alphabet)
+        compiled_tree.calculate_vectors(is_marginal=True, is_streaming=True)
+
+        branch_probability = compiled_tree.branch_probability_vector[1:, :, 1:3]
+        site_matrix = branch_probability.transpose(1, 0, 2).reshape(len(pattern_columns), -1)
+        prior = np.ones(self.rate_vector_length) / self.rate_vector_length
+        posterior_rates = self.get_posterior_rates(compiled_tree.rate_likelihood_vector, prior)
+
+        return (site_matrix[pattern_index].reshape(len(msa_list), self.msa_length, -1),
+                posterior_rates[pattern_index].reshape(len(msa_list), self.msa_length))
+
     def posterior_rates_to_tsv(self, file_name: str = 'PosteriorRates.tsv', sep: str = '\t') -> str:
 
         if self.posterior_rates is None:
@@ -1156,21 +1819,280 @@ class Tree:
 
         return -self.get_log_likelihood()
 
+    def parameters_optimization(self, parameters: np.ndarray, names: Tuple[str, ...]
+                                ) -> Tuple[Union[float, np.float64], np.ndarray]:
+        self.clean_all()
+        self.set_parameters(parameters, names)
+        self.set_vars()
+        gradient = self.get_log_likelihood_gradient(names)
+
+        return -self.log_likelihood, -gradient
+
+    def set_parameters(self, parameters: np.ndarray, names: Tuple[str, ...]) -> None:
+        for name, value in zip(names, parameters):
+            if name == 'pi_1':
+                self.set_pi(pi_1=float(value))
+            elif name == 'alpha':
+                self.set_gamma_distribution_categories_vector(float(value))
+            elif name == 'coefficient_bl':
+                self.set_coefficient_bl(float(value))
+
+    def get_log_likelihood_gradient(self, names: Tuple[str, ...]) -> np.ndarray:
+        """
+        Compute the log-likelihood and its analytic derivatives with respect to the given parameters.
+
+        The derivatives of the transition matrices are contracted with the outside/inside products of the up/down
+        tensors (see `CompiledTree.calculate_expectation`); the derivatives of the gamma rate categories with respect
+        to alpha are taken by central differences of the discretisation.
+
+        Args:
+            names (Tuple[str, ...]): Parameters, any of 'pi_1', 'alpha' and 'coefficient_bl'.
+
+        Returns:
+            np.ndarray: Derivatives of the log-likelihood in the order of `names`.
+        """
+        pmatrix_derivatives = self.compiled_tree.get_pmatrix_derivatives(self.pi_1, self.coefficient_bl,
+                                                                         self.rate_vector,
+                                                                         self.get_rate_vector_derivative())
+        frequency_derivatives = {'pi_1': np.asarray((-1.0, 1.0)), 'alpha': np.zeros(2), 'coefficient_bl': np.zeros(2)}
+
+        self.initialize_leaf_up_vectors()
+        self.compiled_tree.calculate(is_expectation=True)
+        self.set_likelihood()
+
+        branch_expectation = self.compiled_tree.branch_expectation
+        root_expectation = np.sum(self.compiled_tree.root_expectation, axis=0)
+
+        return np.asarray([np.sum(pmatrix_derivatives[name] * branch_expectation) +
+                           np.dot(frequency_derivatives[name], root_expectation) for name in names])
+
+    def get_rate_vector_derivative(self, step: float = 1e-5) -> np.ndarray:
+        upper = self.get_gamma_distribution_categories_vector(self.alpha + step)
+        lower = self.get_gamma_distribution_categories_vector(self.alpha - step)
+
+        return (np.asarray(upper) - np.asarray(lower)) / (2 * step)
+
+    def optimize_parameters(self, is_optimize_pi: Optional[bool] = None, is_optimize_alpha: Optional[bool] = None,
+                            is_optimize_bl: Optional[bool] = None) -> None:
+        """
+        Jointly optimize the enabled model parameters (pi_1, alpha, coefficient_bl) with bounded quasi-Newton
+        (L-BFGS-B) driven by the analytic gradient of the log-likelihood.
+
+        Args:
+            is_optimize_pi (bool, optional): Optimize pi_1. `None` (default)
+            is_optimize_alpha (bool, optional): Optimize alpha. `None` (default)
+            is_optimize_bl (bool, optional): Optimize coefficient_bl. `None` (default)
+        """
+        parameters = tuple((name, bounds) for name, bounds, is_optimize in (
+            ('pi_1', (0.001, 0.999), is_optimize_pi),
+            ('alpha', (0.1, 20), is_optimize_alpha),
+            ('coefficient_bl', (0.1, 10), is_optimize_bl)) if is_optimize)
+        if not parameters:
+            return
+
+        names = tuple(name for name, _ in parameters)
+        bounds = [bounds for _, bounds in parameters]
+        initial_parameters = self.get_grid_parameters(names, bounds)
+        result = minimize(self.parameters_optimization, x0=initial_parameters, args=(names, ), jac=True,
+                          method='L-BFGS-B', bounds=bounds,
+                          options={'ftol': self.optimization_ftol, 'gtol': self.optimization_gtol})
+        self.set_parameters(result.x, names)
+        self.set_vars()
+
+    def get_log_likelihood_grid(self, pi_1: Optional[Union[float, np.float64, Sequence[float], np.ndarray]] = None,
+                                alpha: Optional[Union[float, np.float64, Sequence[float], np.ndarray]] = None,
+                                coefficient_bl: Optional[Union[float, np.float64, Sequence[float], np.ndarray]] = None
+                                ) -> np.ndarray:
+        """
+        Log-likelihoods of the tree for a vector of parameter sets, evaluated in a single batched up pass.
+
+        The arguments are broadcast against each other; an omitted parameter keeps its current value. Useful to
+        warm-start the optimizers and to draw likelihood surfaces.
+
+        Args:
+            pi_1 (Union[float, np.float64, Sequence[float], np.ndarray], optional): `None` (default)
+            alpha (Union[float, np.float64, Sequence[float], np.ndarray], optional): `None` (default)
+            coefficient_bl (Union[float, np.float64, Sequence[float], np.ndarray], optional): `None` (default)
+
+        Returns:
+            np.ndarray: Log-likelihood of every parameter set.
+        """
+        pi_1, alpha, coefficient_bl = np.broadcast_arrays(*(np.atleast_1d(np.asarray(
+            getattr(self, name) if value is None else value, dtype=np.float64)).ravel() for name, value in (
+            ('pi_1', pi_1), ('alpha', alpha), ('coefficient_bl', coefficient_bl))))
+        rate_vectors = {value: self.get_gamma_distribution_categories_vector(value) for value in set(alpha.tolist())}
+        pmatrix = np.stack([self.compiled_tree.get_pmatrix(pi_1[i], coefficient_bl[i], rate_vectors[alpha[i]])
+                            for i in range(len(pi_1))])
+        frequency = np.stack((1 - pi_1, pi_1), axis=1)
+
+        self.initialize_leaf_up_vectors()
+
+        return self.compiled_tree.get_log_likelihood_grid(pmatrix, frequency, self.site_block_size)
+
+    def get_grid_parameters(self, names: Tuple[str, ...], bounds: List[Tuple[float, float]]) -> np.ndarray:
+        """
+        Best point of a coarse grid over the given parameters (the current values included), used as the starting
+        point of the optimizers.
+
+        Args:
+            names (Tuple[str, ...]): Parameters, any of 'pi_1', 'alpha' and 'coefficient_bl'.
+            bounds (List[Tuple[float, float]]): Bounds of the parameters.
+
+        Returns:
+            np.ndarray: Values of the parameters in the order of `names`.
+        """
+        current_parameters = np.clip([getattr(self, name) for name in names], *np.asarray(bounds).T)
+        axes = [np.clip(optimization_grid[name], *bound) for name, bound in zip(names, bounds)]
+        grid = np.stack([axis.ravel() for axis in np.meshgrid(*axes, indexing='ij')], axis=1)
+        grid = np.vstack((current_parameters, grid))
+        log_likelihood = self.get_log_likelihood_grid(**dict(zip(names, grid.T)))
+
+        return grid[np.argmax(log_likelihood)]
+
+    def get_grid_bounds(self, name: str, bounds: Tuple[float, float]) -> Tuple[float, float]:
+        """
+        Narrow the bounds of a scalar search to the cells of the coarse grid adjacent to its best point.
+
+        Args:
+            name (str): Parameter, one of 'pi_1', 'alpha' and 'coefficient_bl'.
+            bounds (Tuple[float, float]): Bounds of the parameter.
+
+        Returns:
+            Tuple[float, float]: Bounds of the search.
+        """
+        grid = np.unique(np.concatenate((bounds, np.clip(optimization_grid[name], *bounds))))
+        i = int(np.argmax(self.get_log_likelihood_grid(**{name: grid})))
+
+        return grid[max(i - 1, 0)], grid[min(i + 1, len(grid) - 1)]
+
+    def optimize_branch_lengths(self, is_optimize_branch_lengths: Optional[bool] = None, iterations: int = 1000,
+                                bounds: Tuple[float, float] = (1e-6, 10.0), tolerance: float = 0.1) -> None:
+        """
+        Fit the length of every branch, with the model parameters fixed.
+
+        When the memory holds the whole alignment in one site block (whatever the number of threads) every iteration
+        is one up/down pass followed by a sweep of per-branch Newton updates on the cached tensors
+        (`CompiledTree.optimize_branch_lengths`), so a branch costs one branch's worth of work; the sweeps stop when
+        one gains less than `tolerance`. Otherwise the tensors are not kept and the lengths are fitted jointly with
+        bounded quasi-Newton (L-BFGS-B) on their logarithms, every evaluation being one up/down pass that gives the
+        analytic gradient (`CompiledTree.get_branch_length_gradient`) and the fit being the same for any block
+        length. Both never decrease the likelihood, but may stop at different local optima. Branches of zero length
+        (e.g. resolved multifurcations) are kept. The fitted lengths replace `distance_to_father`.
+
+        Args:
+            is_optimize_branch_lengths (bool, optional): Optimize the branch lengths. `None` (default)
+            iterations (int, optional): Maximal number of sweeps or L-BFGS-B iterations. 1000 (default)
+            bounds (Tuple[float, float], optional): Bounds of the branch lengths. (1e-6, 10.0) (default)
+            tolerance (float, optional): Log-likelihood gain of a sweep below which the sweeps stop. 0.1 (default)
+        """
+        if not is_optimize_branch_lengths:
+            return
+
+        self.clean_all()
+        self.set_vars()
+        # one block for the sequential sweeps whenever the memory allows it, so the fit does not depend on the threads
+        self.initialize_leaf_up_vectors(threads=1)
+        compiled_tree = self.compiled_tree
+        if compiled_tree.is_chunked():
+            self.initialize_leaf_up_vectors()
+            branches = np.where(compiled_tree.branch_length > 0.0)[0]
+            initial_log_length = np.log(np.clip(compiled_tree.branch_length[branches], *bounds))
+            result = minimize(self.branch_lengths_optimization, x0=initial_log_length, args=(branches, ), jac=True,
+                              method='L-BFGS-B', bounds=[tuple(np.log(bounds))] * len(branches),
+                              options={'ftol': self.optimization_ftol, 'gtol': self.optimization_gtol,
+                                       'maxiter': iterations})
+            compiled_tree.branch_length[branches] = np.exp(result.x)
+        else:
+            log_likelihood = -np.inf
+            for _ in range(iterations):
+                compiled_tree.calculate_vectors(is_down=True)
+                new_log_likelihood = compiled_tree.get_log_likelihood()
+                if new_log_likelihood - log_likelihood <= tolerance:
+                    break
+                log_likelihood = new_log_likelihood
+                compiled_tree.optimize_branch_lengths(self.pi_1, self.coefficient_bl, self.rate_vector, bounds)
+        self.set_branch_lengths(compiled_tree.branch_length)
+        self.set_vars()
+
+    def branch_lengths_optimization(self, log_length: np.ndarray, branches: np.ndarray
+                                    ) -> Tuple[Union[float, np.float64], np.ndarray]:
+        compiled_tree = self.compiled_tree
+        compiled_tree.branch_length[branches] = np.exp(log_length)
+        compiled_tree.set_pmatrix(compiled_tree.get_pmatrix(self.pi_1, self.coefficient_bl, self.rate_vector))
+        compiled_tree.calculate_vectors(is_expectation=True)
+        gradient = compiled_tree.get_branch_length_gradient(self.pi_1, self.coefficient_bl, self.rate_vector)
+
+        return -compiled_tree.get_log_likelihood(), -(gradient * compiled_tree.branch_length)[branches]
+
+    def set_branch_lengths(self, branch_length: np.ndarray) -> None:
+        """
+        Replace the branch lengths and update the distances derived from them.
+
+        Args:
+            branch_length (np.ndarray): Lengths of the branches above all nodes, in `compiled_tree.nodes` order.
+        """
+        for current_node, distance_to_father in zip(self.compiled_tree.nodes[1:], branch_length[1:].tolist()):
+            current_node.distance_to_father = distance_to_father
+        self.set_distances()
+
+    def set_branch_length(self, current_node: Union[str, Node], distance_to_father: Union[float, np.float64]
+                          ) -> None:
+        """
+        Change the length of one branch, marking it dirty so that `update_likelihood` only recomputes its path to
+        the root. The derived distances (`distance_to_root`, ...) are not updated.
+
+        Args:
+            current_node (Union[str, Node]): The node below the branch, or its name.
+            distance_to_father (Union[float, np.float64]): The new branch length.
+        """
+        current_node = self.all_nodes[current_node] if isinstance(current_node, str) else current_node
+        current_node.distance_to_father = distance_to_father
+        compiled_tree = self.compiled_tree
+        i = compiled_tree.index[id(current_node)]
+        compiled_tree.branch_length[i] = distance_to_father
+        if self.alphabet_length == 2:
+            pmatrix = compiled_tree.get_pmatrix(self.pi_1, self.coefficient_bl, self.rate_vector,
+                                                compiled_tree.branch_length[i:i + 1])[0]
+        else:
+            pmatrix = np.asarray([current_node.get_pmatrix(r) for r in self.rate_vector], dtype=np.float64)
+        compiled_tree.set_node_pmatrix(i, pmatrix)
+
+    def update_likelihood(self) -> Union[np.float64, float]:
+        """
+        Likelihood after `set_branch_length` changes. Only the up vectors on the paths from the changed branches to
+        the root are recomputed (see `CompiledTree.calculate_dirty`) when the tensors of the whole alignment are
+        kept from the previous calculation; otherwise the tree is recalculated.
+
+        Returns:
+            Union[np.float64, float]: The log-likelihood.
+        """
+        if self.compiled_tree.is_resident:
+            self.compiled_tree.calculate_dirty()
+            self.set_likelihood()
+        else:
+            self.calculate_up()
+
+        return self.log_likelihood
+
     def optimize_coefficient_bl(self, is_optimize_bl: Optional[bool] = None) -> None:
         if is_optimize_bl:
-            self.coefficient_bl = self.optimize(func=self.coefficient_bl_optimization, bracket=(1, ), bounds=(0.1, 10),
+            bounds = self.get_grid_bounds('coefficient_bl', (0.1, 10))
+            self.coefficient_bl = self.optimize(func=self.coefficient_bl_optimization, bracket=(1, ), bounds=bounds,
                                                 result_fild='x')
             self.set_vars()
 
     def optimize_alpha(self, is_optimize_alpha: Optional[bool] = None) -> None:
         if is_optimize_alpha:
-            self.alpha = self.optimize(func=self.alpha_optimization, bracket=(0.5, ), bounds=(0.1, 20), result_fild='x')
+            bounds = self.get_grid_bounds('alpha', (0.1, 20))
+            self.alpha = self.optimize(func=self.alpha_optimization, bracket=(0.5, ), bounds=bounds, result_fild='x')
             self.set_vars()
 
     def optimize_pi(self, is_optimize_pi: Optional[bool] = None, is_optimize_pi_average: Optional[bool] = None,
                     mode: int = 1) -> None:
         if is_optimize_pi:
-            self.pi_1 = self.optimize(func=self.pi_optimization, bracket=(0.5, ), bounds=(0.001, 0.999), args=(mode, ),
+            bounds = self.get_grid_bounds('pi_1', (0.001, 0.999))
+            bounds = bounds if mode else (1 - bounds[1], 1 - bounds[0])
+            self.pi_1 = self.optimize(func=self.pi_optimization, bracket=(0.5, ), bounds=bounds, args=(mode, ),
                                       result_fild='x')
             self.set_vars()
 
@@ -1183,6 +2105,7 @@ class Tree:
     def clean_all(self):
         for current_node in self.all_nodes_objects:
             current_node.clean_all()
+        self.compiled_tree.clean_node_vectors()
         self.log_likelihood_vector = self.likelihood_vector = self.correlation_vector = self.posterior_rates = None
         self.log_likelihood = self.likelihood = 0.0
 
@@ -1200,16 +2123,21 @@ class Tree:
 
     def set_gamma_distribution_categories_vector(self, alpha: Union[int, float, np.float64]) -> None:
         self.set_alpha(alpha)
+
+        self.rate_vector = self.get_gamma_distribution_categories_vector(self.alpha)
+        self.rate_vector_length = len(self.rate_vector)
+
+    def get_gamma_distribution_categories_vector(self, alpha: Union[int, float, np.float64]
+                                                 ) -> Tuple[Union[float, np.float64], ...]:
         categories_vector = []
-        gamma_percent_point = self.get_gamma_distribution_percent_point()
+        gamma_percent_point = self.get_gamma_distribution_percent_point(alpha)
         for i in range(self.categories_quantity):
-            lower_gamma_inc_1 = gammainc(self.alpha + 1, gamma_percent_point[i] * self.alpha)
-            lower_gamma_inc_2 = gammainc(self.alpha + 1, gamma_percent_point[i + 1] * self.alpha)
-            mean = (self.alpha / self.alpha) * (lower_gamma_inc_2 - lower_gamma_inc_1) / (1 / self.categories_quantity)
+            lower_gamma_inc_1 = gammainc(alpha + 1, gamma_percent_point[i] * alpha)
+            lower_gamma_inc_2 = gammainc(alpha + 1, gamma_percent_point[i + 1] * alpha)
+            mean = (alpha / alpha) * (lower_gamma_inc_2 - lower_gamma_inc_1) / (1 / self.categories_quantity)
             categories_vector.append(mean)
 
-        self.rate_vector = tuple(categories_vector)
-        self.rate_vector_length = len(self.rate_vector)
+        return tuple(categories_vector)
 
     def set_coefficient_bl(self, coefficient_bl: Optional[Union[float, np.float64, int]] = None) -> None:
         self.coefficient_bl = 1.0 if coefficient_bl is None else coefficient_bl
@@ -1231,17 +2159,22 @@ class Tree:
             frequency = (1 - self.pi_1, self.pi_1)
         else:
             frequency = (1 / self.alphabet_length, 1 / self.alphabet_length)
-        for current_node in self.all_nodes_objects:
-            current_node.alphabet = self.alphabet
-            current_node.frequency = np.asarray(frequency, dtype=np.float64)
-            current_node.pi_1 = self.pi_1
-            current_node.coefficient_bl = self.coefficient_bl
-            current_node.pmatrix = np.asarray([current_node.get_pmatrix(r) for r in self.rate_vector], dtype=np.float64)
+        self.frequency = np.asarray(frequency, dtype=np.float64)
+        self.compiled_tree.frequency = self.frequency
+        self.compiled_tree.set_branch_length()
+        if self.alphabet_length == 2:
+            pmatrix = self.compiled_tree.get_pmatrix(self.pi_1, self.coefficient_bl, self.rate_vector)
+        else:
+            pmatrix = np.asarray([[current_node.get_pmatrix(r) for r in self.rate_vector]
+                                  for current_node in self.all_nodes_objects], dtype=np.float64)
+        self.compiled_tree.set_pmatrix(pmatrix)
 
-    def get_gamma_distribution_percent_point(self) -> List[float]:
+    def get_gamma_distribution_percent_point(self, alpha: Optional[Union[int, float, np.float64]] = None
+                                             ) -> List[float]:
+        alpha = self.alpha if alpha is None else alpha
         probability_vector = np.linspace(0, 1, self.categories_quantity + 1)
 
-        return gamma.ppf(probability_vector, a=self.alpha, scale=1/self.alpha)
+        return gamma.ppf(probability_vector, a=alpha, scale=1/alpha)
 
     def set_basic_msa(self) -> None:
         self.msa = {leaf.name: self.alphabet[0] for leaf in self.leaves_objects}
@@ -1253,10 +2186,12 @@ class Tree:
                      p11: Optional[np.ndarray] = None,
                      branch_length: Optional[np.ndarray] = None,
                      branch_nodes: Optional[List[Node]] = None,
-                     leaves: Optional[List[Node]] = None) -> Union[Dict[str, str], str]:
+                     leaves: Optional[List[Node]] = None,
+                     random_generator: Optional[np.random.Generator] = None) -> Union[Dict[str, str], str]:
 
+        random_generator = np.random if random_generator is None else random_generator
         if site_rate is None:
-            site_rate = np.random.choice(self.rate_vector, 1 if sites_quantity is None else sites_quantity)
+            site_rate = random_generator.choice(self.rate_vector, 1 if sites_quantity is None else sites_quantity)
         if branch_nodes is None:
             branch_nodes = [n for n in self.all_nodes_objects if n.father is not None]
         if branch_length is None:
@@ -1272,13 +2207,14 @@ class Tree:
         if leaves is None:
             leaves = self.leaves_objects
 
-        states = {self.root.name: (np.random.random(sites_quantity) < self.pi_1).astype(np.int8)}
+        states = {self.root.name: (random_generator.random(sites_quantity) < self.pi_1).astype(np.int8)}
         for idx, node in enumerate(branch_nodes):
             parent_state = states[node.father.name]
             p = np.where(parent_state == 0, p01[idx], p11[idx])
-            states[node.name] = (np.random.random(sites_quantity) < p).astype(np.int8)
+            states[node.name] = (random_generator.random(sites_quantity) < p).astype(np.int8)
 
-        msa = {leaf.name: ''.join(self.alphabet[s] for s in states[leaf.name]) for leaf in leaves}
+        characters = np.frombuffer(''.join(self.alphabet).encode(), dtype=np.uint8)
+        msa = {leaf.name: characters[states[leaf.name]].tobytes().decode() for leaf in leaves}
 
         return self.get_fasta_text(msa) if msa_type == str else msa
 
@@ -1290,15 +2226,18 @@ class Tree:
         if not self.calculated_likelihood:
             self.calculate_up()
 
-        likelihoods_per_rate = np.einsum('j,rji->ri', self.root.frequency, self.root.up_vector)
+        posterior = self.get_posterior_rates(self.compiled_tree.rate_likelihood_vector, prior)
+
+        self.posterior_rates = self.expand_patterns(posterior)
+
+    def get_posterior_rates(self, likelihoods_per_rate: np.ndarray, prior: np.ndarray) -> np.ndarray:
         invalid_mask = (likelihoods_per_rate <= 0.0) | np.isnan(likelihoods_per_rate)
         likelihoods_per_rate = np.where(invalid_mask, eps, likelihoods_per_rate)
         weighted = likelihoods_per_rate * prior[:, np.newaxis]
         weighted_sum = weighted.sum(axis=0)
         numerator = np.einsum('r,ri->i', self.rate_vector, weighted)
-        posterior = np.divide(numerator, weighted_sum, where=(weighted_sum > 0), out=np.zeros_like(numerator))
 
-        self.posterior_rates = posterior
+        return np.divide(numerator, weighted_sum, where=(weighted_sum > 0), out=np.zeros_like(numerator))
 
     def set_pearson_correlation_vector(self, probability_lg: Union[float, np.float64] = 0.5,
                                        number_lg: Union[float, np.float64, int] = 1) -> None:
@@ -1321,20 +2260,10 @@ class Tree:
         # Get indices of sites where the count satisfies the threshold criteria
         unique_item = np.where(counts_per_site >= number_lg)[0]
 
-        # 3. Generate unique pairs (couples) using upper triangle indices
-        idx1, idx2 = np.triu_indices(len(unique_item), k=1)
-        couples = np.column_stack((unique_item[idx1], unique_item[idx2]))
-
-        # 4. Fast matrix computation of Pearson correlation (replaces the second loop)
-        # Extract only the filtered sites from the main probability matrix
+        # 3-4. Pearson correlation of the pairs (couples) of filtered sites, in the order of the upper triangle
+        # indices, computed without the full correlation matrix (see get_site_correlations)
         filtered_probs = site_probs_matrix[:, unique_item]  # Shape: (2*nodes, len(unique_item))
-
-        # Compute the correlation matrix for all combinations of filtered sites
-        # np.corrcoef expects variables in rows, so we transpose filtered_probs
-        corr_matrix = np.corrcoef(filtered_probs.T)
-
-        # Extract correlation coefficients (r) for the targeted pairs
-        r_coefficients = corr_matrix[idx1, idx2]
+        idx1, idx2, r_coefficients, _ = self.get_site_correlations(filtered_probs.T, unique_item, probability_lg)
 
         # 5. Vectorized calculation of p-values for correlation coefficients (safe and precise)
         df = site_probs_matrix.shape[0] - 2
@@ -1356,7 +2285,7 @@ class Tree:
         # For perfect correlations (where valid_r_mask == False), values will remain exact zeros
 
         # 6. Assemble the final matrix of results
-        correlation_vector = np.zeros((4, len(couples)))
+        correlation_vector = np.zeros((4, len(r_coefficients)))
         correlation_vector[0] = unique_item[idx1]  # Site indices i
         correlation_vector[1] = unique_item[idx2]  # Site indices j
         correlation_vector[2] = r_coefficients     # Correlation coefficients r
@@ -1712,7 +2641,42 @@ class Tree:
             else:
                 return obj
         else:
-            return ' '.join(map(str, obj))
+            return ' '.join(map(str, obj)) if obj is not None else ''
+
+    @staticmethod
+    def get_column_decimals(values: List[Any], list_type: type = str, decimals: int = 4, return_list: bool = False
+                            ) -> List[Any]:
+        """
+        Apply `get_list_decimals` to a column of node values.
+
+        Numeric arrays are rounded with one vectorized call (for the whole column when the arrays have the same shape)
+        and converted to lists directly, the other values are converted to JSON compatible values first.
+
+        Args:
+            values (List): The values of the column, one per node.
+            list_type (type, optional): `str` (default), `list`, `tuple` or `set`.
+            decimals (int, optional): 4 (default).
+            return_list (bool, optional): `False` (default).
+        Returns:
+            list: The converted values, equal to `get_list_decimals` of the JSON decoded values.
+        """
+        def is_numeric_array(value: Any) -> bool:
+            return isinstance(value, np.ndarray) and value.dtype.kind in 'biuf'
+
+        if return_list or list_type not in (str, list) or not all(is_numeric_array(value) for value in values):
+            return [Tree.get_list_decimals(Tree.get_json_value(value), list_type, decimals, return_list) for value in
+                    values]
+        if list_type is str:
+            return [' '.join(map(str, value.tolist())) for value in values]
+        if values and len({value.shape for value in values}) == 1:
+            return np.round(np.stack(values).astype(np.float64), decimals).tolist()
+
+        return [np.round(value.astype(np.float64), decimals).tolist() for value in values]
+
+    @staticmethod
+    def get_json_value(obj: Any) -> Any:
+
+        return obj if type(obj) in (str, int, float, bool, type(None)) else loads(dumps(obj, cls=NpEncoder))
 
     @staticmethod
     def is_bootstrap_value(number_str: str, lower: Union[float, np.float64, int] = 0,
@@ -1875,21 +2839,14 @@ class Tree:
         return newick_text and newick_text.startswith('(') and newick_text.endswith(';')
 
     @staticmethod
-    def __set_node(node_str: str, num: Callable) -> Node:
-        if node_str.find(':') > -1:
-            node_data: List[Union[str, int, float]] = node_str.split(':')
-            node_data[0] = node_data[0] if node_data[0] else 'nd' + str(num()).rjust(4, '0')
-            try:
-                node_data[1] = float(node_data[1])
-            except ValueError:
-                node_data[1] = 0.0
-        else:
-            node_data = [node_str if node_str else 'nd' + str(num()).rjust(4, '0'), 0.0]
-
-        newick_node = Node(node_data[0])
-        newick_node.distance_to_father = float(node_data[1])
+    def __get_label(label: str) -> Tuple[str, float]:
+        node_data = label.split(':')
+        try:
+            distance_to_father = float(node_data[1]) if len(node_data) > 1 else 0.0
+        except ValueError:
+            distance_to_father = 0.0
 
-        return newick_node
+        return node_data[0], distance_to_father
 
     @classmethod
     def rename_nodes(cls, phylo_tree: Union[str, 'Tree'], node_name: str = 'N', fill_character: str = '0',
@@ -1901,7 +2858,8 @@ class Tree:
             if re.fullmatch(r'^nd\d{4}$', current_node.name):
                 current_node.name = f'{node_name}{str(num()).rjust(number_length, fill_character)}'
 
-        phylo_tree.all_nodes = {current_node.name: current_node for current_node in phylo_tree.all_nodes_objects}
+        phylo_tree.all_nodes = {current_node.name: current_node for current_node in
+                                reversed(phylo_tree.all_nodes_objects)}
 
         return phylo_tree
 
@@ -1961,3 +2919,19 @@ class Tree:
         dict_node.update({'children': list_children})
 
         return dict_node
+
+
+def initialize_simulation(phylo_tree: Tree, arguments: Dict[str, Any]) -> None:
+    """
+    Initializer of the simulation worker processes: keep the tree (inherited, not pickled, when the processes are
+    forked), a replicate of its compiled tree and the arguments of `Tree.simulate_replicates`.
+    """
+    compiled_tree = phylo_tree.compiled_tree.get_replicate() if arguments.get('use_coevolution_file') else None
+    simulation_arguments.update(arguments, phylo_tree=phylo_tree, compiled_tree=compiled_tree)
+
+
+def simulate_replicates(seed_sequences: List[np.random.SeedSequence]
+                        ) -> Tuple[List[str], Optional[np.ndarray], Optional[np.ndarray]]:
+    arguments = dict(simulation_arguments)
+
+    return arguments.pop('phylo_tree').simulate_replicates(seed_sequences, **arguments)
@@ -0,0 +1,60 @@
+from gloome.tree.tree import Tree
+from pathlib import Path
+import numpy as np
+
+BIN_DIR = Path.cwd().parent
+
+
+def read_file(file_path: Path) -> str:
+    if file_path.is_file():
+        with open(file_path, 'r') as f:
+            return f.read()
+    return ''
+
+
+def get_fit(fasta_text: str, newick_text: str, is_optimize_branch_lengths: bool = True, **kwargs):
+    tree_data = {'pi_1': 0.5,
+                 'alpha': 0.5,
+                 'categories_quantity': 4,
+                 'coefficient_bl': 1,
+                 'is_optimize_pi': True,
+                 'is_optimize_pi_average': False,
+                 'is_optimize_alpha': True,
+                 'is_optimize_bl': True,
+                 'is_optimize_branch_lengths': is_optimize_branch_lengths,
+                 }
+    gloome_tree = Tree(newick_text, msa=fasta_text, **tree_data, **kwargs)
+
+    return (gloome_tree.log_likelihood, gloome_tree.pi_1, gloome_tree.alpha, gloome_tree.coefficient_bl,
+            gloome_tree.compiled_tree.branch_length.copy())
+
+
+def check_fits(fits: list, label: str) -> None:
+    for fit in fits[1:]:
+        for value, other_value in zip(fits[0], fit):
+            assert np.array_equal(value, other_value), (label, value, other_value)
+
+
+def main():
+    dirname = BIN_DIR
+    for n in (0, 1, 10):
+        msa_file = dirname.joinpath(f'gloome/data/initial_data/msa/patternMSA{n}.msa')
+        tree_file = dirname.joinpath(f'gloome/data/initial_data/tree/newickTree{n}.tree')
+        fasta_text = read_file(msa_file)
+        newick_text = read_file(tree_file)
+
+        initial_fit = get_fit(fasta_text, newick_text, False)
+        # the resident fit (per-branch sweeps) must not depend on the number of threads
+        resident_fits = [get_fit(fasta_text, newick_text), get_fit(fasta_text, newick_text, threads=3)]
+        check_fits(resident_fits, f'patternMSA{n} resident')
+        # the chunked fit (L-BFGS-B) must not depend on the block length nor on the number of threads
+        chunked_fits = [get_fit(fasta_text, newick_text, site_block_size=32),
+                        get_fit(fasta_text, newick_text, site_block_size=64, threads=3)]
+        check_fits(chunked_fits, f'patternMSA{n} chunked')
+        # both must improve the fit without branch lengths optimization
+        assert resident_fits[0][0] > initial_fit[0] and chunked_fits[0][0] > initial_fit[0]
+        print(f'\tpatternMSA{n}: log-likelihood {round(float(initial_fit[0]), 4)}, resident fit '
+              f'{round(float(resident_fits[0][0]), 4)}, chunked fit {round(float(chunked_fits[0][0]), 4)}')
+
+
+main()
@@ -0,0 +1,145 @@
+from gloome.tree.tree import Tree
+from gloome.tree.node import Node
+from typing import Dict
+from pathlib import Path
+from scipy.linalg import expm
+from tempfile import TemporaryDirectory
+import numpy as np
+
+BIN_DIR = Path.cwd().parent
+
+
+def read_file(file_path: Path) -> str:
+    if file_path.is_file():
+        with open(file_path, 'r') as f:
+            return f.read()
+    return ''
+
+
+def get_recursive_pmatrix(gloome_tree: Tree, current_node: Node) -> np.ndarray:
+    pi_1 = gloome_tree.pi_1
+    qmatrix = np.asarray(((-1 / (2 * (1 - pi_1)), 1 / (2 * (1 - pi_1))), (1 / (2 * pi_1), -1 / (2 * pi_1))))
+    distance = current_node.distance_to_father if current_node.father else 0.0
+
+    return np.stack([expm(qmatrix * (distance * gloome_tree.coefficient_bl * rate))
+                     for rate in gloome_tree.rate_vector])
+
+
+def get_recursive_marginal(gloome_tree: Tree) -> Dict[str, np.ndarray]:
+    """
+    Log-likelihood and node probabilities of every site with the recursive per-node passes of the engine the
+    compiled tree replaced (no site patterns, no scaling, no site blocks).
+    """
+    rate_vector_length, alphabet_length, msa_length = (gloome_tree.rate_vector_length, gloome_tree.alphabet_length,
+                                                       gloome_tree.msa_length)
+    frequency = gloome_tree.frequency
+    pmatrix, up_vector, down_vector = {}, {}, {}
+
+    def calculate_up(current_node: Node) -> None:
+        pmatrix[current_node.name] = get_recursive_pmatrix(gloome_tree, current_node)
+        if not current_node.children:
+            sequence = np.asarray(list(gloome_tree.msa[current_node.name]))
+            up = np.zeros((rate_vector_length, alphabet_length, msa_length), dtype=np.float64)
+            for j, character in enumerate(gloome_tree.alphabet):
+                up[:, j, sequence == character] = 1.0
+            up[:, :, (sequence == '-') | (sequence == '?')] = 1.0
+            up_vector[current_node.name] = up
+            return
+        up = np.ones((rate_vector_length, alphabet_length, msa_length))
+        for child in current_node.children:
+            calculate_up(child)
+            up *= np.einsum('rji,ril->rjl', pmatrix[child.name], up_vector[child.name])
+        up_vector[current_node.name] = up
+
+    def calculate_down(current_node: Node) -> None:
+        down = np.ones((rate_vector_length, alphabet_length, msa_length))
+        if current_node.father:
+            for brother in current_node.father.children:
+                if brother is not current_node:
+                    down *= np.einsum('rji,ril->rjl', pmatrix[brother.name], up_vector[brother.name])
+            if current_node.father.father:
+                down *= np.einsum('rji,ril->rjl', pmatrix[current_node.father.name],
+                                  down_vector[current_node.father.name])
+        down_vector[current_node.name] = down
+        for child in current_node.children:
+            calculate_down(child)
+
+    root = gloome_tree.root
+    calculate_up(root)
+    calculate_down(root)
+    likelihood = np.sum(np.mean(up_vector[root.name] * frequency[:, np.newaxis], axis=0), axis=0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        log_likelihood_vector = np.log(likelihood)
+
+        probability_vector = {}
+        for current_node in gloome_tree.all_nodes_objects:
+            marginal = up_vector[current_node.name] * np.einsum('i,rij,ril->rjl', frequency,
+                                                                pmatrix[current_node.name],
+                                                                down_vector[current_node.name])
+            probability_vector[current_node.name] = (np.sum(marginal, axis=0) / (rate_vector_length * likelihood)).T
+
+    return {'log_likelihood_vector': log_likelihood_vector, 'probability_vector': probability_vector}
+
+
+def check_marginal(fasta_text: str, newick_text: str, **kwargs) -> None:
+    tree_data = {'pi_1': 0.3,
+                 'alpha': 0.5,
+                 'categories_quantity': 4,
+                 'coefficient_bl': 1.5,
+                 }
+    gloome_tree = Tree(newick_text, msa=fasta_text, **tree_data, **kwargs)
+    gloome_tree.calculate_tree()
+    reference = get_recursive_marginal(gloome_tree)
+
+    # the unscaled recursive passes underflow on the least likely sites of the larger trees, which are skipped
+    sites = reference['log_likelihood_vector'] > np.log(np.finfo(np.float64).tiny)
+    assert np.any(sites)
+    assert np.allclose(gloome_tree.log_likelihood_vector[sites], reference['log_likelihood_vector'][sites], rtol=1e-10,
+                       atol=0)
+    if np.all(sites):
+        assert np.isclose(gloome_tree.log_likelihood, np.sum(reference['log_likelihood_vector']), rtol=1e-10, atol=0)
+    for current_node in gloome_tree.all_nodes_objects:
+        assert np.allclose(current_node.probability_vector[sites],
+                           reference['probability_vector'][current_node.name][sites], rtol=0, atol=1e-10), \
+            current_node.name
+
+
+def get_simulation(fasta_text: str, newick_text: str, processes: int) -> list:
+    tree_data = {'pi_1': 0.5,
+                 'alpha': 0.5,
+                 'categories_quantity': 4,
+                 'coefficient_bl': 1,
+                 'processes': processes,
+                 'seed': 7,
+                 'is_sequential_simulation': True,
+                 }
+    gloome_tree = Tree(newick_text, msa=fasta_text, **tree_data)
+    gloome_tree.calculate_tree()
+    with TemporaryDirectory() as dirname:
+        files = gloome_tree.simulate_datasets(dirname, number_datasets=20, use_coevolution_file=True)
+        return [read_file(Path(file_path)) for file_path in files.values()] + [gloome_tree.simulated_datasets_quantity]
+
+
+def main():
+    dirname = BIN_DIR
+    for n in (0, 1, 10):
+        msa_file = dirname.joinpath(f'gloome/data/initial_data/msa/patternMSA{n}.msa')
+        tree_file = dirname.joinpath(f'gloome/data/initial_data/tree/newickTree{n}.tree')
+        fasta_text = read_file(msa_file)
+        newick_text = read_file(tree_file)
+
+        # the compiled tree (resident, in site blocks, with threads) must match the recursive passes
+        for kwargs in ({}, {'site_block_size': 32}, {'site_block_size': 64, 'threads': 3}):
+            check_marginal(fasta_text, newick_text, **kwargs)
+            print(f'\tpatternMSA{n} {kwargs}: same log-likelihood and marginals as the recursive passes')
+
+    # the simulations with one seed must not depend on the number of processes
+    msa_file = dirname.joinpath('gloome/data/initial_data/msa/patternMSA1.msa')
+    tree_file = dirname.joinpath('gloome/data/initial_data/tree/newickTree1.tree')
+    fasta_text = read_file(msa_file)
+    newick_text = read_file(tree_file)
+    assert get_simulation(fasta_text, newick_text, 1) == get_simulation(fasta_text, newick_text, 3)
+    print('\tpatternMSA1: same simulations with 1 and 3 processes')
+
+
+main()
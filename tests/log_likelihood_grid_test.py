@@ -0,0 +1,62 @@
+from gloome.tree.tree import Tree
+from pathlib import Path
+import numpy as np
+
+BIN_DIR = Path.cwd().parent
+
+
+def read_file(file_path: Path) -> str:
+    if file_path.is_file():
+        with open(file_path, 'r') as f:
+            return f.read()
+    return ''
+
+
+def get_log_likelihood(gloome_tree: Tree, pi_1: float, alpha: float, coefficient_bl: float) -> float:
+    gloome_tree.clean_all()
+    gloome_tree.set_parameters(np.asarray((pi_1, alpha, coefficient_bl)), ('pi_1', 'alpha', 'coefficient_bl'))
+    gloome_tree.set_vars()
+    gloome_tree.calculate_up()
+
+    return gloome_tree.log_likelihood
+
+
+def check_grid(fasta_text: str, newick_text: str, **kwargs) -> None:
+    tree_data = {'pi_1': 0.3,
+                 'alpha': 0.7,
+                 'categories_quantity': 4,
+                 'coefficient_bl': 1.3,
+                 }
+    gloome_tree = Tree(newick_text, msa=fasta_text, **tree_data, **kwargs)
+    # repeated alpha values share their rate categories
+    pi_1 = np.asarray((0.1, 0.3, 0.5, 0.8, 0.3, 0.6))
+    alpha = np.asarray((0.3, 0.7, 0.7, 2.5, 8.0, 0.3))
+    coefficient_bl = np.asarray((3.0, 1.3, 0.5, 0.4, 1.0, 1.3))
+
+    log_likelihood_grid = gloome_tree.get_log_likelihood_grid(pi_1, alpha, coefficient_bl)
+    # broadcasting and the current values of the omitted parameters
+    alpha_grid = gloome_tree.get_log_likelihood_grid(alpha=alpha)
+    scalar_grid = gloome_tree.get_log_likelihood_grid(0.5, 0.7, 0.5)
+
+    log_likelihoods = [get_log_likelihood(gloome_tree, *parameters) for parameters in zip(pi_1, alpha, coefficient_bl)]
+    assert np.allclose(log_likelihood_grid, log_likelihoods, rtol=1e-12, atol=0), (log_likelihood_grid, log_likelihoods)
+    assert np.allclose(alpha_grid, [get_log_likelihood(gloome_tree, 0.3, value, 1.3) for value in alpha], rtol=1e-12,
+                       atol=0)
+    assert scalar_grid.shape == (1, ) and np.isclose(scalar_grid[0], log_likelihoods[2], rtol=1e-12, atol=0)
+
+
+def main():
+    dirname = BIN_DIR
+    for n in (0, 1, 10):
+        msa_file = dirname.joinpath(f'gloome/data/initial_data/msa/patternMSA{n}.msa')
+        tree_file = dirname.joinpath(f'gloome/data/initial_data/tree/newickTree{n}.tree')
+        fasta_text = read_file(msa_file)
+        newick_text = read_file(tree_file)
+
+        # the batched up pass (resident, in site blocks, with threads) must match separate evaluations
+        for kwargs in ({}, {'site_block_size': 32}, {'site_block_size': 64, 'threads': 3}):
+            check_grid(fasta_text, newick_text, **kwargs)
+            print(f'\tpatternMSA{n} {kwargs}: same log-likelihood grid as separate evaluations')
+
+
+main()
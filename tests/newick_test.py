@@ -0,0 +1,116 @@
+import re
+import numpy as np
+from time import perf_counter
+from typing import Optional
+from gloome.tree.tree import Tree
+
+
+def generate_newick(leaves_quantity: int, seed: Optional[int] = None) -> str:
+    random_generator = np.random.default_rng(seed)
+    subtrees = [f't{i + 1}' for i in range(leaves_quantity)]
+    while len(subtrees) > 2:
+        i, j = sorted(random_generator.choice(len(subtrees), 2, replace=False))
+        branch_lengths = random_generator.uniform(0.01, 0.5, 2)
+        subtrees[i] = f'({subtrees[i]}:{branch_lengths[0]:.4f},{subtrees[j]}:{branch_lengths[1]:.4f})'
+        subtrees[j] = subtrees[-1]
+        subtrees.pop()
+    branch_lengths = random_generator.uniform(0.01, 0.5, 2)
+
+    return f'({subtrees[0]}:{branch_lengths[0]:.4f},{subtrees[1]}:{branch_lengths[1]:.4f});'
+
+
+def get_nodes(gloome_tree: Tree) -> list:
+
+    return [(current_node.name, current_node.node_type, round(current_node.distance_to_father, 10),
+             round(current_node.distance_to_root, 10), current_node.level, current_node.levels_to_nearest,
+             round(current_node.distance_to_nearest, 10), current_node.father.name if current_node.father else '')
+            for current_node in gloome_tree.get_list_nodes_info(only_node_list=True)]
+
+
+def check_generated_tree(newick_text: str, leaves_quantity: int) -> None:
+    gloome_tree = Tree(newick_text)
+    nodes = gloome_tree.get_list_nodes_info(only_node_list=True)
+    leaves = [current_node for current_node in nodes if not current_node.children]
+    internal_nodes = [current_node for current_node in nodes if current_node.children]
+    # the leaves keep their names and branch lengths, the unnamed nodes are numbered ndXXXX bottom up to the root
+    assert sorted(current_node.name for current_node in leaves) == sorted(f't{i + 1}' for i in range(leaves_quantity))
+    assert sorted(current_node.name for current_node in internal_nodes) == [
+        f'nd{str(i + 1).rjust(4, "0")}' for i in range(len(internal_nodes))]
+    assert gloome_tree.root.name == f'nd{str(len(internal_nodes)).rjust(4, "0")}'
+    branch_lengths = dict(re.findall(r'(t\d+):(\d+\.\d+)', newick_text))
+    assert all(current_node.distance_to_father == float(branch_lengths[current_node.name]) for current_node in leaves)
+
+    ancestors = {}
+    for leaf in leaves:
+        father = leaf.father
+        while father:
+            ancestors.setdefault(id(father), []).append(leaf)
+            father = father.father
+    for current_node in nodes:
+        path, father = [], current_node
+        while father.father:
+            path.append(father.distance_to_father)
+            father = father.father
+        assert current_node.level == len(path) + 1, current_node.name
+        assert np.isclose(current_node.distance_to_root, sum(path), rtol=0, atol=1e-12), current_node.name
+        subtree_leaves = ancestors.get(id(current_node))
+        if subtree_leaves:
+            assert current_node.levels_to_nearest == min(leaf.level for leaf in subtree_leaves) - current_node.level
+            assert np.isclose(current_node.distance_to_nearest, min(leaf.distance_to_root for leaf in subtree_leaves) -
+                              current_node.distance_to_root, rtol=0, atol=1e-12), current_node.name
+        else:
+            assert current_node.levels_to_nearest == 0 and current_node.distance_to_nearest == 0
+
+    # the same tree after a round trip through get_newick
+    assert get_nodes(Tree(gloome_tree.get_newick())) == get_nodes(gloome_tree)
+
+
+def check_bootstrap_values() -> None:
+    # the bootstrap values of the internal nodes are dropped and the nodes numbered as the unnamed ones; other labels
+    # are kept, and numeric labels that remain are renamed after them
+    gloome_tree = Tree('((A:0.1,B:0.2)90:0.3,(C:0.4,D:0.5)75:0.6);')
+    assert get_nodes(gloome_tree) == [('nd0003', 'root', 0.0, 0.0, 1, 2, 0.4, ''),
+                                      ('nd0002', 'node', 0.3, 0.3, 2, 1, 0.1, 'nd0003'),
+                                      ('A', 'leaf', 0.1, 0.4, 3, 0, 0.0, 'nd0002'),
+                                      ('B', 'leaf', 0.2, 0.5, 3, 0, 0.0, 'nd0002'),
+                                      ('nd0001', 'node', 0.6, 0.6, 2, 1, 0.4, 'nd0003'),
+                                      ('C', 'leaf', 0.4, 1.0, 3, 0, 0.0, 'nd0001'),
+                                      ('D', 'leaf', 0.5, 1.1, 3, 0, 0.0, 'nd0001')]
+    gloome_tree = Tree('((A:0.1,B:0.2)X:0.3,(C:0.4,(D:0.5,F:0.1):0.2)0.95:0.6);')
+    assert get_nodes(gloome_tree) == [('nd0002', 'root', 0.0, 0.0, 1, 2, 0.4, ''),
+                                      ('X', 'node', 0.3, 0.3, 2, 1, 0.1, 'nd0002'),
+                                      ('A', 'leaf', 0.1, 0.4, 3, 0, 0.0, 'X'),
+                                      ('B', 'leaf', 0.2, 0.5, 3, 0, 0.0, 'X'),
+                                      ('nd0003', 'node', 0.6, 0.6, 2, 1, 0.3, 'nd0002'),
+                                      ('C', 'leaf', 0.4, 1.0, 3, 0, 0.0, 'nd0003'),
+                                      ('nd0001', 'node', 0.2, 0.8, 3, 1, 0.1, 'nd0003'),
+                                      ('D', 'leaf', 0.5, 1.3, 4, 0, 0.0, 'nd0001'),
+                                      ('F', 'leaf', 0.1, 0.9, 4, 0, 0.0, 'nd0001')]
+    gloome_tree = Tree('(A:1,(B:1,(C:1,D:1)):1)R;')
+    assert get_nodes(gloome_tree) == [('R', 'root', 0.0, 0.0, 1, 1, 1.0, ''),
+                                      ('A', 'leaf', 1.0, 1.0, 2, 0, 0.0, 'R'),
+                                      ('nd0002', 'node', 1.0, 1.0, 2, 1, 1.0, 'R'),
+                                      ('B', 'leaf', 1.0, 2.0, 3, 0, 0.0, 'nd0002'),
+                                      ('nd0001', 'node', 0.0, 1.0, 3, 1, 1.0, 'nd0002'),
+                                      ('C', 'leaf', 1.0, 2.0, 4, 0, 0.0, 'nd0001'),
+                                      ('D', 'leaf', 1.0, 2.0, 4, 0, 0.0, 'nd0001')]
+
+
+def main():
+    for leaves_quantity, seed in ((5, 1), (12, 2), (40, 3)):
+        check_generated_tree(generate_newick(leaves_quantity, seed), leaves_quantity)
+    check_bootstrap_values()
+    print('\tsame names, numbering, distances and levels as the generated trees')
+
+    leaves_list = [10 ** 2, 10 ** 3, 10 ** 4, 10 ** 5]
+    seed = 42
+    for leaves_quantity in leaves_list:
+        newick_text = generate_newick(leaves_quantity, seed)
+        start = perf_counter()
+        gloome_tree = Tree(newick_text)
+        print(f'\tleaves: {leaves_quantity:>7}  nodes: {gloome_tree.get_node_count():>7}  '
+              f'parse time: {perf_counter() - start:.3f} s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+from gloome.tree.tree import Tree
+from pathlib import Path
+import numpy as np
+
+BIN_DIR = Path.cwd().parent
+
+
+def read_file(file_path: Path) -> str:
+    if file_path.is_file():
+        with open(file_path, 'r') as f:
+            return f.read()
+    return ''
+
+
+def get_numerical_gradient(gloome_tree: Tree, parameters: np.ndarray, names: tuple, step: float = 4e-5
+                           ) -> np.ndarray:
+    # central differences, Richardson-extrapolated over the steps h and h / 2
+    def get_difference(k: int, current_step: float) -> float:
+        shift = np.zeros(len(parameters))
+        shift[k] = current_step
+        upper, _ = gloome_tree.parameters_optimization(parameters + shift, names)
+        lower, _ = gloome_tree.parameters_optimization(parameters - shift, names)
+
+        return (upper - lower) / (2 * current_step)
+
+    return np.asarray([(4 * get_difference(k, step / 2) - get_difference(k, step)) / 3
+                       for k in range(len(parameters))])
+
+
+def check_gradient(fasta_text: str, newick_text: str, names: tuple, parameters: tuple) -> None:
+    tree_data = dict(zip(('pi_1', 'alpha', 'coefficient_bl'), (0.3, 0.7, 1.3)))
+    tree_data['categories_quantity'] = 4
+    gloome_tree = Tree(newick_text, msa=fasta_text, **tree_data)
+    parameters = np.asarray(parameters, dtype=np.float64)
+
+    _, gradient = gloome_tree.parameters_optimization(parameters, names)
+    numerical_gradient = get_numerical_gradient(gloome_tree, parameters, names)
+    # the derivatives with respect to alpha go through the gamma quantiles, whose rounding (about 1e-13 relative)
+    # both sides difference
+    rtol = np.asarray([5e-9 if name == 'alpha' else 1e-9 for name in names])
+    relative_error = np.abs(gradient - numerical_gradient) / np.linalg.norm(numerical_gradient)
+    assert np.all(relative_error <= rtol), (names, parameters, gradient, numerical_gradient)
+
+
+def main():
+    dirname = BIN_DIR
+    for n in (1, 10):
+        msa_file = dirname.joinpath(f'gloome/data/initial_data/msa/patternMSA{n}.msa')
+        tree_file = dirname.joinpath(f'gloome/data/initial_data/tree/newickTree{n}.tree')
+        fasta_text = read_file(msa_file)
+        newick_text = read_file(tree_file)
+
+        # the analytic gradient must match the finite differences of the log-likelihood, for every parameter
+        # and for subsets of them in another order
+        for names, parameters in ((('pi_1', 'alpha', 'coefficient_bl'), (0.3, 0.7, 1.3)),
+                                  (('pi_1', 'alpha', 'coefficient_bl'), (0.8, 2.5, 0.4)),
+                                  (('pi_1', 'alpha', 'coefficient_bl'), (0.1, 0.3, 3.0)),
+                                  (('pi_1', 'alpha', 'coefficient_bl'), (0.6, 8.0, 0.8)),
+                                  (('coefficient_bl', 'pi_1'), (1.3, 0.3)),
+                                  (('alpha', ), (0.7, ))):
+            check_gradient(fasta_text, newick_text, names, parameters)
+        print(f'\tpatternMSA{n}: same gradient of parameters_optimization as the finite differences')
+
+
+main()
@@ -0,0 +1,215 @@
+from gloome.tree import tree as tree_module
+from gloome.tree.tree import Tree
+from gloome.services.service_functions import check_data
+from pathlib import Path
+import numpy as np
+
+BIN_DIR = Path.cwd().parent
+
+
+def read_file(file_path: Path) -> str:
+    if file_path.is_file():
+        with open(file_path, 'r') as f:
+            return f.read()
+    return ''
+
+
+def get_site_matrix(fasta_text: str, newick_text: str):
+    tree_data = {'pi_1': 0.5,
+                 'alpha': 0.5,
+                 'categories_quantity': 4,
+                 'coefficient_bl': 1,
+                 }
+    gloome_tree = Tree(newick_text, msa=fasta_text, **tree_data)
+    gloome_tree.calculate_tree()
+    gloome_tree.set_posterior_rates_vector()
+    site_matrix, candidates, categories = gloome_tree.identify_event_candidates(0.5)
+
+    return gloome_tree, site_matrix, candidates, categories
+
+
+def check_correlated_pairs(gloome_tree: Tree, matrix: np.ndarray, candidates: np.ndarray) -> None:
+    # the default output is the upper triangle of the full correlation matrix, in the order of np.triu_indices
+    correlations = np.corrcoef(matrix)
+    i_idx, j_idx = np.triu_indices(len(matrix), k=1)
+    i, j, r_values = Tree.get_correlated_pairs(matrix)
+    assert np.array_equal(i, i_idx) and np.array_equal(j, j_idx)
+    assert np.allclose(r_values, correlations[i_idx, j_idx], rtol=0, atol=1e-12)
+    assert gloome_tree.get_pairs_length(candidates) == len(r_values)
+
+    # stripes of a few rows give the same pairs
+    correlation_block_size = tree_module.correlation_block_size
+    tree_module.correlation_block_size = 3 * len(matrix)
+    try:
+        striped_i, striped_j, striped_r_values = Tree.get_correlated_pairs(matrix)
+    finally:
+        tree_module.correlation_block_size = correlation_block_size
+    assert np.array_equal(striped_i, i) and np.array_equal(striped_j, j)
+    assert np.allclose(striped_r_values, r_values, rtol=0, atol=1e-12)
+
+    # the thresholded pairs are the pairs of the full run with |r| >= threshold
+    for threshold in (0.1, 0.3, 0.5):
+        kept = np.abs(r_values) >= threshold
+        threshold_i, threshold_j, threshold_r_values = Tree.get_correlated_pairs(matrix, threshold)
+        assert np.array_equal(threshold_i, i[kept]) and np.array_equal(threshold_j, j[kept])
+        assert np.array_equal(threshold_r_values, r_values[kept])
+
+    # float32 only changes the rounding of the correlations
+    float32_i, float32_j, float32_r_values = Tree.get_correlated_pairs(matrix, dtype=np.float32)
+    assert float32_r_values.dtype == np.float32
+    assert np.array_equal(float32_i, i) and np.array_equal(float32_j, j)
+    assert np.allclose(float32_r_values, r_values, rtol=0, atol=1e-5)
+
+    # the pairs left out by the threshold count as p-values of 1 in the Benjamini-Hochberg family
+    p_values = np.linspace(1e-4, 1.0, len(r_values))[np.argsort(np.argsort(-np.abs(r_values)))]
+    kept = np.abs(r_values) >= 0.3
+    q_values = Tree.benjamini_hochberg(np.where(kept, p_values, 1.0))
+    assert np.allclose(Tree.benjamini_hochberg(p_values[kept], len(r_values)), q_values[kept], rtol=1e-12, atol=0)
+
+
+def check_approximate_pairs(matrix: np.ndarray) -> None:
+    i, j, r_values = Tree.get_correlated_pairs(matrix)
+    for threshold in (0.3, 0.5):
+        kept = np.abs(r_values) >= threshold
+        exact_pairs = set(zip(i[kept].tolist(), j[kept].tolist()))
+        approximate_i, approximate_j, approximate_r_values = Tree.get_approximate_pairs(
+            matrix, threshold, random_generator=np.random.default_rng(7))
+        approximate_pairs = list(zip(approximate_i.tolist(), approximate_j.tolist()))
+        # only pairs of the exact kernel, with their exact correlations, and at least the expected recall
+        assert set(approximate_pairs) <= exact_pairs
+        assert np.allclose(approximate_r_values, r_values[kept][np.isin(i[kept] * len(matrix) + j[kept],
+                                                                         approximate_i * len(matrix) + approximate_j)],
+                           rtol=0, atol=1e-12)
+        recall = len(approximate_pairs) / max(len(exact_pairs), 1)
+        assert recall >= tree_module.projection_recall - 0.05, (threshold, recall)
+        print(f'\t\tapproximate search at |r| >= {threshold}: recall {round(recall, 4)} of {len(exact_pairs)} pairs')
+
+
+def check_query_pairs(gloome_tree: Tree, matrix: np.ndarray, candidates: np.ndarray) -> None:
+    i, j, r_values = Tree.get_correlated_pairs(matrix)
+    rows = np.asarray((0, 17, 42, len(matrix) - 1))
+    is_query = np.isin(i, rows) | np.isin(j, rows)
+    # the pairs of the query rows are the query rows of a full run, in the same order
+    query_i, query_j, query_r_values = Tree.get_correlated_pairs(matrix, query=rows)
+    assert np.array_equal(query_i, i[is_query]) and np.array_equal(query_j, j[is_query])
+    assert np.allclose(query_r_values, r_values[is_query], rtol=0, atol=1e-12)
+
+    gloome_tree.query_positions = tuple(candidates[rows].tolist())
+    site_i, site_j, site_r_values, _ = gloome_tree.get_site_correlations(matrix, candidates)
+    assert np.array_equal(site_i, query_i) and np.array_equal(site_j, query_j)
+    assert np.array_equal(site_r_values, query_r_values)
+    assert gloome_tree.get_pairs_length(candidates) == np.count_nonzero(is_query)
+    gloome_tree.query_positions = ()
+
+
+def check_query_positions(fasta_text: str, newick_text: str, msa_length: int) -> None:
+    def get_query_errors(query_positions: str) -> list:
+        arguments = ([newick_text, fasta_text, 4, 0.5, 0.5, 1.0, 0.5, 1, 100, ''] + [True] * 17 +
+                     ['midpoint', '', query_positions])
+
+        return [error for error in check_data(*arguments) if error[0].startswith('Query positions')]
+
+    assert not get_query_errors('')
+    assert not get_query_errors(f'0, 5 {msa_length - 1}')
+    assert get_query_errors(f'0, {msa_length}')
+    assert get_query_errors('5, -1')
+    assert get_query_errors('five')
+
+
+def get_brute_force_screened_pairs(events: np.ndarray, threshold: float) -> list:
+    rows_length, columns_length = events.shape
+    pairs = []
+    for i in range(rows_length):
+        for j in range(i + 1, rows_length):
+            first, second = int(events[i].sum()), int(events[j].sum())
+            shared = int(np.sum(events[i] & events[j]))
+            denominator = np.sqrt(first * second * (columns_length - first) * (columns_length - second))
+            # pairs without shared events are left out
+            if shared and denominator > 0 and abs(columns_length * shared - first * second) / denominator >= threshold:
+                pairs.append((i, j))
+
+    return pairs
+
+
+def check_screened_pairs(gloome_tree: Tree, matrix: np.ndarray, candidates: np.ndarray) -> None:
+    events = matrix >= 0.5
+    rows = np.asarray((0, 17, 42, len(matrix) - 1))
+    for threshold in (0.1, 0.3, 0.5):
+        pairs = get_brute_force_screened_pairs(events, threshold)
+        i, j = Tree.get_screened_pairs(events, threshold)
+        assert list(zip(i.tolist(), j.tolist())) == pairs, threshold
+        query_i, query_j = Tree.get_screened_pairs(events, threshold, rows)
+        assert list(zip(query_i.tolist(), query_j.tolist())) == [pair for pair in pairs if pair[0] in rows or
+                                                                 pair[1] in rows], threshold
+        print(f'\t\tevent screen at |phi| >= {threshold}: {len(pairs)} pairs')
+
+    # the Benjamini-Hochberg family of the screened pairs is still all the candidate pairs
+    gloome_tree.screen_threshold = 0.3
+    _, _, r_values, screened = gloome_tree.get_site_correlations(matrix, candidates)
+    assert len(screened[0]) < gloome_tree.get_pairs_length(candidates) == len(candidates) * (len(candidates) - 1) // 2
+    gloome_tree.screen_threshold = 0.0
+
+
+def check_extreme_counts() -> None:
+    random_generator = np.random.default_rng(7)
+    # correlations rounded to one decimal (ties between observed and null values, of both signs) in 4 rate categories,
+    # the null values missing the bins (0, 3) and (3, 3) (empty bins)
+    r_values = np.round(random_generator.uniform(-1, 1, 500), 1)
+    bins = np.sort(random_generator.integers(0, 4, (500, 2)), axis=1)
+    null_r_values = np.round(random_generator.uniform(-1, 1, 5000), 1)
+    null_bins = np.sort(random_generator.integers(0, 4, (5000, 2)), axis=1)
+    is_empty = ((null_bins[:, 0] == 0) & (null_bins[:, 1] == 3)) | ((null_bins[:, 0] == 3) & (null_bins[:, 1] == 3))
+    null_r_values, null_bins = null_r_values[~is_empty], null_bins[~is_empty]
+
+    count_extreme = Tree.get_extreme_counts(r_values, bins, null_r_values, null_bins)
+    null_length = np.zeros(len(r_values), dtype=np.int64)
+    for k, (r, current_bin) in enumerate(zip(r_values, bins)):
+        is_bin = np.all(null_bins == current_bin, axis=1)
+        assert count_extreme[k] == np.count_nonzero(is_bin & (np.abs(null_r_values) >= abs(r))), k
+        null_length[k] = np.count_nonzero(is_bin)
+    assert np.any(null_length == 0) and np.all(count_extreme[null_length == 0] == 0)
+
+    p_values = Tree.empirical_p(count_extreme, null_length)
+    assert np.array_equal(p_values[null_length == 0], np.ones(np.count_nonzero(null_length == 0)))
+    is_counted = null_length > 0
+    assert np.allclose(p_values[is_counted], (count_extreme[is_counted] + 1) / (null_length[is_counted] + 1),
+                       rtol=1e-15, atol=0)
+
+    # the counts of several batches of null values add up
+    half = len(null_r_values) // 2
+    assert np.array_equal(Tree.get_extreme_counts(r_values, bins, null_r_values[:half], null_bins[:half]) +
+                          Tree.get_extreme_counts(r_values, bins, null_r_values[half:], null_bins[half:]),
+                          count_extreme)
+    # a batch without null values
+    assert not np.any(Tree.get_extreme_counts(r_values, bins, np.zeros(0), np.zeros((0, 2), dtype=np.int64)))
+
+
+def main():
+    dirname = BIN_DIR
+    msa_file = dirname.joinpath('gloome/data/initial_data/msa/patternMSA1.msa')
+    tree_file = dirname.joinpath('gloome/data/initial_data/tree/newickTree1.tree')
+    fasta_text = read_file(msa_file)
+    newick_text = read_file(tree_file)
+    gloome_tree, site_matrix, candidates, categories = get_site_matrix(fasta_text, newick_text)
+    matrix = site_matrix[candidates]
+
+    check_correlated_pairs(gloome_tree, matrix, candidates)
+    print(f'\tpatternMSA1: correlated pairs of {len(candidates)} candidate sites')
+    check_approximate_pairs(matrix)
+
+    # the Benjamini-Hochberg family of the approximate search is still all the candidate pairs
+    gloome_tree.correlation_threshold, gloome_tree.is_approximate_correlation, gloome_tree.seed = 0.5, True, 7
+    _, _, r_values, _ = gloome_tree.get_site_correlations(matrix, candidates)
+    assert len(r_values) < gloome_tree.get_pairs_length(candidates) == len(candidates) * (len(candidates) - 1) // 2
+    gloome_tree.correlation_threshold, gloome_tree.is_approximate_correlation = 0.0, False
+
+    check_query_pairs(gloome_tree, matrix, candidates)
+    check_query_positions(fasta_text, newick_text, gloome_tree.msa_length)
+    print('\t\tquery positions: same pairs as the query rows of a full run')
+    check_screened_pairs(gloome_tree, matrix, candidates)
+
+    check_extreme_counts()
+    print('\textreme null correlations: same counts and p-values as a brute-force count')
+
+
+main()
@@ -0,0 +1,89 @@
+from gloome.tree.tree import Tree
+from pathlib import Path
+import numpy as np
+
+BIN_DIR = Path.cwd().parent
+
+
+def read_file(file_path: Path) -> str:
+    if file_path.is_file():
+        with open(file_path, 'r') as f:
+            return f.read()
+    return ''
+
+
+def get_tree(fasta_text: str, newick_text: str) -> Tree:
+    tree_data = {'pi_1': 0.3,
+                 'alpha': 0.5,
+                 'categories_quantity': 4,
+                 'coefficient_bl': 1.5,
+                 }
+
+    return Tree(newick_text, msa=fasta_text, **tree_data)
+
+
+def get_branch_lengths(gloome_tree: Tree) -> dict:
+    # a leaf, the deepest internal node and a child of the root, each set to a new length
+    nodes = [current_node for current_node in gloome_tree.all_nodes_objects if current_node.father]
+    leaf = next(current_node for current_node in nodes if not current_node.children)
+    internal = max((current_node for current_node in nodes if current_node.children),
+                   key=lambda current_node: current_node.distance_to_root, default=None)
+    root_child = gloome_tree.root.children[-1]
+
+    return {current_node.name: 0.5 * current_node.distance_to_father + 0.05
+            for current_node in (leaf, internal, root_child) if current_node is not None}
+
+
+def check_update(fasta_text: str, newick_text: str) -> None:
+    gloome_tree = get_tree(fasta_text, newick_text)
+    gloome_tree.calculate_tree()
+    branch_lengths = get_branch_lengths(gloome_tree)
+    for name, distance_to_father in branch_lengths.items():
+        gloome_tree.set_branch_length(name, distance_to_father)
+    log_likelihood = gloome_tree.update_likelihood()
+
+    # the same branch lengths, with a full pass
+    reference_tree = get_tree(fasta_text, newick_text)
+    for name, distance_to_father in branch_lengths.items():
+        reference_tree.all_nodes[name].distance_to_father = distance_to_father
+    reference_tree.set_vars()
+    reference_tree.calculate_tree()
+
+    assert np.isclose(log_likelihood, reference_tree.log_likelihood, rtol=1e-12, atol=0)
+    assert np.allclose(gloome_tree.log_likelihood_vector, reference_tree.log_likelihood_vector, rtol=1e-12, atol=0)
+
+    compiled_tree, reference_compiled_tree = gloome_tree.compiled_tree, reference_tree.compiled_tree
+    # the nodes off the changed paths have stale down vectors until they are read
+    assert not np.all(compiled_tree.down_valid)
+    for current_node in gloome_tree.all_nodes_objects:
+        # the marginals depend on every branch: nothing is attached until the next marginal pass
+        assert current_node.probability_vector is None, current_node.name
+        i = compiled_tree.index[id(current_node)]
+        reference_i = reference_compiled_tree.index[id(reference_tree.all_nodes[current_node.name])]
+        for attribute_name in ('up_vector', 'down_vector'):
+            assert np.allclose(compiled_tree.get_node_unscaled_vector(attribute_name, i),
+                               reference_compiled_tree.get_node_unscaled_vector(attribute_name, reference_i),
+                               rtol=1e-12, atol=0), (current_node.name, attribute_name)
+    assert np.all(compiled_tree.down_valid)
+
+    gloome_tree.calculate_marginal()
+    for current_node in gloome_tree.all_nodes_objects:
+        assert np.allclose(current_node.probability_vector,
+                           reference_tree.all_nodes[current_node.name].probability_vector, rtol=0, atol=1e-12), \
+            current_node.name
+
+
+def main():
+    dirname = BIN_DIR
+    for n in (0, 1, 10):
+        msa_file = dirname.joinpath(f'gloome/data/initial_data/msa/patternMSA{n}.msa')
+        tree_file = dirname.joinpath(f'gloome/data/initial_data/tree/newickTree{n}.tree')
+        fasta_text = read_file(msa_file)
+        newick_text = read_file(tree_file)
+
+        # changed branches, updated on their paths to the root, must give the likelihood of a full pass
+        check_update(fasta_text, newick_text)
+        print(f'\tpatternMSA{n}: same log-likelihood, up and down vectors as a full pass after update_likelihood')
+
+
+main()